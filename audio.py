@@ -0,0 +1,271 @@
+"""PCM audio helpers for the TTS pipeline.
+
+Audio is handled as raw little-endian 16-bit mono PCM (what the TTS
+endpoints return for ``format="pcm"``); numpy is used for anything that
+touches individual samples.
+"""
+from typing import List, Tuple
+from functools import lru_cache
+from math import gcd
+import re
+
+import numpy as np
+
+
+# Bytes per sample of 16-bit PCM
+SAMPLE_WIDTH = 2
+
+# Rate the TTS pipeline produces audio at
+DEFAULT_SAMPLE_RATE = 24000
+
+# Sentence endings (kept with the sentence they end), including closing quotes
+_SENTENCE_END = re.compile(r"(?<=[。！？!?；;…\n])[”’\"')）]*")
+# Clause boundaries used when a single sentence is too long
+_CLAUSE_END = re.compile(r"(?<=[，,、：:])")
+
+
+def _to_samples(pcm: bytes) -> np.ndarray:
+    """View 16-bit PCM bytes as an int16 array (dropping a trailing odd byte)."""
+    return np.frombuffer(pcm[:len(pcm) - len(pcm) % SAMPLE_WIDTH], dtype="<i2")
+
+
+def pcm_duration_ms(pcm: bytes, sample_rate: int) -> int:
+    """Duration of 16-bit mono PCM in milliseconds."""
+    return int(len(pcm) / (sample_rate * SAMPLE_WIDTH) * 1000)
+
+
+def _split_keep(pattern: re.Pattern, text: str) -> List[str]:
+    """Split after each match of ``pattern``, keeping the delimiters."""
+    pieces, start = [], 0
+    for match in pattern.finditer(text):
+        if match.end() > start:
+            pieces.append(text[start:match.end()])
+            start = match.end()
+    pieces.append(text[start:])
+    return [piece for piece in pieces if piece.strip()]
+
+
+def split_sentences(text: str, max_chars: int) -> List[str]:
+    """Split text into TTS segments at Chinese/Western punctuation boundaries.
+
+    Sentences are packed greedily into segments of at most ``max_chars``
+    characters; a sentence longer than that is split at clause boundaries
+    (commas) and, failing that, hard-wrapped. Text that already fits (or
+    ``max_chars <= 0``) is returned as a single segment.
+    """
+    text = text.strip()
+    if not text:
+        return []
+    if max_chars <= 0 or len(text) <= max_chars:
+        return [text]
+
+    pieces: List[str] = []
+    for sentence in _split_keep(_SENTENCE_END, text):
+        if len(sentence) <= max_chars:
+            pieces.append(sentence)
+            continue
+        for clause in _split_keep(_CLAUSE_END, sentence):
+            pieces.extend(clause[i:i + max_chars] for i in range(0, len(clause), max_chars))
+
+    segments: List[str] = []
+    current = ""
+    for piece in pieces:
+        if current and len(current) + len(piece) > max_chars:
+            segments.append(current.strip())
+            current = ""
+        current += piece
+    if current.strip():
+        segments.append(current.strip())
+    return segments
+
+
+def stitch_pcm(segments: List[bytes], sample_rate: int, crossfade_ms: float = 0.0) -> bytes:
+    """Concatenate 16-bit PCM segments, crossfading across each boundary.
+
+    Each boundary overlaps the tail of one segment with the head of the next
+    for ``crossfade_ms`` (a linear fade), which hides clicks where separately
+    synthesized segments meet. The result is shorter than the plain
+    concatenation by one crossfade per boundary.
+    """
+    arrays = [_to_samples(segment) for segment in segments]
+    arrays = [array for array in arrays if array.size]
+    if not arrays:
+        return b""
+    if len(arrays) == 1:
+        return arrays[0].tobytes()
+
+    fade = int(sample_rate * crossfade_ms / 1000)
+    overlaps = [min(fade, len(a), len(b)) for a, b in zip(arrays, arrays[1:])]
+    out = np.empty(sum(len(a) for a in arrays) - sum(overlaps), dtype=np.float32)
+
+    position = 0
+    for i, array in enumerate(arrays):
+        head = overlaps[i - 1] if i > 0 else 0
+        if head:
+            # Mix this segment's head into the previous segment's tail
+            ramp = np.linspace(0.0, 1.0, head, dtype=np.float32)
+            out[position - head:position] = out[position - head:position] * (1.0 - ramp) + array[:head] * ramp
+        body = array[head:]
+        out[position:position + len(body)] = body
+        position += len(body)
+
+    return np.clip(np.rint(out), -32768, 32767).astype("<i2").tobytes()
+
+
+# Padding kept around detected speech so word onsets/decays aren't clipped
+TRIM_PAD_MS = 30.0
+# Frame length for energy measurement
+ENERGY_FRAME_MS = 10.0
+# Gain limits for loudness normalization
+MAX_GAIN_DB = 20.0
+PEAK_LIMIT = 0.95
+
+
+def _frame_energy_db(samples: np.ndarray, frame_len: int) -> np.ndarray:
+    """RMS level of each full frame in dBFS."""
+    frames = samples[:len(samples) - len(samples) % frame_len].reshape(-1, frame_len).astype(np.float32)
+    mean_square = np.mean(np.square(frames / 32768.0), axis=1)
+    return 10.0 * np.log10(np.maximum(mean_square, 1e-12))
+
+
+def speech_bounds(samples: np.ndarray, sample_rate: int, threshold_db: float) -> Tuple[int, int]:
+    """Sample range ``[start, end)`` spanning all frames louder than ``threshold_db``.
+
+    Returns ``(0, 0)`` when nothing crosses the threshold.
+    """
+    frame_len = max(int(sample_rate * ENERGY_FRAME_MS / 1000), 1)
+    active = np.flatnonzero(_frame_energy_db(samples, frame_len) > threshold_db)
+    if not active.size:
+        return 0, 0
+    pad = int(sample_rate * TRIM_PAD_MS / 1000)
+    start = max(int(active[0]) * frame_len - pad, 0)
+    end = min((int(active[-1]) + 1) * frame_len + pad, len(samples))
+    return start, end
+
+
+def loudness_gain(samples: np.ndarray, sample_rate: int, target_dbfs: float, threshold_db: float) -> float:
+    """Linear gain bringing the RMS of active frames to ``target_dbfs``.
+
+    The gain is capped at MAX_GAIN_DB and so that peaks stay below PEAK_LIMIT.
+    """
+    frame_len = max(int(sample_rate * ENERGY_FRAME_MS / 1000), 1)
+    energy_db = _frame_energy_db(samples, frame_len)
+    active = energy_db[energy_db > threshold_db]
+    if not active.size:
+        return 1.0
+    # Average power (not dB) over active frames
+    level_db = 10.0 * np.log10(np.mean(np.power(10.0, active / 10.0)))
+    gain = 10.0 ** (min(target_dbfs - level_db, MAX_GAIN_DB) / 20.0)
+    peak = np.max(np.abs(samples.astype(np.int32))) / 32768.0
+    if peak > 0:
+        gain = min(gain, PEAK_LIMIT / peak)
+    return float(gain)
+
+
+@lru_cache(maxsize=16)
+def _fade_ramp(length: int) -> np.ndarray:
+    """Raised-cosine fade-in ramp, cached per length."""
+    ramp = 0.5 - 0.5 * np.cos(np.linspace(0.0, np.pi, length, dtype=np.float32))
+    ramp.setflags(write=False)
+    return ramp
+
+
+def postprocess_pcm(
+    pcm: bytes,
+    sample_rate: int,
+    threshold_db: float = -45.0,
+    target_dbfs: float = -20.0,
+    fade_ms: float = 10.0,
+) -> Tuple[bytes, int]:
+    """Trim edge silence, normalize loudness and fade the edges of 16-bit PCM.
+
+    Args:
+        pcm: Mono 16-bit little-endian PCM
+        sample_rate: Sample rate in Hz
+        threshold_db: Frames quieter than this (dBFS RMS) count as silence
+        target_dbfs: Target RMS level of the speech, in dBFS
+        fade_ms: Length of the fade-in/fade-out applied at the item edges
+
+    Returns:
+        Tuple of (processed PCM, samples trimmed from the start)
+    """
+    samples = _to_samples(pcm)
+    start, end = speech_bounds(samples, sample_rate, threshold_db)
+    if end <= start:
+        return pcm, 0  # Nothing but silence; leave it alone
+
+    samples = samples[start:end]
+    out = samples.astype(np.float32) * loudness_gain(samples, sample_rate, target_dbfs, threshold_db)
+
+    fade = min(int(sample_rate * fade_ms / 1000), len(out) // 2)
+    if fade:
+        ramp = _fade_ramp(fade)
+        out[:fade] *= ramp
+        out[-fade:] *= ramp[::-1]
+
+    return np.clip(np.rint(out), -32768, 32767).astype("<i2").tobytes(), start
+
+
+# Output rates clients may request on /ws/stream
+SUPPORTED_SAMPLE_RATES = (8000, 16000, 22050, 24000, 44100, 48000)
+
+# Zero crossings of the windowed-sinc filter on each side of its center
+RESAMPLE_HALF_TAPS = 16
+RESAMPLE_KAISER_BETA = 8.6
+
+
+@lru_cache(maxsize=16)
+def _polyphase_bank(up: int, down: int) -> np.ndarray:
+    """Anti-aliasing filter for ``up/down`` resampling, split into ``up`` phases.
+
+    Row ``p`` holds taps ``h[p], h[p + up], h[p + 2*up], ...`` of a Kaiser
+    windowed-sinc low-pass prototype, reversed so it can be applied with a
+    dot product against a window of consecutive input samples.
+    """
+    cutoff = 1.0 / max(up, down)  # Relative to the Nyquist rate of the upsampled signal
+    length = 2 * RESAMPLE_HALF_TAPS * max(up, down) + 1
+    center = (length - 1) / 2
+    n = np.arange(length)
+    prototype = cutoff * np.sinc(cutoff * (n - center)) * np.kaiser(length, RESAMPLE_KAISER_BETA) * up
+
+    taps = -(-length // up)  # ceil(length / up)
+    padded = np.zeros(taps * up)
+    padded[:length] = prototype
+    bank = padded.reshape(taps, up).T[:, ::-1].astype(np.float32)
+    bank.setflags(write=False)
+    return bank
+
+
+def resample_pcm(pcm: bytes, from_rate: int, to_rate: int) -> bytes:
+    """Resample 16-bit mono PCM with a polyphase windowed-sinc filter.
+
+    Only the output samples are computed: each one is a dot product between
+    one filter phase and a window of input samples, evaluated for all
+    outputs sharing a phase at once.
+    """
+    if from_rate == to_rate:
+        return pcm
+    samples = _to_samples(pcm)
+    if not samples.size:
+        return b""
+
+    divisor = gcd(from_rate, to_rate)
+    up, down = to_rate // divisor, from_rate // divisor
+    bank = _polyphase_bank(up, down)
+    taps = bank.shape[1]
+    center = RESAMPLE_HALF_TAPS * max(up, down)
+
+    # windows[i] ends at input sample i (zero padded at both ends)
+    padded = np.concatenate([np.zeros(taps - 1, np.float32), samples.astype(np.float32), np.zeros(taps, np.float32)])
+    windows = np.lib.stride_tricks.sliding_window_view(padded, taps)
+
+    num_out = -(-len(samples) * up // down)
+    positions = np.arange(num_out, dtype=np.int64) * down + center
+    phases, bases = positions % up, positions // up
+
+    out = np.empty(num_out, dtype=np.float32)
+    for phase in np.unique(phases):
+        selected = np.flatnonzero(phases == phase)
+        out[selected] = windows[bases[selected]] @ bank[phase]
+
+    return np.clip(np.rint(out), -32768, 32767).astype("<i2").tobytes()
@@ -0,0 +1,387 @@
+"""Replay a traffic capture against a local server for regression comparison.
+
+A capture (see capture.py, enabled with ``CAPTURE_PATH``) holds the
+timestamped API calls, WebSocket sessions and upstream call latencies of a
+production run. This tool starts the app in-process on a free local port,
+with every LLM and TTS provider replaced by a ``RecordedProvider`` stub
+that reproduces that provider's recorded latencies and failures (in the
+recorded order, with local synthetic output), then:
+
+- sends each recorded API call at its recorded offset (``/api/jobs/<id>``
+  paths are mapped to the jobs started by the replayed calls, in order,
+  and wait for the start_stream call that starts their job to return)
+- opens each recorded ``/ws/stream`` session with its recorded query and
+  keeps it open (answering pings) until its recorded close
+
+``--speed`` compresses the arrival timeline (10 replays an hour in six
+minutes); upstream latencies are reproduced as recorded unless scaled with
+``--latency-scale``, and audio still plays out in real time.
+
+The report covers API latencies per route, time to first audio per
+session, upstream calls and pipeline counters (underruns, filler clips,
+dropped messages). Saved with ``--output``, it is the baseline a later run
+is compared against with ``--baseline``.
+
+Usage:
+    python benchmarks/replay_traffic.py capture.jsonl                   # replay at 1x
+    python benchmarks/replay_traffic.py capture.jsonl --speed 10        # 10x faster arrivals
+    python benchmarks/replay_traffic.py capture.jsonl --output before.json
+    python benchmarks/replay_traffic.py capture.jsonl --baseline before.json
+"""
+import argparse
+import asyncio
+import json
+import re
+import sys
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+# Add parent directory to path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+import httpx
+import uvicorn
+import websockets
+
+from config import settings
+from capture import Capture, load_captures
+from providers import ProviderRouter, RecordedProvider
+from metrics import metrics
+import main
+
+DEFAULT_TOLERANCE = 0.50  # Fail when a compared value is >50% worse than the baseline
+LATENCY_FLOOR_MS = 50.0  # Latency differences below this are noise
+WS_RECEIVE_POLL_SECONDS = 0.5
+
+JOB_PATH = re.compile(r"^/api/jobs/([^/]+)")
+
+
+def replay_router(upstream: str, capture: Capture, latency_scale: float = 1.0) -> ProviderRouter:
+    """A router over stubs of the providers ``upstream`` used in ``capture``.
+
+    Providers keep their recorded order and cost, so routing decisions
+    follow the recording; providers seen only in calls are appended.
+    """
+    calls = capture.upstream_calls().get(upstream, {})
+    configured = [(name, cost) for name, cost in capture.header.get("providers", {}).get(upstream, [])]
+    configured += [(name, None) for name in calls if name not in dict(configured)]
+    if not configured:
+        configured = [("local:replay", 0.0)]
+    recorded = [seconds for provider_calls in calls.values() for seconds, ok in provider_calls if ok]
+    default_seconds = sum(recorded) / len(recorded) if recorded else 0.0
+    return ProviderRouter(
+        upstream,
+        [
+            RecordedProvider(name, calls.get(name, []), cost, latency_scale, default_seconds)
+            for name, cost in configured
+        ],
+        error_penalty_seconds=settings.provider_error_penalty_seconds,
+        cost_weight_seconds=settings.provider_cost_weight_seconds,
+        eject_failures=settings.provider_eject_failures,
+        eject_seconds=settings.provider_eject_seconds,
+    )
+
+
+def _percentile(values: List[float], fraction: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    return round(ordered[min(int(fraction * len(ordered)), len(ordered) - 1)], 1)
+
+
+def _route(path: str) -> str:
+    return JOB_PATH.sub("/api/jobs/{job_id}", path)
+
+
+class Replayer:
+    """Drives a local server through one capture."""
+
+    def __init__(self, capture: Capture, speed: float = 1.0, latency_scale: float = 1.0):
+        self.capture = capture
+        self.speed = speed
+        self.latency_scale = latency_scale
+        self.api_results: Dict[str, List[Dict]] = {}
+        self.sessions: List[Dict] = []
+
+    def _at(self, offset: float) -> float:
+        """Wall clock (time.monotonic()) of a capture offset."""
+        return self._start + offset / self.speed
+
+    async def _sleep_until(self, offset: float) -> None:
+        delay = self._at(offset) - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    @staticmethod
+    def _job_futures(events: List[Dict]) -> Tuple[Dict[int, asyncio.Future], Dict[int, asyncio.Future]]:
+        """Futures linking job paths to the replayed start_stream calls that start their jobs.
+
+        Returns the future each start_stream call resolves with its replayed
+        job id, and the future each ``/api/jobs/<id>`` call waits for. Recorded
+        job ids are matched, in order of first appearance, to the
+        start_stream calls that came before them in the capture.
+        """
+        starts: Dict[int, asyncio.Future] = {}
+        jobs: Dict[int, asyncio.Future] = {}
+        loop = asyncio.get_running_loop()
+        pending: List[asyncio.Future] = []  # Started jobs no recorded id has been matched to yet
+        matched: Dict[str, asyncio.Future] = {}
+        for index, event in enumerate(events):
+            if event["p"] == "/api/start_stream":
+                starts[index] = loop.create_future()
+                pending.append(starts[index])
+                continue
+            match = JOB_PATH.match(event["p"])
+            if match is None:
+                continue
+            recorded = match.group(1)
+            if recorded not in matched and pending:
+                matched[recorded] = pending.pop(0)
+            if recorded in matched:
+                jobs[index] = matched[recorded]
+        return starts, jobs
+
+    async def _api_call(
+        self,
+        client: httpx.AsyncClient,
+        event: Dict,
+        starts_job: Optional[asyncio.Future] = None,
+        job: Optional[asyncio.Future] = None,
+    ) -> None:
+        """Send one recorded call.
+
+        Args:
+            starts_job: Resolved with the replayed job id (None on failure) of a start_stream call
+            job: Replayed job id to substitute into a ``/api/jobs/<id>`` path
+        """
+        job_id = None
+        try:
+            await self._sleep_until(event["t"])
+            path = event["p"]
+            if job is not None:
+                replayed = await job  # Its start_stream call may still be in flight
+                if replayed:
+                    path = path.replace(JOB_PATH.match(path).group(1), replayed, 1)
+            url = path + (f"?{event['q']}" if event.get("q") else "")
+            body = event.get("b")
+            started = time.monotonic()
+            try:
+                response = await client.request(
+                    event["m"], url,
+                    content=body.encode("utf-8") if body else None,
+                    headers={"Content-Type": "application/json"} if body else None,
+                )
+                status = response.status_code
+                if starts_job is not None and status < 300:
+                    job_id = response.json().get("job_id")
+            except httpx.HTTPError as e:
+                print(f"   ⚠️ {event['m']} {path} failed: {e}")
+                status = 0
+        finally:
+            if starts_job is not None:
+                starts_job.set_result(job_id)  # Never leave its job paths waiting
+        self.api_results.setdefault(f"{event['m']} {_route(event['p'])}", []).append({
+            "ms": (time.monotonic() - started) * 1000,
+            "status": status,
+            "recorded_status": event.get("s"),
+        })
+
+    async def _session(self, base_ws: str, event: Dict, close_at: float) -> None:
+        await self._sleep_until(event["t"])
+        url = f"{base_ws}/ws/stream" + (f"?{event['q']}" if event.get("q") else "")
+        deadline = self._at(close_at)
+        opened = time.monotonic()
+        session = {"messages": 0, "bytes": 0, "first_audio_ms": None, "failed": False}
+        self.sessions.append(session)
+        try:
+            async with websockets.connect(url, max_size=None) as ws:
+                while time.monotonic() < deadline:
+                    try:
+                        message = await asyncio.wait_for(
+                            ws.recv(), min(WS_RECEIVE_POLL_SECONDS, max(deadline - time.monotonic(), 0.01)),
+                        )
+                    except asyncio.TimeoutError:
+                        continue
+                    session["messages"] += 1
+                    session["bytes"] += len(message)
+                    if isinstance(message, str):
+                        kind = json.loads(message).get("type")
+                        if kind == "ping":
+                            await ws.send(json.dumps({"type": "pong"}))
+                        is_audio = kind == "audio_chunk"
+                    else:
+                        is_audio = True  # Binary frames carry audio
+                    if is_audio and session["first_audio_ms"] is None:
+                        session["first_audio_ms"] = (time.monotonic() - opened) * 1000
+        except Exception as e:
+            print(f"   ⚠️ Session {event.get('id')} failed: {e}")
+            session["failed"] = True
+
+    async def run(self, port: int = 0) -> Dict:
+        """Replay the capture and return the report."""
+        original = (settings.capture_path, main.ai_service.llm, main.ai_service.tts)
+        settings.capture_path = ""  # Don't record the replay itself
+        main.ai_service.llm = replay_router("llm", self.capture, self.latency_scale)
+        main.ai_service.tts = replay_router("tts", self.capture, self.latency_scale)
+        baseline_counters = self._counters()
+        try:
+            wall_seconds = await self._serve_and_drive(port)
+            counters = self._counters()
+            return self._report(wall_seconds, {name: counters[name] - baseline_counters[name] for name in counters})
+        finally:
+            settings.capture_path, main.ai_service.llm, main.ai_service.tts = original
+
+    async def _serve_and_drive(self, port: int) -> float:
+        """Run the server and send the capture's traffic; returns the wall time taken."""
+        server = uvicorn.Server(uvicorn.Config(main.app, host="127.0.0.1", port=port, log_level="warning"))
+        serving = asyncio.create_task(server.serve())
+        while not server.started:
+            if serving.done():
+                serving.result()  # Raise the startup error
+            await asyncio.sleep(0.01)
+        port = server.servers[0].sockets[0].getsockname()[1]
+
+        closes = {event["id"]: event["t"] for event in self.capture.of_kind("ws_close")}
+        end = self.capture.duration
+        self._start = time.monotonic()
+        try:
+            async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", timeout=None) as client:
+                tasks = []
+                api_events = self.capture.of_kind("api")
+                starts, jobs = self._job_futures(api_events)
+                for index, event in enumerate(api_events):
+                    tasks.append(asyncio.create_task(
+                        self._api_call(client, event, starts.get(index), jobs.get(index))
+                    ))
+                for event in self.capture.of_kind("ws_open"):
+                    close_at = closes.get(event["id"], end)
+                    tasks.append(asyncio.create_task(self._session(f"ws://127.0.0.1:{port}", event, close_at)))
+                await asyncio.gather(*tasks)
+            return time.monotonic() - self._start
+        finally:
+            server.should_exit = True
+            await serving
+
+    @staticmethod
+    def _counters() -> Dict[str, float]:
+        return {
+            "underruns": metrics.underruns.get(),
+            "filler_clips": metrics.filler_clips_played.get(),
+            "ws_messages_dropped": metrics.ws_messages_dropped.get(),
+            "replayed_items": metrics.replayed_items.get(),
+            "tts_failures_skipped": metrics.tts_failures_skipped.get(),
+        }
+
+    def _report(self, wall_seconds: float, counters: Dict[str, float]) -> Dict:
+        first_audio = [s["first_audio_ms"] for s in self.sessions if s["first_audio_ms"] is not None]
+        recorded_calls = self.capture.upstream_calls()
+        return {
+            "capture": {
+                "started": self.capture.header.get("started"),
+                "duration_seconds": round(self.capture.duration, 3),
+                "events": len(self.capture.events),
+            },
+            "speed": self.speed,
+            "latency_scale": self.latency_scale,
+            "wall_seconds": round(wall_seconds, 3),
+            "api": {
+                route: {
+                    "count": len(results),
+                    "p50_ms": _percentile([r["ms"] for r in results], 0.5),
+                    "p95_ms": _percentile([r["ms"] for r in results], 0.95),
+                    "status_mismatches": sum(1 for r in results if r["status"] != r["recorded_status"]),
+                }
+                for route, results in sorted(self.api_results.items())
+            },
+            "ws": {
+                "sessions": len(self.sessions),
+                "failed": sum(1 for s in self.sessions if s["failed"]),
+                "without_audio": sum(1 for s in self.sessions if s["first_audio_ms"] is None),
+                "messages": sum(s["messages"] for s in self.sessions),
+                "bytes": sum(s["bytes"] for s in self.sessions),
+                "first_audio_p50_ms": _percentile(first_audio, 0.5),
+                "first_audio_p95_ms": _percentile(first_audio, 0.95),
+            },
+            "upstream": {
+                upstream: {
+                    "recorded_calls": sum(len(calls) for calls in recorded_calls.get(upstream, {}).values()),
+                    "replayed_calls": sum(provider.replayed for provider in router.providers),
+                }
+                for upstream, router in (("llm", main.ai_service.llm), ("tts", main.ai_service.tts))
+            },
+            "pipeline": {name: int(value) for name, value in counters.items()},
+        }
+
+
+def compared_values(report: Dict) -> Dict[str, float]:
+    """The lower-is-better values compared between runs."""
+    values = {}
+    for route, stats in report["api"].items():
+        if stats["p95_ms"] is not None:
+            values[f"{route} p95_ms"] = stats["p95_ms"]
+    if report["ws"]["first_audio_p95_ms"] is not None:
+        values["ws first_audio_p95_ms"] = report["ws"]["first_audio_p95_ms"]
+    values["ws without_audio"] = report["ws"]["without_audio"]
+    for name, value in report["pipeline"].items():
+        values[name] = value
+    return values
+
+
+def compare(current: Dict, baseline: Dict, tolerance: float) -> List[str]:
+    """Print current vs baseline values and return the regressed ones."""
+    regressions = []
+    current_values, baseline_values = compared_values(current), compared_values(baseline)
+    print(f"\n{'value':<48} {'current':>10} {'baseline':>10}")
+    print("-" * 70)
+    for name, value in current_values.items():
+        base = baseline_values.get(name)
+        if base is None:
+            print(f"{name:<48} {value:>10} {'-':>10}  (new)")
+            continue
+        floor = LATENCY_FLOOR_MS if name.endswith("_ms") else 0
+        regressed = value > base * (1 + tolerance) and value - base > floor
+        print(f"{name:<48} {value:>10} {base:>10}  {'❌ REGRESSION' if regressed else ''}")
+        if regressed:
+            regressions.append(name)
+    return regressions
+
+
+def main_cli() -> int:
+    parser = argparse.ArgumentParser(description="Replay a traffic capture against a local server")
+    parser.add_argument("capture", help="Capture file written with CAPTURE_PATH")
+    parser.add_argument("--index", type=int, default=-1, help="Capture to replay when the file holds several (default: last)")
+    parser.add_argument("--speed", type=float, default=1.0, help="Arrival timeline speed-up (default: 1)")
+    parser.add_argument("--latency-scale", type=float, default=1.0, help="Factor applied to recorded upstream latencies")
+    parser.add_argument("--port", type=int, default=0, help="Local port (default: any free port)")
+    parser.add_argument("--output", help="Write the report to this file")
+    parser.add_argument("--baseline", help="Compare with a report written by an earlier run")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE,
+                        help=f"Allowed worsening ratio before failing (default: {DEFAULT_TOLERANCE})")
+    args = parser.parse_args()
+
+    captures = load_captures(args.capture)
+    if not captures:
+        print(f"❌ No capture found in {args.capture}")
+        return 1
+    capture = captures[args.index]
+    print(f"🎬 Replaying {len(capture.events)} events ({capture.duration:.1f}s) at {args.speed}x")
+
+    report = asyncio.run(Replayer(capture, args.speed, args.latency_scale).run(args.port))
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+    if args.output:
+        Path(args.output).write_text(json.dumps(report, indent=2, ensure_ascii=False, sort_keys=True) + "\n")
+        print(f"\n💾 Report written to {args.output}")
+
+    if args.baseline:
+        baseline = json.loads(Path(args.baseline).read_text())
+        regressions = compare(report, baseline, args.tolerance)
+        if regressions:
+            print(f"\n❌ {len(regressions)} value(s) regressed by more than {args.tolerance:.0%}: {', '.join(regressions)}")
+            return 1
+        print(f"\n✅ All values within {args.tolerance:.0%} of baseline")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main_cli())
@@ -0,0 +1,228 @@
+"""Fan-out of the shared playout to /ws/stream clients.
+
+A single playout loop (``main.playout_loop``) decides what airs and when;
+the broadcaster hands each of its messages to every connected client. Each
+client has its own bounded outbound queue drained by its own writer task,
+so a slow or half-dead client only ever delays itself: when its queue is
+full the oldest message is dropped and the client skips ahead towards live.
+Nothing is pushed back onto the shared playlist, so the order content airs
+in is the same for everyone.
+
+Clients are sent ``{"type": "ping"}`` every ``ws_ping_interval_seconds``
+and answer with ``{"type": "pong"}`` (any message counts). A client that
+stays silent for ``ws_ping_timeout_seconds``, or whose send stalls for
+``ws_send_timeout_seconds``, is disconnected.
+
+Audio messages are encoded once per (sample rate, wire format) and the same
+payload object is queued for every client that needs it. Clients choose
+the wire format with ``?format=``:
+
+- ``json`` (default): text frames, PCM hex-encoded in ``audio_data``
+- ``binary``: audio messages as binary frames (see ``encode_audio``);
+  every other message is still JSON text
+"""
+from collections import deque
+from typing import Callable, Deque, Dict, Optional, Set, Tuple, Union
+from loguru import logger
+import asyncio
+import json
+import struct
+import time
+
+from metrics import metrics
+
+
+# Reasons a client connection ended (label of ai_streamer_ws_disconnects_total)
+DISCONNECTED = "disconnected"
+SEND_TIMEOUT = "send_timeout"
+HEARTBEAT_TIMEOUT = "heartbeat_timeout"
+
+# Wire formats a client can ask for with ?format=
+FORMAT_JSON = "json"
+FORMAT_BINARY = "binary"
+WIRE_FORMATS = (FORMAT_JSON, FORMAT_BINARY)
+
+# A payload ready to send: str goes out as a text frame, bytes as a binary frame
+Payload = Union[str, bytes]
+
+
+def serialize_message(message: Dict) -> str:
+    """Serialize a message the same way ``WebSocket.send_json`` does."""
+    return json.dumps(message, separators=(",", ":"), ensure_ascii=False)
+
+
+def encode_audio(header: Dict, pcm: Union[bytes, memoryview], wire_format: str = FORMAT_JSON) -> Payload:
+    """Encode an audio message from its fields and PCM.
+
+    JSON puts the hex-encoded PCM in ``audio_data``. Binary is a 4-byte
+    big-endian header length, the header as UTF-8 JSON, then the raw PCM,
+    which is half the size and needs no hex decoding.
+    """
+    if wire_format == FORMAT_BINARY:
+        encoded = serialize_message(header).encode("utf-8")
+        return b"".join((struct.pack(">I", len(encoded)), encoded, pcm))
+    return serialize_message({**header, "audio_data": pcm.hex()})
+
+
+class ClientConnection:
+    """One /ws/stream client: its bounded send queue, writer and heartbeat.
+
+    Args:
+        websocket: Accepted WebSocket
+        client_id: Label for logs
+        sample_rate: Requested output rate (None: as synthesized)
+        wire_format: FORMAT_JSON or FORMAT_BINARY
+        max_queue: Messages queued before the oldest is dropped
+        send_timeout: Seconds a single send may take before the peer is considered dead
+        ping_interval: Seconds between heartbeat pings
+        ping_timeout: Seconds without any message from the client before it is considered dead
+    """
+
+    def __init__(
+        self,
+        websocket,
+        client_id: str,
+        sample_rate: Optional[int] = None,
+        wire_format: str = FORMAT_JSON,
+        max_queue: int = 16,
+        send_timeout: float = 10.0,
+        ping_interval: float = 15.0,
+        ping_timeout: float = 45.0,
+    ):
+        self.websocket = websocket
+        self.client_id = client_id
+        self.sample_rate = sample_rate
+        self.wire_format = wire_format
+        self.max_queue = max_queue
+        self.send_timeout = send_timeout
+        self.ping_interval = ping_interval
+        self.ping_timeout = ping_timeout
+        self.last_seen = time.monotonic()
+        self.dropped = 0  # Messages dropped because the queue was full
+        self._queue: Deque[Payload] = deque()
+        self._ready = asyncio.Event()
+
+    def __len__(self) -> int:
+        return len(self._queue)
+
+    def send(self, payload: Payload) -> bool:
+        """Queue an encoded message without blocking.
+
+        Returns:
+            False if the queue was full and its oldest message was dropped
+        """
+        full = len(self._queue) >= self.max_queue
+        if full:
+            self._queue.popleft()
+            self.dropped += 1
+            metrics.ws_messages_dropped.inc()
+        self._queue.append(payload)
+        self._ready.set()
+        return not full
+
+    async def run(self) -> str:
+        """Serve the client until it disconnects or is found dead.
+
+        Returns:
+            Why the connection ended (DISCONNECTED, SEND_TIMEOUT or HEARTBEAT_TIMEOUT)
+        """
+        tasks = [
+            asyncio.create_task(self._write_loop(), name="ws_writer"),
+            asyncio.create_task(self._read_loop(), name="ws_reader"),
+            asyncio.create_task(self._heartbeat_loop(), name="ws_heartbeat"),
+        ]
+        try:
+            done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            for task in tasks:
+                task.cancel()
+        reason = next(iter(done)).result()
+        metrics.ws_disconnects.inc(reason=reason)
+        if self.dropped:
+            logger.warning(f"⚠️ Client {self.client_id} fell behind, {self.dropped} messages dropped")
+        return reason
+
+    async def _write_loop(self) -> str:
+        while True:
+            while not self._queue:
+                self._ready.clear()
+                await self._ready.wait()
+            payload = self._queue.popleft()
+            send = self.websocket.send_bytes if isinstance(payload, bytes) else self.websocket.send_text
+            try:
+                await asyncio.wait_for(send(payload), timeout=self.send_timeout)
+            except asyncio.TimeoutError:
+                logger.warning(f"⚠️ Send to {self.client_id} stalled for {self.send_timeout}s, dropping client")
+                return SEND_TIMEOUT
+            except Exception as e:
+                logger.debug(f"🔌 Send to {self.client_id} failed: {e}")
+                return DISCONNECTED
+            # Hex audio dominates text payloads, so avoid re-encoding pure ASCII text
+            if isinstance(payload, str) and not payload.isascii():
+                metrics.bytes_sent.inc(len(payload.encode("utf-8")))
+            else:
+                metrics.bytes_sent.inc(len(payload))
+
+    async def _read_loop(self) -> str:
+        while True:
+            try:
+                message = await self.websocket.receive()
+            except Exception as e:
+                logger.debug(f"🔌 Receive from {self.client_id} failed: {e}")
+                return DISCONNECTED
+            if message["type"] == "websocket.disconnect":
+                return DISCONNECTED
+            self.last_seen = time.monotonic()  # Pongs and any other message show the peer is alive
+
+    async def _heartbeat_loop(self) -> str:
+        while True:
+            await asyncio.sleep(self.ping_interval)
+            silent = time.monotonic() - self.last_seen
+            if silent > self.ping_timeout:
+                logger.warning(f"⚠️ No reply from {self.client_id} for {silent:.1f}s, dropping client")
+                return HEARTBEAT_TIMEOUT
+            self.send(serialize_message({"type": "ping", "timestamp": time.time()}))
+
+
+class Broadcaster:
+    """The set of connected clients and fan-out of messages to them."""
+
+    def __init__(self):
+        self.clients: Set[ClientConnection] = set()
+
+    def add(self, client: ClientConnection) -> None:
+        self.clients.add(client)
+
+    def remove(self, client: ClientConnection) -> None:
+        self.clients.discard(client)
+
+    def sample_rates(self) -> Set[Optional[int]]:
+        """Distinct output rates requested by connected clients."""
+        return {client.sample_rate for client in self.clients}
+
+    def wire_keys(self) -> Set[Tuple[Optional[int], str]]:
+        """Distinct (sample rate, wire format) pairs of connected clients."""
+        return {(client.sample_rate, client.wire_format) for client in self.clients}
+
+    def publish(self, build: Callable[[Optional[int], str], Payload]) -> int:
+        """Queue a message for every client without waiting for any of them.
+
+        ``build(sample_rate, wire_format)`` returns the encoded payload and is
+        called once per distinct pair; clients sharing a pair are queued the
+        same object, so fan-out costs no further encoding.
+
+        Returns:
+            Bytes of the distinct payloads
+        """
+        payloads: Dict[Tuple[Optional[int], str], Payload] = {}
+        for client in self.clients:
+            key = (client.sample_rate, client.wire_format)
+            payload = payloads.get(key)
+            if payload is None:
+                payload = payloads[key] = build(*key)
+            client.send(payload)
+        return sum(len(payload) for payload in payloads.values())
+
+
+# Global broadcaster instance
+broadcaster = Broadcaster()
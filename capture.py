@@ -0,0 +1,250 @@
+"""Traffic capture for reproducing production load.
+
+Performance problems in production depend on how requests arrive: topic
+changes, viewers connecting and leaving, and how slow the upstreams are at
+the time. With ``capture_path`` set, the server appends one compact JSON
+line per event to that file (``t`` is seconds since the capture started):
+
+- ``{"k": "capture", "v": 1, "started": "<iso time>", "providers": {...}}``
+  opens each capture; ``providers`` lists each upstream's providers and costs
+- ``{"t", "k": "api", "m": method, "p": path, "q": query, "b": body, "s": status, "d": seconds}``
+  for every ``/api/`` request
+- ``{"t", "k": "ws_open", "id": session, "q": query}`` and
+  ``{"t", "k": "ws_close", "id": session}`` for every ``/ws/stream`` session
+- ``{"t", "k": "up", "u": "llm"|"tts", "p": provider, "d": seconds, "ok": 0|1}``
+  for every upstream provider call
+
+Lines are written by a background thread, so recording never blocks the
+event loop; when the queue is full new events are dropped and counted.
+
+``benchmarks/replay_traffic.py`` replays a capture against a local server
+whose providers are ``providers.RecordedProvider`` stubs: each sleeps for
+the latencies recorded for its provider, in order, fails where the
+recorded call failed, and returns local synthetic output.
+"""
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+from loguru import logger
+import itertools
+import json
+import queue
+import threading
+import time
+
+from config import settings
+
+
+CAPTURE_VERSION = 1
+
+# Request bodies longer than this are truncated in the capture
+MAX_BODY_BYTES = 65536
+
+
+class TrafficRecorder:
+    """Appends capture events to a file from a background thread.
+
+    Args:
+        max_queue: Events buffered for the writer before new ones are dropped
+        clock: Time source for event offsets (for tests)
+    """
+
+    def __init__(self, max_queue: int = 10000, clock=time.monotonic):
+        self.max_queue = max_queue
+        self.clock = clock
+        self.path: Optional[str] = None
+        self.dropped_events = 0
+        self._started = 0.0
+        self._sessions = itertools.count(1)
+        self._queue: "queue.Queue[Optional[Tuple[str, Dict]]]" = queue.Queue(maxsize=max_queue)
+        self._worker: Optional[threading.Thread] = None
+
+    @property
+    def active(self) -> bool:
+        return self.path is not None
+
+    def start(self, path: str, **header: Any) -> None:
+        """Start appending events to ``path`` (stops a running capture first).
+
+        ``header`` fields are added to the line opening the capture.
+        """
+        self.stop()
+        self.path = path
+        self._started = self.clock()
+        self._worker = threading.Thread(target=self._run_worker, name="traffic-capture", daemon=True)
+        self._worker.start()
+        self._queue.put((path, {"k": "capture", "v": CAPTURE_VERSION, "started": datetime.now().isoformat(), **header}))
+        logger.info(f"🎙️ Capturing traffic to {path}")
+
+    def stop(self, timeout: float = 5.0) -> None:
+        """Flush buffered events and stop the writer thread."""
+        worker = self._worker
+        if worker is None:
+            return
+        self.path = None
+        self._worker = None
+        self._queue.put(None)
+        worker.join(timeout)
+
+    def new_session_id(self) -> int:
+        return next(self._sessions)
+
+    def record(self, kind: str, at: Optional[float] = None, **fields: Any) -> None:
+        """Queue one event that happened at clock time ``at`` (now by default).
+
+        A no-op while not capturing.
+        """
+        path = self.path
+        if path is None:
+            return
+        at = self.clock() if at is None else at
+        event = {"t": round(at - self._started, 4), "k": kind}
+        event.update(fields)
+        try:
+            self._queue.put_nowait((path, event))
+        except queue.Full:
+            self.dropped_events += 1
+
+    def _run_worker(self) -> None:
+        while True:
+            entry = self._queue.get()
+            if entry is None:
+                return
+            path, event = entry
+            lines = [json.dumps(event, ensure_ascii=False, separators=(",", ":"))]
+            stop = False
+            while True:
+                try:
+                    entry = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if entry is None:
+                    stop = True
+                    break
+                lines.append(json.dumps(entry[1], ensure_ascii=False, separators=(",", ":")))
+            try:
+                with open(path, "a", encoding="utf-8") as f:
+                    f.write("\n".join(lines) + "\n")
+            except OSError as e:
+                logger.warning(f"⚠️ Failed to write {len(lines)} capture events: {e}")
+            if stop:
+                return
+
+
+class CaptureMiddleware:
+    """ASGI middleware recording ``/api/`` requests and ``/ws/stream`` sessions."""
+
+    def __init__(self, app, recorder: Optional[TrafficRecorder] = None):
+        self.app = app
+        self.recorder = recorder or traffic_recorder
+
+    async def __call__(self, scope, receive, send):
+        recorder = self.recorder
+        if not recorder.active:
+            await self.app(scope, receive, send)
+        elif scope["type"] == "http" and scope["path"].startswith("/api/"):
+            await self._capture_request(scope, receive, send)
+        elif scope["type"] == "websocket" and scope["path"] == "/ws/stream":
+            await self._capture_session(scope, receive, send)
+        else:
+            await self.app(scope, receive, send)
+
+    async def _capture_request(self, scope, receive, send):
+        started = self.recorder.clock()
+        body = bytearray()
+        status = 500
+
+        async def receive_body():
+            message = await receive()
+            if message["type"] == "http.request" and len(body) < MAX_BODY_BYTES:
+                body.extend(message.get("body", b"")[:MAX_BODY_BYTES - len(body)])
+            return message
+
+        async def send_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive_body, send_status)
+        finally:
+            event = {
+                "m": scope["method"],
+                "p": scope["path"],
+                "s": status,
+                "d": round(self.recorder.clock() - started, 4),
+            }
+            if scope.get("query_string"):
+                event["q"] = scope["query_string"].decode("latin-1")
+            if body:
+                event["b"] = body.decode("utf-8", errors="replace")
+            # Stamped with the arrival time; lines are in completion order
+            self.recorder.record("api", at=started, **event)
+
+    async def _capture_session(self, scope, receive, send):
+        session = self.recorder.new_session_id()
+        opened = False
+
+        async def send_accept(message):
+            nonlocal opened
+            if message["type"] == "websocket.accept" and not opened:
+                opened = True
+                event = {"id": session}
+                if scope.get("query_string"):
+                    event["q"] = scope["query_string"].decode("latin-1")
+                self.recorder.record("ws_open", **event)
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_accept)
+        finally:
+            if opened:
+                self.recorder.record("ws_close", id=session)
+
+
+class Capture:
+    """One recorded capture: its header line and events ordered by time."""
+
+    def __init__(self, header: Dict[str, Any], events: List[Dict[str, Any]]):
+        self.header = header
+        self.events = sorted(events, key=lambda event: event["t"])
+
+    @property
+    def duration(self) -> float:
+        return self.events[-1]["t"] if self.events else 0.0
+
+    def of_kind(self, *kinds: str) -> List[Dict[str, Any]]:
+        return [event for event in self.events if event["k"] in kinds]
+
+    def upstream_calls(self) -> Dict[str, Dict[str, List[Tuple[float, bool]]]]:
+        """Recorded ``(seconds, ok)`` calls per upstream and provider, in order."""
+        calls: Dict[str, Dict[str, List[Tuple[float, bool]]]] = {}
+        for event in self.of_kind("up"):
+            calls.setdefault(event["u"], {}).setdefault(event["p"], []).append((event["d"], bool(event["ok"])))
+        return calls
+
+
+def load_captures(path: str) -> List[Capture]:
+    """Read every capture appended to ``path``; unreadable lines are skipped."""
+    captures: List[Capture] = []
+    header: Optional[Dict[str, Any]] = None
+    events: List[Dict[str, Any]] = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                event = json.loads(line)
+            except ValueError:
+                continue  # A line cut off by a crash
+            if event.get("k") == "capture":
+                if header is not None:
+                    captures.append(Capture(header, events))
+                header, events = event, []
+            elif header is not None:
+                events.append(event)
+    if header is not None:
+        captures.append(Capture(header, events))
+    return captures
+
+
+# Global recorder instance
+traffic_recorder = TrafficRecorder(max_queue=settings.capture_max_queue)
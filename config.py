@@ -19,8 +19,100 @@ class Settings(BaseSettings):
     port: int = 8000
     debug: bool = False
     
-    # Logging
+    # Admin endpoints (/admin/*); when unset they only accept localhost clients
+    admin_token: Optional[str] = None
+    profile_max_seconds: float = 60.0  # Longest /admin/profile run
+    
+    # Worker threads for blocking DashScope SDK/HTTP calls
+    ai_executor_workers: int = 8
+    
+    # Upstream providers (see providers.py): comma-separated name[:model][=cost], e.g. "dashscope:qwen-turbo,dashscope:qwen-plus=4"
+    llm_providers: str = "dashscope"  # dashscope or local (offline template scripts)
+    tts_providers: str = "dashscope"  # dashscope or local (offline synthetic speech)
+    provider_error_penalty_seconds: float = 10.0  # Score added per unit of rolling error rate
+    provider_cost_weight_seconds: float = 1.0  # Score added per unit of provider cost
+    provider_eject_failures: int = 3  # Consecutive failures before a provider is tried last
+    provider_eject_seconds: float = 30.0
+    
+    # Script reservoir: scripts are generated in large JSON batches and drawn in spec order
+    script_batch_size: int = 50  # Scripts requested per LLM call
+    script_low_watermark: int = 10  # Generate the next batch when fewer scripts remain
+    llm_cache_ttl_seconds: float = 1800.0  # Cached script batches are regenerated after this
+    llm_cache_max_entries: int = 128
+    llm_cache_variants: int = 3  # Prompt styles rotated per topic (see ai_service.SCRIPT_STYLES)
+    
+    # TTS segmentation: long scripts are split at sentence boundaries and synthesized in parallel
+    tts_segment_max_chars: int = 50  # 0 sends each script as a single request
+    tts_crossfade_ms: float = 20.0  # Crossfade where synthesized segments are joined
+    
+    # ffmpeg decoding of compressed TTS responses (MP3, AAC, ...)
+    ffmpeg_path: str = "ffmpeg"
+    ffmpeg_max_workers: int = 4  # Concurrent ffmpeg processes
+    ffmpeg_timeout_seconds: float = 30.0
+    
+    # Streaming download of TTS audio URLs (qwen3-tts-flash returns output.audio.url)
+    download_max_concurrent: int = 4  # Concurrent downloads (pooled keep-alive connections)
+    download_timeout_seconds: float = 30.0
+    download_max_bytes: int = 20_000_000  # Larger audio bodies are rejected
+    stream_early_forward_seconds: float = 5.0  # Air items while downloading when less audio is queued (0 disables)
+    stream_chunk_ms: int = 500  # Minimum audio per message for items still downloading
+    
+    # Playlist budget: producers wait while this much is queued (0 disables either limit)
+    playlist_max_bytes: int = 64_000_000  # Queued audio, variants and visemes
+    playlist_max_seconds: float = 600.0
+    
+    # Per-client WebSocket delivery (see broadcaster.py)
+    ws_send_queue_size: int = 16  # Messages queued per client before the oldest is dropped
+    ws_send_timeout_seconds: float = 10.0  # A send stalled this long drops the client
+    ws_ping_interval_seconds: float = 15.0
+    ws_ping_timeout_seconds: float = 45.0  # Clients silent this long (no pong) are dropped
+    
+    # HLS-style segmented HTTP delivery (see hls.py)
+    hls_enabled: bool = False
+    hls_segment_seconds: float = 2.0
+    hls_playlist_segments: int = 6  # Segments listed in /hls/live.m3u8
+    hls_idle_seconds: float = 30.0  # Keep playing out this long after the last playlist request
+    
+    # Audio post-processing applied to every synthesized item
+    audio_postprocess_enabled: bool = True
+    audio_silence_threshold_db: float = -45.0  # Edge frames quieter than this (dBFS RMS) are trimmed
+    audio_target_dbfs: float = -20.0  # Target speech loudness (RMS dBFS)
+    audio_edge_fade_ms: float = 10.0  # Fade-in/out at item edges
+    
+    # Filler clips played the moment the playlist runs dry
+    filler_enabled: bool = True
+    filler_max_age_seconds: float = 3600.0  # Re-synthesize clips older than this
+    filler_quiet_buffer_seconds: float = 10.0  # Refresh only while this much audio is queued
+    refill_retry_seconds: float = 5.0  # Minimum gap between auto-refill attempts
+    
+    # Topic calendar: each slot's opening items are rendered ahead of its start (see schedule.py)
+    schedule_preroll_items: int = 3
+    schedule_lead_safety: float = 1.5  # Multiplier on the measured render time
+    schedule_min_lead_seconds: float = 10.0
+    
+    # Degraded mode: while upstream calls keep failing, loop recently aired items (see replay.py)
+    replay_enabled: bool = True
+    replay_max_items: int = 50  # Aired items kept per topic
+    replay_max_bytes: int = 32_000_000  # Across all topics; least recently aired topics go first
+    replay_no_repeat: int = 10  # An item isn't replayed again within this many replays
+    upstream_failure_threshold: int = 3  # Consecutive LLM or TTS failures before degrading
+    upstream_probe_seconds: float = 30.0  # While degraded, one live refill is tried this often
+    
+    # Logging (see logs.py)
     log_level: str = "INFO"
+    log_format: str = "text"  # "text" (colorized) or "json" (one object per line, with item and trace ids)
+    log_enqueue: bool = True  # Write from a background thread so stderr never blocks the event loop
+    log_sample_per_second: float = 5.0  # Per-item messages of one kind let through per second
+    log_sample_burst: int = 20  # Per-item messages of one kind let through at once
+    
+    # Tracing
+    trace_sample_rate: float = 0.0  # Fraction of item traces recorded (0 disables tracing)
+    trace_export_path: str = "traces.jsonl"  # OTLP/JSON lines output file
+    trace_max_queue: int = 10000  # Spans buffered before new ones are dropped
+    
+    # Traffic capture: API calls, WebSocket sessions and upstream latencies (see capture.py)
+    capture_path: str = ""  # Capture file to append to (empty disables capture)
+    capture_max_queue: int = 10000  # Events buffered before new ones are dropped
     
     class Config:
         env_file = ".env"
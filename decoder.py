@@ -0,0 +1,250 @@
+"""Decode TTS responses into 16-bit mono PCM at the pipeline sample rate.
+
+The TTS endpoints don't always return raw PCM: ``output.audio.url``
+downloads and some fallback endpoints return WAV or MP3. The container is
+sniffed from the leading bytes:
+
+- raw PCM is passed through,
+- WAV is parsed directly (any PCM/float sample width, downmixed to mono and
+  resampled with ``audio.resample_pcm`` if needed),
+- compressed formats are decoded by ffmpeg subprocesses, bounded by a
+  semaphore, with stdin fed and stdout drained concurrently so large files
+  stream through without deadlocking on pipe buffers.
+
+Either way every item ends up as sample-accurate PCM, so its duration is
+exact.
+"""
+from typing import Optional, Tuple
+from loguru import logger
+import asyncio
+import struct
+
+import numpy as np
+
+from config import settings
+from audio import resample_pcm
+
+
+# Chunk size used when streaming data into ffmpeg
+PIPE_CHUNK_SIZE = 64 * 1024
+
+# WAVE format tags
+WAVE_FORMAT_PCM = 0x0001
+WAVE_FORMAT_IEEE_FLOAT = 0x0003
+WAVE_FORMAT_EXTENSIBLE = 0xFFFE
+
+
+class DecodeError(Exception):
+    """Raised when audio can't be decoded to PCM."""
+
+
+def _is_mpeg_frame(header: bytes) -> bool:
+    """Check for a plausible MPEG audio frame header (sync, layer, bitrate, rate)."""
+    if len(header) < 3 or header[0] != 0xFF or header[1] & 0xE0 != 0xE0:
+        return False
+    layer = (header[1] >> 1) & 0x03
+    bitrate_index = header[2] >> 4
+    rate_index = (header[2] >> 2) & 0x03
+    # Raw PCM starting with -1 samples (FF FF FF) fails the bitrate check
+    return layer != 0 and bitrate_index not in (0, 0x0F) and rate_index != 0x03
+
+
+def _is_adts_frame(header: bytes) -> bool:
+    """Check for an ADTS (AAC) frame header: sync, layer 00, valid rate index."""
+    return len(header) >= 3 and header[0] == 0xFF and header[1] & 0xF6 == 0xF0 and (header[2] >> 2) & 0x0F < 13
+
+
+def sniff_format(data: bytes) -> str:
+    """Identify the container from its magic bytes ("pcm" when none matches)."""
+    if data[:4] == b"RIFF" and data[8:12] == b"WAVE":
+        return "wav"
+    if data[:3] == b"ID3" or _is_mpeg_frame(data[:3]):
+        return "mp3"
+    if _is_adts_frame(data[:3]):
+        return "aac"
+    if data[:4] == b"OggS":
+        return "ogg"
+    if data[:4] == b"fLaC":
+        return "flac"
+    if data[4:8] == b"ftyp":
+        return "mp4"
+    return "pcm"
+
+
+def parse_wav_header(data: bytes) -> Optional[Tuple[tuple, int, Optional[int]]]:
+    """Locate the format fields and the data chunk in the leading bytes of a WAV file.
+
+    Works on a partial file, so a download can be decoded as it arrives.
+
+    Returns:
+        Tuple of (fmt fields, offset of the sample data, size of the sample
+        data or None for a streamed placeholder size), or None if the data
+        chunk header hasn't been reached yet
+
+    Raises:
+        DecodeError: If the header is malformed
+    """
+    fmt = None
+    position = 12
+    while position + 8 <= len(data):
+        chunk_id, chunk_size = struct.unpack_from("<4sI", data, position)
+        body_start = position + 8
+        if chunk_id == b"fmt ":
+            if chunk_size < 16:
+                raise DecodeError("WAV fmt chunk too short")
+            if body_start + chunk_size > len(data):
+                return None
+            fmt = struct.unpack_from("<HHIIHH", data, body_start)
+            if fmt[0] == WAVE_FORMAT_EXTENSIBLE and chunk_size >= 40:
+                # The real format tag is the first field of the SubFormat GUID
+                fmt = (struct.unpack_from("<H", data, body_start + 24)[0],) + fmt[1:]
+        elif chunk_id == b"data":
+            if fmt is None:
+                raise DecodeError("WAV data chunk before fmt chunk")
+            # Streamed WAVs may carry a placeholder size
+            return fmt, body_start, None if chunk_size in (0, 0xFFFFFFFF) else chunk_size
+        position = body_start + chunk_size + (chunk_size & 1)  # Chunks are word aligned
+    return None
+
+
+def parse_wav(data: bytes) -> Tuple[bytes, int]:
+    """Extract 16-bit mono PCM and its sample rate from a WAV file.
+
+    Raises:
+        DecodeError: If the file is malformed or uses an unsupported encoding
+    """
+    header = parse_wav_header(data)
+    if header is None:
+        raise DecodeError("WAV file has no fmt or data chunk")
+    fmt, data_start, data_size = header
+    # Take what is there when the size is a placeholder or the file is cut short
+    samples = data[data_start:] if data_size is None else data[data_start:data_start + data_size]
+
+    format_tag, channels, sample_rate, _, block_align, bits = fmt
+    if channels < 1 or block_align < 1:
+        raise DecodeError(f"Invalid WAV layout: {channels} channels, block align {block_align}")
+    samples = samples[:len(samples) - len(samples) % block_align]
+
+    if format_tag == WAVE_FORMAT_PCM and bits == 16:
+        array = np.frombuffer(samples, dtype="<i2").astype(np.float32)
+    elif format_tag == WAVE_FORMAT_PCM and bits == 8:
+        array = (np.frombuffer(samples, dtype=np.uint8).astype(np.float32) - 128.0) * 256.0
+    elif format_tag == WAVE_FORMAT_PCM and bits == 24:
+        raw = np.frombuffer(samples, dtype=np.uint8).reshape(-1, 3)
+        array = (raw[:, 0].astype(np.int32) | raw[:, 1].astype(np.int32) << 8 | raw[:, 2].astype(np.int8).astype(np.int32) << 16)
+        array = array.astype(np.float32) / 256.0
+    elif format_tag == WAVE_FORMAT_PCM and bits == 32:
+        array = np.frombuffer(samples, dtype="<i4").astype(np.float32) / 65536.0
+    elif format_tag == WAVE_FORMAT_IEEE_FLOAT and bits in (32, 64):
+        array = np.frombuffer(samples, dtype="<f4" if bits == 32 else "<f8").astype(np.float32) * 32768.0
+    else:
+        raise DecodeError(f"Unsupported WAV encoding: format {format_tag:#06x}, {bits} bits")
+
+    if channels > 1:
+        array = array.reshape(-1, channels).mean(axis=1)
+    return np.clip(np.rint(array), -32768, 32767).astype("<i2").tobytes(), sample_rate
+
+
+def wav_to_pcm(data: bytes, sample_rate: int) -> bytes:
+    """Parse a WAV file and resample it to ``sample_rate`` if needed."""
+    pcm, wav_rate = parse_wav(data)
+    return resample_pcm(pcm, wav_rate, sample_rate)
+
+
+class FFmpegDecoderPool:
+    """Decodes compressed audio with a bounded number of ffmpeg processes.
+
+    Args:
+        ffmpeg_path: ffmpeg executable
+        max_workers: Maximum number of concurrent ffmpeg processes
+        timeout: Seconds before a decode is killed
+    """
+
+    def __init__(self, ffmpeg_path: str = "ffmpeg", max_workers: int = 4, timeout: float = 30.0):
+        self.ffmpeg_path = ffmpeg_path
+        self.max_workers = max_workers
+        self.timeout = timeout
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+    def _command(self, input_format: Optional[str], sample_rate: int) -> list:
+        command = [self.ffmpeg_path, "-hide_banner", "-loglevel", "error", "-nostdin"]
+        if input_format:
+            command += ["-f", input_format]
+        return command + ["-i", "pipe:0", "-f", "s16le", "-acodec", "pcm_s16le", "-ac", "1", "-ar", str(sample_rate), "pipe:1"]
+
+    async def decode(self, data: bytes, sample_rate: int, input_format: Optional[str] = None) -> bytes:
+        """Decode ``data`` to 16-bit mono PCM at ``sample_rate``.
+
+        Raises:
+            DecodeError: If ffmpeg is missing, fails or times out
+        """
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_workers)
+        async with self._semaphore:
+            try:
+                process = await asyncio.create_subprocess_exec(
+                    *self._command(input_format, sample_rate),
+                    stdin=asyncio.subprocess.PIPE,
+                    stdout=asyncio.subprocess.PIPE,
+                    stderr=asyncio.subprocess.PIPE,
+                )
+            except FileNotFoundError:
+                raise DecodeError(f"ffmpeg not found at {self.ffmpeg_path!r}")
+
+            try:
+                stdout, stderr = await asyncio.wait_for(self._communicate(process, data), timeout=self.timeout)
+            except asyncio.TimeoutError:
+                process.kill()
+                await process.wait()
+                raise DecodeError(f"ffmpeg timed out after {self.timeout}s")
+            except BaseException:
+                if process.returncode is None:
+                    process.kill()
+                    await process.wait()
+                raise
+
+        if process.returncode != 0:
+            raise DecodeError(f"ffmpeg exited with {process.returncode}: {stderr.decode(errors='replace').strip()}")
+        return stdout
+
+    @staticmethod
+    async def _communicate(process, data: bytes) -> Tuple[bytes, bytes]:
+        """Stream ``data`` into stdin while draining stdout and stderr."""
+
+        async def feed():
+            try:
+                for offset in range(0, len(data), PIPE_CHUNK_SIZE):
+                    process.stdin.write(data[offset:offset + PIPE_CHUNK_SIZE])
+                    await process.stdin.drain()
+            except (BrokenPipeError, ConnectionResetError):
+                pass  # ffmpeg stopped reading; its exit code tells us why
+            finally:
+                process.stdin.close()
+
+        _, stdout, stderr = await asyncio.gather(feed(), process.stdout.read(), process.stderr.read())
+        await process.wait()
+        return stdout, stderr
+
+
+async def decode_audio(data: bytes, sample_rate: int, pool: Optional[FFmpegDecoderPool] = None) -> bytes:
+    """Turn a TTS response body into 16-bit mono PCM at ``sample_rate``.
+
+    Raises:
+        DecodeError: If the audio can't be decoded
+    """
+    container = sniff_format(data)
+    if container == "pcm":
+        return data
+    logger.debug(f"🎼 Decoding {container} audio ({len(data)} bytes)")
+    if container == "wav":
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, wav_to_pcm, data, sample_rate)
+    return await (pool or decoder_pool).decode(data, sample_rate)
+
+
+# Global decoder pool instance
+decoder_pool = FFmpegDecoderPool(
+    ffmpeg_path=settings.ffmpeg_path,
+    max_workers=settings.ffmpeg_max_workers,
+    timeout=settings.ffmpeg_timeout_seconds,
+)
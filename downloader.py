@@ -0,0 +1,306 @@
+"""Streaming download of TTS audio URLs.
+
+qwen3-tts-flash answers with ``output.audio.url`` instead of audio bytes.
+Downloads share one pooled ``httpx.AsyncClient`` (keep-alive connections
+are reused from item to item) and the body is streamed rather than fetched
+in full:
+
+- raw PCM, and WAV that is already 16-bit mono at the pipeline rate, is
+  forwarded as PCM frames the moment they arrive, so an item can start
+  airing before its download completes,
+- other WAV layouts and compressed formats are buffered and decoded when
+  the body is complete (``decoder.decode_audio``).
+
+Frames land in a :class:`PcmStream`, which readers follow from the start
+while it fills in. A semaphore bounds concurrent downloads and each body is
+capped at ``download_max_bytes``, so a burst of URLs can't exhaust memory.
+"""
+from typing import AsyncIterator, Optional, Set
+from loguru import logger
+import asyncio
+import time
+
+import httpx
+
+from config import settings
+from metrics import metrics
+from logs import log_sampler
+from audio import SAMPLE_WIDTH, pcm_duration_ms
+from decoder import (
+    FFmpegDecoderPool, decode_audio, parse_wav_header, sniff_format, WAVE_FORMAT_PCM,
+)
+
+
+# Bytes needed before the container can be sniffed
+SNIFF_BYTES = 12
+
+# Give up on a WAV header that hasn't reached its data chunk by this size
+MAX_WAV_HEADER_BYTES = 64 * 1024
+
+
+class DownloadError(Exception):
+    """Raised when audio can't be downloaded or decoded."""
+
+
+class PcmStream:
+    """16-bit mono PCM that fills in while its source is still downloading.
+
+    Readers follow it from the start with :meth:`chunks`, or wait for the
+    whole clip with :meth:`wait_complete`.
+    """
+
+    def __init__(self, sample_rate: int):
+        self.sample_rate = sample_rate
+        self.done = False
+        self.error: Optional[Exception] = None
+        self._buffer = bytearray()
+        self._changed = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None  # Download filling the stream, if any
+
+    @classmethod
+    def completed(cls, pcm: bytes, sample_rate: int) -> "PcmStream":
+        """A stream whose audio is already all there."""
+        stream = cls(sample_rate)
+        stream.append(pcm)
+        stream.finish()
+        return stream
+
+    def __len__(self) -> int:
+        return len(self._buffer)
+
+    @property
+    def duration_ms(self) -> int:
+        """Duration of the audio received so far."""
+        return pcm_duration_ms(self._buffer, self.sample_rate)
+
+    def append(self, pcm: bytes) -> None:
+        """Add whole samples of PCM and wake up readers."""
+        if pcm:
+            self._buffer += pcm
+            self._notify()
+
+    def finish(self, error: Optional[Exception] = None) -> None:
+        """Mark the stream complete, or failed with ``error``."""
+        if self.done:
+            return
+        self.error = error
+        self.done = True
+        self._notify()
+
+    def cancel(self) -> None:
+        """Stop the download feeding this stream; readers get a DownloadError."""
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+        self.finish(DownloadError("Download cancelled"))
+
+    def _notify(self) -> None:
+        # Waiters hold the old event; each change gets a fresh one
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    async def chunks(self, min_bytes: int = 0, timeout: Optional[float] = None) -> AsyncIterator[bytes]:
+        """Yield the audio from the start in pieces of at least ``min_bytes``.
+
+        Everything available is yielded at once, so readers that fall behind
+        catch up in larger pieces; the last piece may be shorter.
+
+        Raises:
+            DownloadError: If the download failed (after the audio received)
+            asyncio.TimeoutError: If no audio arrived for ``timeout`` seconds
+        """
+        offset = 0
+        while True:
+            available = len(self._buffer) - offset
+            if available and (available >= min_bytes or self.done):
+                with memoryview(self._buffer) as view:
+                    chunk = bytes(view[offset:])
+                offset += len(chunk)
+                yield chunk
+                continue
+            if self.done:
+                if self.error is not None:
+                    raise self.error
+                return
+            await asyncio.wait_for(self._changed.wait(), timeout)
+
+    async def wait_complete(self, timeout: Optional[float] = None) -> bytes:
+        """Wait for the download to finish and return all of the audio.
+
+        Raises:
+            DownloadError: If the download failed
+            asyncio.TimeoutError: If nothing changed for ``timeout`` seconds
+        """
+        while not self.done:
+            await asyncio.wait_for(self._changed.wait(), timeout)
+        if self.error is not None:
+            raise self.error
+        return bytes(self._buffer)
+
+
+class _IncrementalDecoder:
+    """Turns a response body into PCM on a stream as the bytes arrive."""
+
+    def __init__(self, stream: PcmStream, pool: Optional[FFmpegDecoderPool] = None):
+        self.stream = stream
+        self.pool = pool
+        self._pending = bytearray()  # Held back until the layout is known, or until the end
+        self._container: Optional[str] = None
+        self._header_checked = False
+        self._passthrough = False  # Bytes are the PCM itself
+        self._data_left: Optional[int] = None  # Remaining WAV data bytes, if the size is known
+        self._odd_byte = b""
+
+    def feed(self, data: bytes) -> None:
+        if self._passthrough:
+            self._forward(data)
+            return
+        self._pending += data
+        if self._container is None:
+            if len(self._pending) < SNIFF_BYTES:
+                return
+            self._container = sniff_format(bytes(self._pending[:SNIFF_BYTES]))
+            if self._container == "pcm":
+                self._start_passthrough(0)
+                return
+        if self._container == "wav" and not self._header_checked:
+            self._check_wav_header()
+
+    def _check_wav_header(self) -> None:
+        header = parse_wav_header(self._pending)
+        if header is None:
+            if len(self._pending) > MAX_WAV_HEADER_BYTES:
+                self._header_checked = True  # Odd file; decode it once complete
+            return
+        self._header_checked = True
+        (format_tag, channels, sample_rate, _, _, bits), data_start, data_size = header
+        if format_tag == WAVE_FORMAT_PCM and channels == 1 and bits == 16 and sample_rate == self.stream.sample_rate:
+            self._data_left = data_size
+            self._start_passthrough(data_start)
+
+    def _start_passthrough(self, offset: int) -> None:
+        self._passthrough = True
+        data = bytes(self._pending[offset:])
+        self._pending.clear()
+        self._forward(data)
+
+    def _forward(self, data: bytes) -> None:
+        if self._data_left is not None:
+            data = data[:self._data_left]  # Ignore chunks after the WAV data
+            self._data_left -= len(data)
+        data = self._odd_byte + data
+        whole = len(data) - len(data) % SAMPLE_WIDTH
+        self._odd_byte = data[whole:]
+        self.stream.append(data[:whole])
+
+    async def close(self) -> None:
+        """Decode whatever was held back once the body is complete."""
+        if self._passthrough or not self._pending:
+            return
+        body = bytes(self._pending)
+        self._pending.clear()
+        self.stream.append(await decode_audio(body, self.stream.sample_rate, pool=self.pool))
+
+
+class AudioDownloader:
+    """Downloads audio URLs over a pooled HTTP client, decoding as bytes arrive.
+
+    Args:
+        max_concurrent: Maximum number of downloads in flight
+        timeout: Seconds allowed for connecting and between received bytes
+        max_bytes: Largest accepted response body
+        transport: Optional httpx transport (tests)
+        decoder: Optional ffmpeg pool for compressed bodies
+    """
+
+    def __init__(
+        self,
+        max_concurrent: int = 4,
+        timeout: float = 30.0,
+        max_bytes: int = 20_000_000,
+        transport: Optional[httpx.AsyncBaseTransport] = None,
+        decoder: Optional[FFmpegDecoderPool] = None,
+    ):
+        self.max_concurrent = max_concurrent
+        self.timeout = timeout
+        self.max_bytes = max_bytes
+        self.decoder = decoder
+        self._transport = transport
+        self._client: Optional[httpx.AsyncClient] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._tasks: Set[asyncio.Task] = set()
+
+    def _get_client(self) -> httpx.AsyncClient:
+        loop = asyncio.get_running_loop()
+        if self._client is None or self._loop is not loop:
+            # Pooled connections belong to the event loop that opened them
+            self._client = httpx.AsyncClient(
+                transport=self._transport,
+                timeout=self.timeout,
+                limits=httpx.Limits(max_connections=self.max_concurrent, max_keepalive_connections=self.max_concurrent),
+                follow_redirects=True,
+            )
+            self._semaphore = asyncio.Semaphore(self.max_concurrent)
+            self._loop = loop
+        return self._client
+
+    def open(self, url: str, sample_rate: int) -> PcmStream:
+        """Start downloading ``url`` in the background and return its stream right away."""
+        stream = PcmStream(sample_rate)
+        task = asyncio.create_task(self._download(url, stream), name="download_audio")
+        stream._task = task
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return stream
+
+    async def fetch(self, url: str, sample_rate: int) -> bytes:
+        """Download ``url`` and return all of its audio as PCM at ``sample_rate``.
+
+        Raises:
+            DownloadError: If the download or decoding failed
+        """
+        stream = PcmStream(sample_rate)
+        await self._download(url, stream)
+        return await stream.wait_complete()
+
+    async def _download(self, url: str, stream: PcmStream) -> None:
+        """Stream ``url`` into ``stream``; failures are recorded on the stream."""
+        client = self._get_client()
+        received = 0
+        try:
+            async with self._semaphore:
+                log_sampler.log("download_start", "INFO", "📥 Fetching audio from URL: {}", lambda: url)
+                started = time.perf_counter()
+                first_audio_at: Optional[float] = None
+                decoder = _IncrementalDecoder(stream, self.decoder)
+                async with client.stream("GET", url) as response:
+                    response.raise_for_status()
+                    async for data in response.aiter_bytes():
+                        received += len(data)
+                        if received > self.max_bytes:
+                            raise DownloadError(f"Audio body exceeds {self.max_bytes} bytes")
+                        decoder.feed(data)
+                        if first_audio_at is None and len(stream):
+                            first_audio_at = time.perf_counter()
+                await decoder.close()
+                if first_audio_at is None and len(stream):
+                    first_audio_at = time.perf_counter()  # Buffered body, decoded at the end
+                if first_audio_at is not None:
+                    metrics.download_first_audio.observe(first_audio_at - started)
+        except asyncio.CancelledError:
+            stream.finish(DownloadError("Download cancelled"))
+            raise
+        except Exception as e:
+            logger.error(f"❌ Failed to fetch audio from {url}: {e}")
+            stream.finish(e if isinstance(e, DownloadError) else DownloadError(str(e)))
+            return
+        log_sampler.log("download_done", "INFO", "✅ Fetched audio: {} bytes, {}ms", lambda: received, lambda: stream.duration_ms)
+        stream.finish()
+
+
+# Global downloader instance
+audio_downloader = AudioDownloader(
+    max_concurrent=settings.download_max_concurrent,
+    timeout=settings.download_timeout_seconds,
+    max_bytes=settings.download_max_bytes,
+)
@@ -0,0 +1,166 @@
+"""Pre-synthesized filler clips that cover playlist underruns.
+
+When the playlist runs dry the stream plays short, already-synthesized
+clips instead of going silent: topic-agnostic lines (greetings, calls to
+follow) plus bridging lines for the current topic. Clips are kept as
+``AudioItem`` objects with their visemes so they can air instantly, and the
+pool is refreshed in the background while the playlist is healthy.
+"""
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+from loguru import logger
+import asyncio
+import time
+
+from config import settings
+from state import AudioItem
+from audio import DEFAULT_SAMPLE_RATE
+from ai_service import ai_service
+from llm_cache import normalize_topic
+
+
+# Topic-agnostic lines that fit any product
+GENERIC_FILLER_LINES = [
+    "欢迎刚进直播间的朋友们，点点关注不迷路！",
+    "喜欢主播的朋友可以先点个赞，精彩内容马上继续！",
+    "大家有任何问题都可以在评论区留言，主播一一为大家解答！",
+    "感谢大家的支持，我们稍等片刻，好物马上就来！",
+    "还没点关注的朋友赶紧点一点，福利不断哦！",
+]
+
+# Bridging lines that keep the current topic alive
+BRIDGE_TEMPLATES = [
+    "说到{topic}，还有更多亮点马上为大家揭晓！",
+    "关于{topic}，大家最关心的问题我们马上来聊一聊！",
+    "想了解{topic}的朋友们别走开，精彩内容马上继续！",
+]
+
+# Bridging clips are kept for this many recent topics
+MAX_BRIDGE_TOPICS = 3
+
+SynthesizeFn = Callable[[str], Awaitable[Dict]]
+
+
+class FillerPool:
+    """Pool of ready-to-play filler clips.
+
+    Args:
+        synthesize: Coroutine function returning a TTS result dict
+            (``audio_data``, ``visemes``, ``duration_ms``), e.g.
+            ``AIService.text_to_speech``
+        max_age_seconds: Clips older than this are re-synthesized on refresh
+    """
+
+    def __init__(
+        self,
+        synthesize: SynthesizeFn,
+        max_age_seconds: float = 3600.0,
+        generic_lines: Optional[List[str]] = None,
+        bridge_templates: Optional[List[str]] = None,
+    ):
+        self.synthesize = synthesize
+        self.max_age_seconds = max_age_seconds
+        self.generic_lines = generic_lines or GENERIC_FILLER_LINES
+        self.bridge_templates = bridge_templates or BRIDGE_TEMPLATES
+        self.generic: Dict[str, AudioItem] = {}  # line -> clip
+        # normalize_topic(topic) -> template -> clip, so spellings of one topic share clips
+        self.bridges: Dict[str, Dict[str, AudioItem]] = {}
+        self._cursor = 0
+        self._refresh_lock = asyncio.Lock()
+
+    @property
+    def is_refreshing(self) -> bool:
+        return self._refresh_lock.locked()
+
+    def size(self, topic: Optional[str] = None) -> int:
+        """Number of clips available for a topic (generic + bridging)."""
+        return len(self.generic) + len(self._topic_bridges(topic))
+
+    def next_filler(self, topic: Optional[str]) -> Optional[AudioItem]:
+        """Return the next clip to play, rotating through bridging and generic clips."""
+        candidates = list(self._topic_bridges(topic).values()) + list(self.generic.values())
+        if not candidates:
+            return None
+        item = candidates[self._cursor % len(candidates)]
+        self._cursor += 1
+        return item
+
+    def _topic_bridges(self, topic: Optional[str]) -> Dict[str, AudioItem]:
+        return self.bridges.get(normalize_topic(topic), {}) if topic else {}
+
+    def _missing_lines(self, topic: Optional[str]) -> Dict[str, Optional[Tuple[str, str]]]:
+        """Lines that still need (re-)synthesis, mapped to their (topic key, template) (None for generic)."""
+        now = time.time()
+
+        def stale(clip: Optional[AudioItem]) -> bool:
+            return clip is None or now - clip.created_at > self.max_age_seconds
+
+        missing: Dict[str, Optional[Tuple[str, str]]] = {
+            line: None for line in self.generic_lines if stale(self.generic.get(line))
+        }
+        if topic:
+            bridges = self._topic_bridges(topic)
+            for template in self.bridge_templates:
+                if stale(bridges.get(template)):
+                    missing[template.format(topic=topic)] = (normalize_topic(topic), template)
+        return missing
+
+    def needs_refresh(self, topic: Optional[str]) -> bool:
+        return bool(self._missing_lines(topic))
+
+    async def refresh(self, topic: Optional[str]) -> int:
+        """Synthesize missing or stale clips for a topic.
+
+        Failed lines are skipped and retried on the next refresh.
+
+        Returns:
+            Number of clips synthesized
+        """
+        if self._refresh_lock.locked():
+            return 0
+        async with self._refresh_lock:
+            missing = self._missing_lines(topic)
+            if not missing:
+                return 0
+
+            logger.info(f"🧩 Refreshing {len(missing)} filler clips (topic: {topic})")
+            synthesized = 0
+            for line, bridge in missing.items():
+                try:
+                    tts_result = await self.synthesize(line)
+                except Exception as e:
+                    logger.warning(f"⚠️ Failed to synthesize filler clip: {e}")
+                    continue
+
+                item = AudioItem(
+                    text=line,
+                    audio_data=tts_result["audio_data"],
+                    visemes=tts_result["visemes"],
+                    duration_ms=tts_result["duration_ms"],
+                    created_at=None,
+                    is_filler=True,
+                    sample_rate=tts_result.get("sample_rate", DEFAULT_SAMPLE_RATE),
+                )
+                if bridge is None:
+                    self.generic[line] = item
+                else:
+                    key, template = bridge
+                    self.bridges.setdefault(key, {})[template] = item
+                synthesized += 1
+
+            self._evict_old_topics(topic)
+            logger.info(f"✅ Filler pool ready: {self.size(topic)} clips for topic {topic}")
+            return synthesized
+
+    def _evict_old_topics(self, current_topic: Optional[str]) -> None:
+        """Keep bridging clips only for the most recent topics."""
+        current = normalize_topic(current_topic) if current_topic else None
+        if current in self.bridges:
+            # Mark the current topic as most recently used
+            self.bridges[current] = self.bridges.pop(current)
+        while len(self.bridges) > MAX_BRIDGE_TOPICS:
+            oldest = next(key for key in self.bridges if key != current)
+            del self.bridges[oldest]
+
+
+# Global filler pool instance
+filler_pool = FillerPool(ai_service.text_to_speech, max_age_seconds=settings.filler_max_age_seconds)
@@ -0,0 +1,79 @@
+"""Health of the upstream LLM and TTS services.
+
+ai_service records the outcome of every upstream call. After
+``failure_threshold`` consecutive failures of either service the stream is
+degraded: the playout loops recently aired items (see replay.py) instead of
+asking for new content, so an outage costs no API calls. One live refill
+is still let through every ``probe_seconds`` to find out whether upstream
+is back; the first success of the failing service ends degraded mode.
+"""
+from typing import Any, Dict, Optional
+from loguru import logger
+import time
+
+from config import settings
+from metrics import metrics
+
+
+UPSTREAMS = ("llm", "tts")
+
+
+class UpstreamHealth:
+    """Consecutive failure counts of the upstream services.
+
+    Args:
+        failure_threshold: Consecutive failures of one service that degrade the stream
+        probe_seconds: While degraded, minimum gap between live refill attempts
+    """
+
+    def __init__(self, failure_threshold: int = 3, probe_seconds: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.probe_seconds = probe_seconds
+        self.failures: Dict[str, int] = {upstream: 0 for upstream in UPSTREAMS}
+        self.degraded_since: Optional[float] = None  # time.monotonic() when degraded mode began
+        self._probed_at = 0.0
+
+    @property
+    def degraded(self) -> bool:
+        return self.degraded_since is not None
+
+    def record(self, upstream: str, ok: bool) -> None:
+        """Record the outcome of one call to ``upstream`` ("llm" or "tts")."""
+        self.failures[upstream] = 0 if ok else self.failures[upstream] + 1
+        failing = [name for name, count in self.failures.items() if count >= self.failure_threshold]
+        if failing and self.degraded_since is None:
+            self.degraded_since = self._probed_at = time.monotonic()
+            metrics.upstream_degraded.set(1)
+            logger.warning(f"🩺 Upstream {', '.join(failing)} failing, entering degraded mode")
+        elif not failing and self.degraded_since is not None:
+            logger.info(f"🩺 Upstream recovered after {time.monotonic() - self.degraded_since:.0f}s, leaving degraded mode")
+            self.degraded_since = None
+            metrics.upstream_degraded.set(0)
+
+    def probe_due(self) -> bool:
+        """Whether a live refill may call upstream now.
+
+        Always while healthy; while degraded, once per ``probe_seconds``
+        (the attempt is counted as made).
+        """
+        if self.degraded_since is None:
+            return True
+        now = time.monotonic()
+        if now - self._probed_at < self.probe_seconds:
+            return False
+        self._probed_at = now
+        return True
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "degraded": self.degraded,
+            "degraded_seconds": round(time.monotonic() - self.degraded_since, 1) if self.degraded else 0.0,
+            "consecutive_failures": dict(self.failures),
+        }
+
+
+# Global upstream health instance
+upstream_health = UpstreamHealth(
+    failure_threshold=settings.upstream_failure_threshold,
+    probe_seconds=settings.upstream_probe_seconds,
+)
@@ -0,0 +1,236 @@
+"""HLS-style segmented HTTP delivery of the playout.
+
+WebSockets carry the whole stream to every viewer, so nothing can be cached
+in front of the server. With ``hls_enabled`` the playout timeline is also
+cut into short segments (``hls_segment_seconds``) served over plain HTTP:
+
+- ``/hls/live.m3u8``: rolling playlist of the last ``hls_playlist_segments``
+  segments, cacheable for half a segment
+- ``/hls/segment_{n}.wav``: the segment's audio (16-bit mono WAV)
+- ``/hls/segment_{n}.json``: sidecar track with the segment's subtitles and
+  viseme frames, timed from the segment start
+
+Each segment is published once its audio has aired, so the HLS edge
+stays in step with the WebSocket playout even though whole items are
+segmented when they start airing. Segments never change once published, so they are served with long-lived
+``immutable`` cache headers, ETags and byte ranges. A caching reverse proxy
+in front of the origin can then serve any number of viewers while the
+origin serves each segment once.
+
+Segments are WAV rather than MPEG-TS/AAC because the server has no audio
+encoder; every browser can play them directly.
+"""
+from collections import deque
+from dataclasses import dataclass
+from typing import Callable, Deque, Dict, Iterable, List, Optional, Tuple
+import hashlib
+import json
+import math
+import struct
+import time
+
+from config import settings
+from audio import SAMPLE_WIDTH, DEFAULT_SAMPLE_RATE, pcm_duration_ms, resample_pcm
+
+
+# Segments kept beyond the playlist window for players that are behind
+EXTRA_RETAINED_SEGMENTS = 4
+
+# Gaps in the timeline shorter than this are not padded with silence
+GAP_TOLERANCE_SECONDS = 0.05
+
+
+def encode_wav(pcm: bytes, sample_rate: int) -> bytes:
+    """Wrap 16-bit mono PCM in a WAV header."""
+    fmt = struct.pack("<HHIIHH", 1, 1, sample_rate, sample_rate * SAMPLE_WIDTH, SAMPLE_WIDTH, 16)
+    header = b"WAVE" + b"fmt " + struct.pack("<I", len(fmt)) + fmt + b"data" + struct.pack("<I", len(pcm))
+    return b"RIFF" + struct.pack("<I", len(header) + len(pcm)) + header + pcm
+
+
+def parse_range(header: str, size: int) -> Tuple[int, int]:
+    """Parse a single ``bytes=`` range into inclusive (start, end) offsets.
+
+    Raises:
+        ValueError: If the range is malformed or not satisfiable
+    """
+    unit, _, spec = header.partition("=")
+    if unit.strip() != "bytes" or "," in spec:
+        raise ValueError(f"Unsupported range: {header}")
+    first, _, last = spec.strip().partition("-")
+    if first:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+    else:
+        start, end = max(size - int(last), 0), size - 1  # Suffix range: last N bytes
+    if start > end or start >= size:
+        raise ValueError(f"Unsatisfiable range: {header}")
+    return start, end
+
+
+@dataclass
+class Segment:
+    """A published slice of the playout timeline."""
+    sequence: int
+    duration: float  # Seconds
+    audio: bytes  # WAV file
+    track: bytes  # Sidecar JSON (subtitles and visemes)
+    tag: str  # Unique across restarts; ETags are derived from it
+    aired_at: float  # Clock time by which its audio has aired; published from then on
+
+
+class HlsSegmenter:
+    """Cuts aired audio into fixed-length segments and keeps a rolling window of them.
+
+    Args:
+        segment_seconds: Target duration of each segment
+        playlist_segments: Segments listed in the playlist
+        sample_rate: Rate of the segment audio (other rates are resampled)
+        clock: Time source for air times (for tests)
+    """
+
+    def __init__(
+        self,
+        segment_seconds: float = 2.0,
+        playlist_segments: int = 6,
+        sample_rate: int = DEFAULT_SAMPLE_RATE,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.segment_seconds = segment_seconds
+        self.playlist_segments = playlist_segments
+        self.sample_rate = sample_rate
+        self.clock = clock
+        self.segments: Deque[Segment] = deque(maxlen=playlist_segments + EXTRA_RETAINED_SEGMENTS)
+        self.next_sequence = 0
+        self.last_request_at = 0.0  # time.monotonic() of the last playlist request
+        # Cut segments whose audio is still airing, oldest first
+        self._pending: Deque[Segment] = deque()
+        # Audio not yet in a segment, with its cues timed in ms from its start
+        self._pcm = bytearray()
+        self._pcm_airs_at = 0.0  # Clock time the first buffered sample airs
+        self._subtitles: List[Dict] = []
+        self._visemes: List[Dict] = []
+
+    @property
+    def segment_bytes(self) -> int:
+        return int(self.sample_rate * self.segment_seconds) * SAMPLE_WIDTH
+
+    def is_watched(self, idle_seconds: float) -> bool:
+        """Whether the playlist was requested within the last ``idle_seconds``."""
+        return time.monotonic() - self.last_request_at < idle_seconds
+
+    def add_audio(
+        self,
+        pcm: bytes,
+        sample_rate: int,
+        text: Optional[str] = None,
+        visemes: Iterable[Dict] = (),
+        is_filler: bool = False,
+        at: Optional[float] = None,
+    ) -> None:
+        """Append audio starting to air at clock time ``at`` (now by default) to the timeline.
+
+        Every segment it completes is cut now and published once its audio
+        has aired. Audio at another rate is resampled here, so callers on
+        the event loop pass ``sample_rate``-rate audio.
+
+        If nothing aired for a while (the playout was idle), the partial
+        segment left over is padded with silence up to ``at`` or its end,
+        and the timeline restarts at ``at``.
+        """
+        if sample_rate != self.sample_rate:
+            pcm = resample_pcm(pcm, sample_rate, self.sample_rate)
+        at = self.clock() if at is None else at
+        if self._pcm:
+            gap = at - self._pcm_airs_at - pcm_duration_ms(self._pcm, self.sample_rate) / 1000
+            if gap > GAP_TOLERANCE_SECONDS:
+                self._pcm += bytes(min(int(self.sample_rate * gap) * SAMPLE_WIDTH, self.segment_bytes - len(self._pcm)))
+                if len(self._pcm) >= self.segment_bytes:
+                    self._publish(self.segment_bytes)
+        if not self._pcm:
+            self._pcm_airs_at = at
+        start_ms = pcm_duration_ms(self._pcm, self.sample_rate)
+        if text:
+            end_ms = start_ms + pcm_duration_ms(pcm, self.sample_rate)
+            self._subtitles.append({"start": start_ms, "end": end_ms, "text": text, "is_filler": is_filler})
+        for viseme in visemes:
+            self._visemes.append({**viseme, "offset": start_ms + viseme["offset"] * 1000})
+        self._pcm += pcm
+        while len(self._pcm) >= self.segment_bytes:
+            self._publish(self.segment_bytes)
+
+    def add_silence(self, duration_ms: int) -> None:
+        """Keep the timeline going while nothing airs."""
+        self.add_audio(bytes(int(self.sample_rate * duration_ms / 1000) * SAMPLE_WIDTH), self.sample_rate)
+
+    def _publish(self, num_bytes: int) -> None:
+        pcm = bytes(self._pcm[:num_bytes])
+        del self._pcm[:num_bytes]
+        duration_ms = pcm_duration_ms(pcm, self.sample_rate)
+
+        # Cues overlapping the segment are clipped to it; later parts carry over
+        subtitles = [
+            {**cue, "start": max(cue["start"], 0), "end": min(cue["end"], duration_ms)}
+            for cue in self._subtitles if cue["start"] < duration_ms
+        ]
+        self._subtitles = [
+            {**cue, "start": cue["start"] - duration_ms, "end": cue["end"] - duration_ms}
+            for cue in self._subtitles if cue["end"] > duration_ms
+        ]
+        visemes = [
+            {**viseme, "offset": viseme["offset"] / 1000} for viseme in self._visemes if viseme["offset"] < duration_ms
+        ]
+        self._visemes = [
+            {**viseme, "offset": viseme["offset"] - duration_ms} for viseme in self._visemes if viseme["offset"] >= duration_ms
+        ]
+
+        sequence = self.next_sequence
+        self.next_sequence += 1
+        audio = encode_wav(pcm, self.sample_rate)
+        track = json.dumps({
+            "sequence": sequence,
+            "duration": duration_ms / 1000,
+            "subtitles": subtitles,  # start/end in ms from the segment start
+            "visemes": visemes,  # offset in seconds from the segment start
+        }, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        tag = f"{sequence}-{hashlib.sha1(audio).hexdigest()[:16]}"
+        self._pcm_airs_at += duration_ms / 1000
+        self._pending.append(Segment(sequence, duration_ms / 1000, audio, track, tag, self._pcm_airs_at))
+
+    def _release(self) -> None:
+        """Publish the cut segments whose audio has aired."""
+        now = self.clock()
+        while self._pending and self._pending[0].aired_at <= now:
+            self.segments.append(self._pending.popleft())
+
+    def get(self, sequence: int) -> Optional[Segment]:
+        """A published, retained segment by sequence number."""
+        self._release()
+        if not self.segments:
+            return None
+        index = sequence - self.segments[0].sequence
+        if 0 <= index < len(self.segments):
+            return self.segments[index]
+        return None
+
+    def playlist(self) -> str:
+        """The rolling media playlist (m3u8) of the most recent published segments."""
+        self._release()
+        window = list(self.segments)[-self.playlist_segments:]
+        next_sequence = self._pending[0].sequence if self._pending else self.next_sequence
+        lines = [
+            "#EXTM3U",
+            "#EXT-X-VERSION:3",
+            f"#EXT-X-TARGETDURATION:{math.ceil(self.segment_seconds)}",
+            f"#EXT-X-MEDIA-SEQUENCE:{window[0].sequence if window else next_sequence}",
+        ]
+        for segment in window:
+            lines.append(f"#EXTINF:{segment.duration:.3f},")
+            lines.append(f"segment_{segment.sequence}.wav")
+        return "\n".join(lines) + "\n"
+
+
+# Global segmenter instance
+hls_segmenter = HlsSegmenter(
+    segment_seconds=settings.hls_segment_seconds,
+    playlist_segments=settings.hls_playlist_segments,
+)
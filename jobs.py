@@ -0,0 +1,209 @@
+"""Background content generation jobs with streamed progress.
+
+``POST /api/start_stream`` starts a job and returns its id right away; the
+generate -> synthesize -> enqueue pipeline runs in a background task and
+reports each step as an event. Events are kept on the job so late
+subscribers (``/api/jobs/{id}/events``) replay the history before following
+live progress as Server-Sent Events.
+
+Jobs started with a ``flight_key`` are coalesced: while one is running
+under that key, starting another returns the running job (see
+singleflight.py).
+"""
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Hashable, List, Optional, Set
+from datetime import datetime
+from loguru import logger
+import asyncio
+import json
+import secrets
+
+from singleflight import SingleFlight
+
+
+# Job statuses
+JOB_PENDING = "pending"
+JOB_RUNNING = "running"
+JOB_COMPLETED = "completed"
+JOB_FAILED = "failed"
+
+# Finished jobs kept for status queries; older ones are forgotten
+MAX_FINISHED_JOBS = 50
+
+# Seconds between SSE keepalive comments while a job is quiet
+KEEPALIVE_SECONDS = 15.0
+
+
+class Job:
+    """A single generation run and its progress events."""
+
+    def __init__(self, topic: str, kind: str = "start_stream", epoch: Optional[int] = None):
+        self.id = secrets.token_hex(8)
+        self.topic = topic
+        self.kind = kind
+        self.epoch = epoch  # Topic epoch the job produces content for
+        self.status = JOB_PENDING
+        self.created_at = datetime.now()
+        self.started_at: Optional[datetime] = None
+        self.finished_at: Optional[datetime] = None
+        self.scripts_generated = 0
+        self.items_enqueued = 0
+        self.items_failed = 0
+        self.error: Optional[str] = None
+        self.events: List[Dict[str, Any]] = []
+        self.task: Optional[asyncio.Task] = None
+        self._subscribers: Set[asyncio.Queue] = set()
+
+    @property
+    def is_finished(self) -> bool:
+        return self.status in (JOB_COMPLETED, JOB_FAILED)
+
+    def emit(self, event: str, **data: Any) -> None:
+        """Record a progress event and deliver it to live subscribers."""
+        entry = {"id": len(self.events), "event": event, "data": {"job_id": self.id, **data}}
+        self.events.append(entry)
+        for queue in self._subscribers:
+            queue.put_nowait(entry)
+
+    def finish(self, status: str, error: Optional[str] = None) -> None:
+        self.status = status
+        self.error = error
+        self.finished_at = datetime.now()
+        self.emit(status, **self.summary(), error=error)
+
+    def summary(self) -> Dict[str, int]:
+        return {
+            "scripts_generated": self.scripts_generated,
+            "items_enqueued": self.items_enqueued,
+            "items_failed": self.items_failed,
+        }
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "job_id": self.id,
+            "kind": self.kind,
+            "topic": self.topic,
+            "epoch": self.epoch,
+            "status": self.status,
+            "created_at": self.created_at.isoformat(),
+            "started_at": self.started_at.isoformat() if self.started_at else None,
+            "finished_at": self.finished_at.isoformat() if self.finished_at else None,
+            **self.summary(),
+            "error": self.error,
+        }
+
+    async def stream(self, last_event_id: int = -1) -> AsyncIterator[Optional[Dict[str, Any]]]:
+        """Yield events after ``last_event_id``, then follow live ones until the job ends.
+
+        Yields None when no event arrived for KEEPALIVE_SECONDS so the caller
+        can keep the connection alive.
+        """
+        queue: asyncio.Queue = asyncio.Queue()
+        self._subscribers.add(queue)
+        history = list(self.events)  # Later events arrive through the queue
+        try:
+            for entry in history[last_event_id + 1:]:
+                yield entry
+            if self.is_finished:
+                return
+            while True:
+                try:
+                    entry = await asyncio.wait_for(queue.get(), timeout=KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    yield None
+                    continue
+                yield entry
+                if entry["event"] in (JOB_COMPLETED, JOB_FAILED):
+                    return
+        finally:
+            self._subscribers.discard(queue)
+
+
+def format_sse(entry: Optional[Dict[str, Any]]) -> str:
+    """Format an event for a ``text/event-stream`` response (None -> keepalive)."""
+    if entry is None:
+        return ": keepalive\n\n"
+    data = json.dumps(entry["data"], ensure_ascii=False, separators=(",", ":"))
+    return f"id: {entry['id']}\nevent: {entry['event']}\ndata: {data}\n\n"
+
+
+class JobManager:
+    """Starts jobs as background tasks and keeps recent ones for lookup."""
+
+    def __init__(self, max_finished_jobs: int = MAX_FINISHED_JOBS):
+        self.max_finished_jobs = max_finished_jobs
+        self.jobs: Dict[str, Job] = {}  # Insertion ordered, oldest first
+        self.flight = SingleFlight("jobs")
+
+    def start(
+        self,
+        topic: str,
+        runner: Callable[[Job], Awaitable[Any]],
+        kind: str = "start_stream",
+        epoch: Optional[int] = None,
+        flight_key: Optional[Hashable] = None,
+    ) -> Job:
+        """Create a job and run ``runner(job)`` in the background.
+
+        With ``flight_key``, a job still running under the same key is
+        returned instead.
+        """
+        job = Job(topic, kind, epoch)
+        if flight_key is None:
+            job.task = asyncio.create_task(self._run(job, runner), name=kind)
+        else:
+            job.task = self.flight.start(flight_key, lambda: self._run(job, runner), name=kind)
+            running = next((other for other in self.jobs.values() if other.task is job.task), None)
+            if running is not None:
+                logger.info(f"🧾 Joined running {running.kind} job {running.id} (topic: {topic})")
+                return running
+        self.jobs[job.id] = job
+        self._evict_finished()
+        logger.info(f"🧾 Started {kind} job {job.id} (topic: {topic})")
+        return job
+
+    async def _run(self, job: Job, runner: Callable[[Job], Awaitable[Any]]) -> None:
+        job.status = JOB_RUNNING
+        job.started_at = datetime.now()
+        try:
+            await runner(job)
+        except asyncio.CancelledError:
+            job.finish(JOB_FAILED, "cancelled")
+            raise
+        except Exception as e:
+            logger.error(f"❌ Job {job.id} failed: {e}")
+            job.finish(JOB_FAILED, str(e))
+        else:
+            job.finish(JOB_COMPLETED)
+            logger.info(f"✅ Job {job.id} completed: {job.summary()}")
+
+    def get(self, job_id: str) -> Optional[Job]:
+        return self.jobs.get(job_id)
+
+    def has_active_jobs(self) -> bool:
+        return any(not job.is_finished for job in self.jobs.values())
+
+    def cancel_stale(self, epoch: int) -> int:
+        """Cancel unfinished jobs started for an epoch before ``epoch``.
+
+        Returns:
+            Number of jobs cancelled
+        """
+        cancelled = 0
+        for job in self.jobs.values():
+            if job.is_finished or job.epoch is None or job.epoch >= epoch:
+                continue
+            if job.task is not None and job.task.cancel():
+                if job.status == JOB_PENDING:
+                    job.finish(JOB_FAILED, "cancelled")  # Never started, so _run won't report it
+                logger.info(f"🛑 Cancelled stale {job.kind} job {job.id} (topic: {job.topic})")
+                cancelled += 1
+        return cancelled
+
+    def _evict_finished(self) -> None:
+        finished = [job_id for job_id, job in self.jobs.items() if job.is_finished]
+        for job_id in finished[:max(len(finished) - self.max_finished_jobs, 0)]:
+            del self.jobs[job_id]
+
+
+# Global job manager instance
+job_manager = JobManager()
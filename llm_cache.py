@@ -0,0 +1,81 @@
+"""Cache of LLM responses with a TTL, a size bound and variant rotation.
+
+Restarting a stream, or re-posting a topic to ``/api/start_stream``, used
+to pay for a new Qwen call every time. Responses are now cached under the
+normalized topic plus the prompt parameters, and only misses or expired
+entries go to the LLM.
+
+To keep repeated topics varied, each topic has up to ``variants`` prompt
+variants (e.g. different delivery styles). Lookups rotate through them
+round-robin, so the first ``variants`` requests for a topic generate one
+response each and later ones cycle through the cached responses until they
+expire. The least recently used entries are dropped beyond ``max_entries``.
+"""
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Optional, Tuple
+import time
+import unicodedata
+
+from metrics import metrics
+
+
+def normalize_topic(topic: str) -> str:
+    """Canonical form of a topic for cache keys: NFKC, collapsed whitespace, case-folded."""
+    return " ".join(unicodedata.normalize("NFKC", topic).split()).casefold()
+
+
+class ResponseCache:
+    """TTL and LRU bounded cache with round-robin variant selection.
+
+    Args:
+        ttl_seconds: Seconds an entry stays fresh after it was generated
+        max_entries: Entries kept before the least recently used is dropped
+        variants: Prompt variants rotated per base key
+        clock: Monotonic time source (tests)
+    """
+
+    def __init__(
+        self,
+        ttl_seconds: float = 1800.0,
+        max_entries: int = 128,
+        variants: int = 3,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.variants = max(variants, 1)
+        self.clock = clock
+        self._entries: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()  # key -> (created, value)
+        self._rotation: "OrderedDict[Hashable, int]" = OrderedDict()  # base key -> next variant
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def next_variant(self, base_key: Hashable) -> int:
+        """Variant index to use for the next lookup under ``base_key`` (round-robin)."""
+        variant = self._rotation.pop(base_key, 0)
+        self._rotation[base_key] = (variant + 1) % self.variants
+        if len(self._rotation) > self.max_entries:
+            self._rotation.popitem(last=False)
+        return variant
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """Return the cached value for ``key``, or None if missing or expired."""
+        entry = self._entries.get(key)
+        if entry is None:
+            metrics.llm_cache_lookups.inc(result="miss")
+            return None
+        created_at, value = entry
+        if self.clock() - created_at >= self.ttl_seconds:
+            del self._entries[key]
+            metrics.llm_cache_lookups.inc(result="expired")
+            return None
+        self._entries.move_to_end(key)
+        metrics.llm_cache_lookups.inc(result="hit")
+        return value
+
+    def put(self, key: Hashable, value: Any) -> None:
+        self._entries[key] = (self.clock(), value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
@@ -0,0 +1,151 @@
+"""Non-blocking log pipeline with hot-path sampling.
+
+Logging must never hold up playout:
+
+- The stderr sink is enqueued (``log_enqueue``): records are formatted by
+  the caller and written by loguru's background thread, so a slow or
+  blocked stderr pipe never stalls the event loop.
+- Per-item messages go through ``log_sampler``: at most
+  ``log_sample_burst`` messages per kind, refilled at
+  ``log_sample_per_second``. Dropped messages are counted and reported on
+  the next one that passes. Arguments are zero-argument callables, only
+  evaluated when the message is emitted, so nothing is formatted for
+  filtered or dropped messages.
+- With ``log_format=json`` every line is one JSON object. Messages logged
+  while an item is processed (see ``item_context``) carry its ``item_id``
+  and ``trace_id`` (see tracing.py), so the log lines of one item can be
+  matched up with each other and with its trace.
+
+Other messages use loguru's ``{}`` arguments rather than f-strings, so they
+are only formatted when their level is enabled.
+"""
+from typing import Any, Callable, Dict, List, Optional
+from loguru import logger
+import json
+import sys
+import time
+import traceback
+
+from config import settings
+
+
+TEXT_FORMAT = (
+    "<green>{time:YYYY-MM-DD HH:mm:ss}</green> | <level>{level: <8}</level> | "
+    "<cyan>{name}</cyan>:<cyan>{function}</cyan>:<cyan>{line}</cyan> - <level>{message}</level>"
+)
+
+LOG_FORMATS = ("text", "json")
+
+
+def _json_format(record: Dict[str, Any]) -> str:
+    """Loguru format function rendering a record as one JSON line."""
+    entry = {
+        "time": record["time"].isoformat(),
+        "level": record["level"].name,
+        "message": record["message"],
+        "module": record["name"],
+        "function": record["function"],
+        "line": record["line"],
+    }
+    entry.update((key, value) for key, value in record["extra"].items() if not key.startswith("_"))
+    if record["exception"] is not None:
+        entry["exception"] = "".join(traceback.format_exception(*record["exception"]))
+    record["extra"]["_json"] = json.dumps(entry, ensure_ascii=False, default=str)
+    return "{extra[_json]}\n"
+
+
+def configure_logging(
+    level: str = "INFO",
+    log_format: str = "text",
+    enqueue: bool = True,
+    sink: Any = None,
+) -> int:
+    """Replace loguru's handlers with the application sink.
+
+    Args:
+        level: Minimum level written
+        log_format: "text" (colorized) or "json" (one object per line)
+        enqueue: Write from a background thread
+        sink: Destination (stderr by default)
+
+    Returns:
+        The handler id
+
+    Raises:
+        ValueError: If ``log_format`` is unknown
+    """
+    if log_format not in LOG_FORMATS:
+        raise ValueError(f"Unknown log format {log_format!r}, expected one of {LOG_FORMATS}")
+    logger.remove()
+    sink = sys.stderr if sink is None else sink
+    if log_format == "json":
+        handler_id = logger.add(sink, format=_json_format, level=level, enqueue=enqueue, colorize=False)
+    else:
+        handler_id = logger.add(sink, format=TEXT_FORMAT, level=level, enqueue=enqueue, colorize=sink is sys.stderr)
+    log_sampler.min_level_no = logger.level(level.upper()).no
+    return handler_id
+
+
+def item_context(item):
+    """Context in which log messages carry the item's ``item_id`` and ``trace_id``."""
+    ids = {"item_id": item.item_id, "trace_id": item.trace_id}
+    return logger.contextualize(**{key: value for key, value in ids.items() if value is not None})
+
+
+class LogSampler:
+    """Token-bucket rate limit on hot-path log messages, per message kind.
+
+    Args:
+        per_second: Messages of one kind allowed per second, sustained
+        burst: Messages of one kind allowed at once
+        clock: Time source (for tests)
+    """
+
+    def __init__(self, per_second: float = 5.0, burst: int = 20, clock: Callable[[], float] = time.monotonic):
+        self.per_second = per_second
+        self.burst = burst
+        self.clock = clock
+        self.min_level_no = 0  # Set by configure_logging; lower levels are skipped outright
+        self._buckets: Dict[str, List[float]] = {}  # key -> [tokens, updated_at, suppressed]
+        self._level_nos: Dict[str, int] = {}
+
+    def allow(self, key: str) -> bool:
+        """Take a token for ``key``; False (and counted) if none is left."""
+        now = self.clock()
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = [float(self.burst), now, 0]
+        else:
+            bucket[0] = min(bucket[0] + (now - bucket[1]) * self.per_second, float(self.burst))
+            bucket[1] = now
+        if bucket[0] < 1.0:
+            bucket[2] += 1
+            return False
+        bucket[0] -= 1.0
+        return True
+
+    def suppressed(self, key: str) -> int:
+        """Messages of ``key`` dropped since the last one emitted."""
+        bucket = self._buckets.get(key)
+        return int(bucket[2]) if bucket else 0
+
+    def log(self, key: str, level: str, message: str, *args: Callable[[], Any]) -> None:
+        """Log ``message`` unless its level is disabled or ``key`` is over its rate.
+
+        ``args`` are zero-argument callables whose results fill the ``{}``
+        placeholders; they are only called when the message is emitted.
+        """
+        level_no = self._level_nos.get(level)
+        if level_no is None:
+            level_no = self._level_nos[level] = logger.level(level).no
+        if level_no < self.min_level_no or not self.allow(key):
+            return
+        bucket = self._buckets[key]
+        suppressed, bucket[2] = int(bucket[2]), 0
+        if suppressed:
+            message += f" (+{suppressed} similar suppressed)"
+        logger.opt(lazy=True, depth=1).bind(sampled=key, suppressed=suppressed).log(level, message, *args)
+
+
+# Global sampler for per-item messages
+log_sampler = LogSampler(per_second=settings.log_sample_per_second, burst=settings.log_sample_burst)
@@ -1,30 +1,68 @@
 """Main FastAPI application for AI Streamer."""
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect
+from fastapi import FastAPI, WebSocket, Request, HTTPException, Query
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, PlainTextResponse, JSONResponse, StreamingResponse, Response
+from pydantic import BaseModel
 from loguru import logger
-import sys
 import asyncio
-from typing import Optional
+import json
+import secrets
+import threading
+import time
+from datetime import datetime
+from typing import Dict, List, Optional, Set, Tuple, Union
 import os
 
 from config import settings
 from state import global_state, AudioItem
+from visemes import VisemeTrack
 from ai_service import ai_service
+from reservoir import script_reservoir
+from metrics import metrics
+from tracing import tracer, KIND_CLIENT, KIND_SERVER
+from profiler import profiler, TaskNamingMiddleware
+from filler import filler_pool
+from jobs import Job, job_manager, format_sse
+from audio import SUPPORTED_SAMPLE_RATES, SAMPLE_WIDTH, resample_pcm, pcm_duration_ms
+from downloader import DownloadError
+from broadcaster import (
+    broadcaster, ClientConnection, DISCONNECTED, WIRE_FORMATS, FORMAT_JSON, Payload, encode_audio, serialize_message,
+)
+from hls import hls_segmenter, parse_range
+from schedule import Slot, show_scheduler
+from health import upstream_health
+from replay import replay_history
+from singleflight import SingleFlight
+from llm_cache import normalize_topic
+from capture import CaptureMiddleware, traffic_recorder
+from logs import configure_logging, item_context, log_sampler
 
-# Track if auto-refill is in progress to avoid concurrent refills
-_refill_in_progress = False
+# Background refill task started on underrun, and when it was started
+_refill_task: Optional[asyncio.Task] = None
+_refill_started_at = 0.0
 
+# Keep references to fire-and-forget tasks so they aren't garbage collected
+_background_tasks = set()
+
+# Shared playout loop, running while clients are connected
+_playout_task: Optional[asyncio.Task] = None
+
+# Item airing right now and when it started (time.monotonic()), for late joiners
+_now_playing: Optional[Tuple[AudioItem, float]] = None
+
+# Joining clients get the rest of the current item only if at least this much is left
+LIVE_JOIN_MIN_REMAINING_MS = 200
+
+# In-flight resampling jobs, keyed by (id(item), sample_rate)
+_variant_jobs: Dict[tuple, asyncio.Future] = {}
+
+# Concurrent syntheses of the same line, keyed by (topic, epoch, text)
+synthesis_flight = SingleFlight("synthesis")
 
-# Configure loguru
-logger.remove()
-logger.add(
-    sys.stderr,
-    format="<green>{time:YYYY-MM-DD HH:mm:ss}</green> | <level>{level: <8}</level> | <cyan>{name}</cyan>:<cyan>{function}</cyan>:<cyan>{line}</cyan> - <level>{message}</level>",
-    level=settings.log_level,
-    colorize=True,
-)
+
+# Configure loguru: enqueued sink, text or JSON lines (see logs.py)
+configure_logging(settings.log_level, settings.log_format, settings.log_enqueue)
 
 
 # Create FastAPI app
@@ -43,6 +81,12 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Name request tasks after their route so CPU profiles can attribute them
+app.add_middleware(TaskNamingMiddleware)
+
+# Record API calls and WebSocket sessions while a traffic capture runs
+app.add_middleware(CaptureMiddleware)
+
 # Mount static files
 static_dir = os.path.join(os.path.dirname(__file__), "static")
 if os.path.exists(static_dir):
@@ -55,12 +99,22 @@ async def startup_event():
     logger.info("🚀 AI Streamer starting up...")
     logger.info(f"📡 Server will run on {settings.host}:{settings.port}")
     logger.info(f"🔧 Debug mode: {settings.debug}")
+    if settings.capture_path:
+        traffic_recorder.start(settings.capture_path, providers={
+            "llm": [[provider.name, provider.cost] for provider in ai_service.llm.providers],
+            "tts": [[provider.name, provider.cost] for provider in ai_service.tts.providers],
+        })
 
 
 @app.on_event("shutdown")
 async def shutdown_event():
     """Cleanup on shutdown."""
     logger.info("👋 AI Streamer shutting down...")
+    stop_playout()
+    show_scheduler.stop()
+    tracer.shutdown()
+    traffic_recorder.stop()
+    await logger.complete()
 
 
 @app.get("/")
@@ -93,60 +147,41 @@ async def health_check():
     }
 
 
-@app.post("/api/start_stream")
+@app.post("/api/start_stream", status_code=202)
 async def start_stream(topic: str):
     """Start the streaming with a given topic.
     
-    This endpoint will:
-    1. Generate marketing scripts using Qwen-Turbo
+    Returns a job id immediately; a background job will:
+    1. Draw marketing scripts from the topic's reservoir (batched Qwen-Turbo generation)
     2. Convert each script to audio using CosyVoice TTS
-    3. Add audio items to the playlist
+    3. Add each audio item to the playlist as soon as it is ready
+    
+    Progress is available at /api/jobs/{job_id} and as Server-Sent Events
+    at /api/jobs/{job_id}/events.
+    
+    A new topic starts a new epoch: audio queued for the old topic is
+    dropped and its in-flight generation is cancelled (see cancel_stale_work).
+    While a job for the same topic and epoch is running (a repeated call,
+    or an auto-refill), its id is returned instead of starting another.
     """
     try:
-        await global_state.set_topic(topic)
+        dropped = await global_state.switch_topic(topic)
+        epoch = global_state.epoch
         await global_state.set_streaming(True)
+        if dropped is not None:
+            cancel_stale_work(dropped)
         
         logger.info(f"📺 Starting stream with topic: {topic}")
-        
-        # Step 1: Generate scripts
-        scripts = await ai_service.generate_scripts(topic, count=5)
-        logger.info(f"✅ Generated {len(scripts)} scripts")
-        
-        # Step 2: Convert each script to audio
-        audio_items = []
-        for i, script in enumerate(scripts):
-            try:
-                logger.info(f"🔊 Synthesizing audio {i+1}/{len(scripts)}: {script[:30]}...")
-                tts_result = await ai_service.text_to_speech(script)
-                
-                # Create AudioItem
-                audio_item = AudioItem(
-                    text=script,
-                    audio_data=tts_result["audio_data"],
-                    visemes=tts_result["visemes"],
-                    duration_ms=tts_result["duration_ms"],
-                    created_at=None,  # Will be set by __post_init__
-                )
-                audio_items.append(audio_item)
-                
-            except Exception as e:
-                logger.error(f"❌ Failed to synthesize audio for script {i+1}: {e}")
-                # Skip failed items, continue with others
-                continue
-        
-        # Step 3: Add all audio items to playlist
-        if audio_items:
-            await global_state.add_batch_to_playlist(audio_items)
-            logger.info(f"✅ Added {len(audio_items)} audio items to playlist")
-        else:
-            logger.warning("⚠️ No audio items were generated")
+        job = job_manager.start(
+            topic, _start_stream_job, kind="start_stream", epoch=epoch, flight_key=generation_key(topic, epoch),
+        )
         
         return {
             "status": "started",
             "topic": topic,
-            "scripts_generated": len(scripts),
-            "audio_items_created": len(audio_items),
-            "playlist_size": await global_state.get_playlist_size(),
+            "job_id": job.id,
+            "status_url": f"/api/jobs/{job.id}",
+            "events_url": f"/api/jobs/{job.id}/events",
             "message": "Stream started. Connect to /ws/stream to receive audio."
         }
         
@@ -160,6 +195,244 @@ async def start_stream(topic: str):
         }
 
 
+def generation_key(topic: str, epoch: int) -> Tuple[str, int]:
+    """Single-flight key of a generation job for a topic epoch."""
+    return normalize_topic(topic), epoch
+
+
+def cancel_stale_work(dropped: List[AudioItem]) -> None:
+    """Stop work still running for earlier topic epochs.
+    
+    Cancels their generation jobs (an auto-refill's included), the downloads
+    of dropped streamed items and any filler refresh for the old topic.
+    """
+    global _refill_started_at
+    
+    epoch = global_state.epoch
+    jobs = job_manager.cancel_stale(epoch)
+    downloads = 0
+    for item in dropped:
+        if item.stream is not None and not item.stream.done:
+            item.stream.cancel()
+            downloads += 1
+    for task in list(_background_tasks):
+        if task.get_name() == "refresh_filler_pool":
+            task.cancel()
+    _refill_started_at = 0.0  # Let the new topic refill right away
+    if dropped or jobs:
+        logger.info(
+            f"🔀 Topic epoch {epoch}: dropped {len(dropped)} queued items, "
+            f"cancelled {jobs} jobs and {downloads} downloads"
+        )
+
+
+async def _start_stream_job(job: Job) -> None:
+    """Background part of start_stream."""
+    try:
+        enqueued = await run_generation_pipeline(job)
+    except Exception:
+        await global_state.set_streaming(False)
+        raise
+    if enqueued:
+        await maybe_refresh_fillers()
+    else:
+        logger.warning("⚠️ No audio items were generated")
+
+
+async def run_generation_pipeline(job: Job) -> int:
+    """Draw scripts for the job's topic, synthesize them and enqueue each item.
+    
+    Items are added to the playlist one by one as soon as their audio is
+    ready, so playback can start while the rest are still synthesizing.
+    Progress is reported as job events.
+    
+    Returns:
+        Number of audio items added to the playlist
+    """
+    topic = job.topic
+    
+    # Step 1: Draw scripts from the topic's reservoir (batched LLM generation)
+    generation_started_at = time.time()
+    drawn = await script_reservoir.take(topic, count=5)
+    generation_ended_ns = time.time_ns()
+    scripts = [script["text"] for script in drawn]
+    logger.info(f"✅ Got {len(scripts)} scripts")
+    job.scripts_generated = len(scripts)
+    job.emit("scripts_generated", count=len(scripts), scripts=scripts, segments=[script["segment"] for script in drawn])
+    
+    # Step 2: Convert each script to audio and enqueue it
+    for i, script in enumerate(scripts):
+        # Hold off synthesizing while the playlist is over its byte/duration budget
+        if not await global_state.wait_for_room(job.epoch):
+            logger.info(f"🔀 Topic changed, dropping the rest of job {job.id}")
+            break
+        
+        # Each item gets its own trace, starting with the shared generation call
+        trace_id = tracer.new_trace_id()
+        item_id = f"{job.id}-{i}"
+        tracer.record_span(
+            "generate_scripts", trace_id, int(generation_started_at * 1e9), generation_ended_ns,
+            kind=KIND_CLIENT, attributes={"topic": topic, "scripts.count": len(scripts), "script.index": i},
+        )
+        try:
+            # While little audio is queued, enqueue the item as soon as its
+            # download starts so it can air before the download completes
+            stream = None
+            early_forward = (
+                settings.stream_early_forward_seconds > 0
+                and await global_state.get_buffered_seconds() < settings.stream_early_forward_seconds
+            )
+            with tracer.trace(trace_id), logger.contextualize(item_id=item_id, trace_id=trace_id):
+                log_sampler.log(
+                    "synthesize_item", "INFO", "🔊 Synthesizing audio {}/{}: {}...",
+                    lambda: i + 1, lambda: len(scripts), lambda: script[:30],
+                )
+                if early_forward:
+                    stream = await ai_service.open_speech_stream(script)
+                    if stream.done:
+                        # Inline audio: nothing left to wait for
+                        tts_result = await ai_service.finish_speech_stream(script, stream)
+                        stream = None
+                    else:
+                        tts_result = {"audio_data": b"", "visemes": [], "duration_ms": 0, "sample_rate": stream.sample_rate}
+                else:
+                    synthesis_started = time.monotonic()
+                    tts_result = await synthesis_flight.do(
+                        (*generation_key(topic, job.epoch), script), lambda: ai_service.text_to_speech(script),
+                    )
+                    show_scheduler.observe_render(time.monotonic() - synthesis_started)
+            
+            # Create AudioItem
+            audio_item = AudioItem(
+                text=script,
+                audio_data=tts_result["audio_data"],
+                visemes=tts_result["visemes"],
+                duration_ms=tts_result["duration_ms"],
+                created_at=None,  # Will be set by __post_init__
+                generation_started_at=generation_started_at,
+                trace_id=trace_id,
+                sample_rate=tts_result["sample_rate"],
+                stream=stream,
+                epoch=job.epoch,
+                item_id=item_id,
+            )
+            
+        except Exception as e:
+            logger.bind(item_id=item_id, trace_id=trace_id).error(f"❌ Failed to synthesize audio for script {i+1}: {e}")
+            metrics.tts_failures_skipped.inc()
+            job.items_failed += 1
+            job.emit("item_failed", index=i, error=str(e))
+            if upstream_health.degraded:
+                # Don't spend calls on the rest of the batch during an outage
+                logger.warning(f"🩺 Upstream degraded, dropping the rest of job {job.id}")
+                break
+            # Skip failed items, continue with others
+            continue
+        
+        job.emit("audio_ready", index=i, text=script, duration_ms=audio_item.duration_ms, streaming=stream is not None)
+        
+        # Step 3: Add the item to the playlist right away
+        if not await global_state.add_to_playlist(audio_item):
+            logger.info(f"🔀 Topic changed, dropping the rest of job {job.id}")
+            if stream is not None:
+                stream.cancel()
+            break
+        if stream is not None:
+            _spawn_background(_finalize_streamed_item(audio_item), name="finalize_streamed_item")
+        job.items_enqueued += 1
+        job.emit("enqueued", index=i, playlist_size=await global_state.get_playlist_size())
+    
+    logger.info(f"✅ Added {job.items_enqueued} audio items to playlist")
+    return job.items_enqueued
+
+
+class ScheduleSlot(BaseModel):
+    """A calendar slot in PUT /api/schedule."""
+    start: datetime  # ISO 8601 or Unix timestamp
+    topic: str
+    scripts: List[str] = []  # Optional script pack, aired before generated scripts
+
+
+class ScheduleRequest(BaseModel):
+    slots: List[ScheduleSlot]
+
+
+@app.put("/api/schedule")
+async def put_schedule(request: ScheduleRequest):
+    """Replace the topic calendar.
+    
+    Each slot's topic goes on air at its start time. Its opening items are
+    rendered ahead of time (see schedule.py), so the switch happens at an
+    item boundary without the cold generation gap of /api/start_stream.
+    """
+    for slot in request.slots:
+        if not slot.topic.strip():
+            raise HTTPException(status_code=422, detail="Slot topic must not be empty")
+    show_scheduler.set_slots([Slot(slot.start.timestamp(), slot.topic, slot.scripts) for slot in request.slots])
+    show_scheduler.start(start_scheduled_slot)
+    logger.info(f"🗓️ Calendar set with {len(show_scheduler.slots)} slots")
+    return show_scheduler.status()
+
+
+@app.get("/api/schedule")
+async def get_schedule():
+    """The upcoming calendar slots and the pre-rendering state."""
+    return show_scheduler.status()
+
+
+@app.delete("/api/schedule")
+async def delete_schedule():
+    """Clear the calendar."""
+    show_scheduler.set_slots([])
+    return show_scheduler.status()
+
+
+async def start_scheduled_slot(slot: Slot, items: List[AudioItem]) -> None:
+    """Switch to a calendar slot, queueing its pre-rendered items ahead of new generation."""
+    result = await start_stream(slot.topic)
+    if result["status"] != "started":
+        return
+    # Ahead of whatever the slot's job (or a running job for the same topic)
+    # has queued already; dropped if the topic changed again meanwhile
+    await global_state.add_epoch_opening(items, job_manager.get(result["job_id"]).epoch)
+
+
+@app.get("/api/jobs/{job_id}")
+async def get_job(job_id: str):
+    """Get the status of a generation job."""
+    job = job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job.to_dict()
+
+
+@app.get("/api/jobs/{job_id}/events")
+async def get_job_events(job_id: str, request: Request):
+    """Stream a job's progress as Server-Sent Events.
+    
+    Past events are replayed first (after Last-Event-ID when reconnecting),
+    and the stream ends with a ``completed`` or ``failed`` event.
+    """
+    job = job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    
+    try:
+        last_event_id = int(request.headers.get("last-event-id", -1))
+    except ValueError:
+        last_event_id = -1
+    
+    async def event_stream():
+        async for entry in job.stream(last_event_id):
+            yield format_sse(entry)
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
 @app.get("/api/status")
 async def get_status():
     """Get current streaming status."""
@@ -167,13 +440,134 @@ async def get_status():
     is_streaming = await global_state.is_currently_streaming()
     topic = await global_state.get_topic()
     
+    buffered_seconds = await global_state.get_buffered_seconds()
+    
     return {
         "is_streaming": is_streaming,
         "playlist_size": playlist_size,
+        "buffered_seconds": buffered_seconds,
         "current_topic": topic,
+        "upstream": upstream_health.status(),
+        "providers": {"llm": ai_service.llm.status(), "tts": ai_service.tts.status()},
+        "replay_items": replay_history.size(topic),
     }
 
 
+@app.get("/metrics")
+async def get_metrics():
+    """Expose pipeline metrics in the Prometheus text format."""
+    return PlainTextResponse(
+        metrics.render(),
+        media_type="text/plain; version=0.0.4; charset=utf-8",
+    )
+
+
+def _require_hls() -> None:
+    if not settings.hls_enabled:
+        raise HTTPException(status_code=404, detail="HLS delivery is disabled")
+
+
+@app.get("/hls/live.m3u8")
+async def hls_playlist():
+    """Rolling HLS playlist of the playout (see hls.py).
+    
+    Requests keep the playout going even with no WebSocket clients.
+    """
+    _require_hls()
+    hls_segmenter.last_request_at = time.monotonic()
+    ensure_playout()
+    return PlainTextResponse(
+        hls_segmenter.playlist(),
+        media_type="application/vnd.apple.mpegurl",
+        headers={"Cache-Control": f"public, max-age={max(int(settings.hls_segment_seconds / 2), 1)}"},
+    )
+
+
+@app.get("/hls/segment_{sequence}.{ext}")
+async def hls_segment(sequence: int, ext: str, request: Request):
+    """Serve a segment's audio (.wav) or sidecar track (.json), with byte ranges.
+    
+    Segments never change, so they are cacheable indefinitely.
+    """
+    _require_hls()
+    segment = hls_segmenter.get(sequence)
+    if segment is None or ext not in ("wav", "json"):
+        raise HTTPException(status_code=404, detail="Segment not found")
+    
+    body, media_type = (segment.audio, "audio/wav") if ext == "wav" else (segment.track, "application/json")
+    etag = f'"{segment.tag}.{ext}"'
+    headers = {"Cache-Control": "public, max-age=86400, immutable", "ETag": etag, "Accept-Ranges": "bytes"}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+    
+    range_header = request.headers.get("range")
+    if range_header:
+        try:
+            start, end = parse_range(range_header, len(body))
+        except ValueError:
+            return Response(status_code=416, headers={"Content-Range": f"bytes */{len(body)}"})
+        headers["Content-Range"] = f"bytes {start}-{end}/{len(body)}"
+        return Response(body[start:end + 1], status_code=206, media_type=media_type, headers=headers)
+    return Response(body, media_type=media_type, headers=headers)
+
+
+def _require_admin(request: Request) -> None:
+    """Allow admin endpoints with the configured token, or from localhost if none is set."""
+    if settings.admin_token:
+        token = request.headers.get("x-admin-token", "")
+        if not secrets.compare_digest(token, settings.admin_token):
+            raise HTTPException(status_code=403, detail="Invalid admin token")
+    elif request.client is None or request.client.host not in ("127.0.0.1", "::1"):
+        raise HTTPException(status_code=403, detail="Set ADMIN_TOKEN to use admin endpoints remotely")
+
+
+@app.get("/admin/profile")
+async def admin_profile(
+    request: Request,
+    seconds: float = 10.0,
+    interval_ms: float = 10.0,
+    format: str = "collapsed",
+):
+    """Run the sampling CPU profiler over the live process.
+    
+    Samples every thread for ``seconds`` (at most ``profile_max_seconds``)
+    and returns either collapsed stacks (``format=collapsed``) or a
+    speedscope document (``format=speedscope``).
+    Event loop samples are grouped by asyncio task, executor samples by thread.
+    """
+    _require_admin(request)
+    if format not in ("collapsed", "speedscope"):
+        raise HTTPException(status_code=400, detail="format must be 'collapsed' or 'speedscope'")
+    if seconds <= 0 or interval_ms <= 0:
+        raise HTTPException(status_code=400, detail="seconds and interval_ms must be positive")
+    if seconds > settings.profile_max_seconds:
+        raise HTTPException(status_code=400, detail=f"seconds must be at most {settings.profile_max_seconds:g}")
+    if profiler.is_running:
+        raise HTTPException(status_code=409, detail="A profiling run is already in progress")
+    
+    logger.info(f"🔬 Profiling for {seconds}s at {interval_ms}ms intervals...")
+    loop = asyncio.get_running_loop()
+    try:
+        result = await loop.run_in_executor(
+            None,
+            profiler.profile,
+            seconds,
+            interval_ms / 1000.0,
+            loop,
+            threading.get_ident(),
+        )
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    logger.info(f"✅ Profile captured: {result.sample_count} samples over {result.duration:.1f}s")
+    
+    if format == "speedscope":
+        return JSONResponse(
+            result.to_speedscope(),
+            headers={"Content-Disposition": 'attachment; filename="profile.speedscope.json"'},
+        )
+    return PlainTextResponse(result.to_collapsed())
+
+
 async def auto_refill_playlist() -> bool:
     """Automatically refill the playlist when it's empty.
     
@@ -181,28 +575,19 @@ async def auto_refill_playlist() -> bool:
     1. Checks if there's a current topic
     2. Generates new scripts using the topic
     3. Converts scripts to audio
-    4. Adds audio items to the playlist
+    4. Adds each audio item to the playlist as soon as it is ready
+    
+    The work runs as an ``auto_refill_playlist`` job, so its progress is
+    visible at /api/jobs/{job_id} like any start_stream job. Concurrent
+    refills, and start_stream calls, for the same topic epoch share one job.
     
     Returns:
         True if refill was successful, False otherwise
     """
-    global _refill_in_progress
-    
-    # Prevent concurrent refills using a lock
-    # Create lock if it doesn't exist (lazy initialization)
-    if not hasattr(auto_refill_playlist, '_lock'):
-        auto_refill_playlist._lock = asyncio.Lock()
-    
-    async with auto_refill_playlist._lock:
-        if _refill_in_progress:
-            logger.debug("⏳ Auto-refill already in progress, skipping...")
-            return False
-        
-        _refill_in_progress = True
-    
     try:
         # Check if we have a topic
         topic = await global_state.get_topic()
+        epoch = global_state.epoch
         if not topic:
             logger.warning("⚠️ No topic set, cannot auto-refill playlist")
             return False
@@ -215,40 +600,14 @@ async def auto_refill_playlist() -> bool:
         
         logger.info(f"🔄 Auto-refilling playlist with topic: {topic}")
         
-        # Step 1: Generate scripts
-        scripts = await ai_service.generate_scripts(topic, count=5)
-        logger.info(f"✅ Generated {len(scripts)} scripts for auto-refill")
-        
-        if not scripts:
-            logger.warning("⚠️ No scripts generated for auto-refill")
-            return False
-        
-        # Step 2: Convert each script to audio
-        audio_items = []
-        for i, script in enumerate(scripts):
-            try:
-                logger.debug(f"🔊 Synthesizing audio {i+1}/{len(scripts)}: {script[:30]}...")
-                tts_result = await ai_service.text_to_speech(script)
-                
-                # Create AudioItem
-                audio_item = AudioItem(
-                    text=script,
-                    audio_data=tts_result["audio_data"],
-                    visemes=tts_result["visemes"],
-                    duration_ms=tts_result["duration_ms"],
-                    created_at=None,  # Will be set by __post_init__
-                )
-                audio_items.append(audio_item)
-                
-            except Exception as e:
-                logger.error(f"❌ Failed to synthesize audio for script {i+1}: {e}")
-                # Skip failed items, continue with others
-                continue
+        job = job_manager.start(
+            topic, run_generation_pipeline, kind="auto_refill_playlist", epoch=epoch,
+            flight_key=generation_key(topic, epoch),
+        )
+        await asyncio.shield(job.task)
         
-        # Step 3: Add all audio items to playlist
-        if audio_items:
-            await global_state.add_batch_to_playlist(audio_items)
-            logger.info(f"✅ Auto-refilled playlist with {len(audio_items)} audio items")
+        if job.items_enqueued:
+            logger.info(f"✅ Auto-refilled playlist with {job.items_enqueued} audio items")
             return True
         else:
             logger.warning("⚠️ No audio items were generated for auto-refill")
@@ -257,110 +616,481 @@ async def auto_refill_playlist() -> bool:
     except Exception as e:
         logger.error(f"❌ Error in auto-refill: {e}")
         return False
+
+
+def _spawn_background(coro, name: str) -> asyncio.Task:
+    """Run a coroutine in the background, keeping a reference until it finishes."""
+    task = asyncio.create_task(coro, name=name)
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+    return task
+
+
+def trigger_refill() -> bool:
+    """Start a background auto-refill unless one is running or was just tried.
+    
+    Returns:
+        True if a new refill task was started
+    """
+    global _refill_task, _refill_started_at
+    
+    if _refill_task is not None and not _refill_task.done():
+        return False
+    if job_manager.has_active_jobs():
+        return False  # Content for the current topic is already on its way
+    if time.monotonic() - _refill_started_at < settings.refill_retry_seconds:
+        return False
+    if not upstream_health.probe_due():
+        return False  # Degraded: only an occasional refill probes upstream
+    
+    _refill_started_at = time.monotonic()
+    _refill_task = _spawn_background(auto_refill_playlist(), name="auto_refill_playlist")
+    return True
+
+
+async def maybe_refresh_fillers() -> None:
+    """Refresh the filler pool in the background while the playlist is healthy."""
+    if not settings.filler_enabled or filler_pool.is_refreshing or upstream_health.degraded:
+        return
+    if _refill_task is not None and not _refill_task.done():
+        return  # Don't compete with a refill for upstream capacity
+    if await global_state.get_buffered_seconds() < settings.filler_quiet_buffer_seconds:
+        return
+    
+    topic = await global_state.get_topic()
+    if filler_pool.needs_refresh(topic):
+        _spawn_background(filler_pool.refresh(topic), name="refresh_filler_pool")
+
+
+async def ensure_audio_variant(item: AudioItem, sample_rate: Optional[int]) -> None:
+    """Resample an item to ``sample_rate`` once and cache it on the item.
+    
+    Resampling runs in a worker thread; concurrent requests for the same
+    variant wait for the same job.
+    """
+    if sample_rate is None or sample_rate == item.sample_rate or sample_rate in item.variants:
+        return
+    
+    key = (id(item), sample_rate)
+    job = _variant_jobs.get(key)
+    if job is not None:
+        await job
+        return
+    
+    loop = asyncio.get_running_loop()
+    job = loop.run_in_executor(None, resample_pcm, item.audio_data, item.sample_rate, sample_rate)
+    _variant_jobs[key] = job
+    try:
+        item.variants[sample_rate] = await job
     finally:
-        _refill_in_progress = False
+        _variant_jobs.pop(key, None)
 
 
-@app.websocket("/ws/stream")
-async def websocket_stream(websocket: WebSocket):
-    """WebSocket endpoint for streaming audio to clients.
+async def complete_streamed_item(item: AudioItem) -> None:
+    """Wait for a streamed item's download and fill in its audio, duration and visemes.
     
-    This will continuously send audio chunks from the playlist.
-    When playlist is empty, it will automatically trigger refill to generate new content.
+    Safe to call more than once; raises DownloadError if the download failed.
     """
-    await websocket.accept()
-    logger.info("🔌 WebSocket client connected")
+    if item.stream is None or item.audio_data:
+        return
+    result = await ai_service.finish_speech_stream(item.text, item.stream)
+    if item.audio_data:
+        return  # Completed by a concurrent caller
+    visemes = VisemeTrack.from_dicts(result["visemes"])
+    await global_state.complete_item(item, result["audio_data"], visemes, result["duration_ms"])
+
+
+async def _finalize_streamed_item(item: AudioItem) -> None:
+    """Background part of enqueueing a streamed item."""
+    try:
+        await complete_streamed_item(item)
+    except DownloadError as e:
+        if item.epoch is not None and item.epoch != global_state.epoch:
+            logger.debug(f"🔀 Dropped download for an old topic: {e}")
+            return
+        logger.error(f"❌ Audio download failed for streamed item: {e}")
+        metrics.tts_failures_skipped.inc()
+
+
+def observe_topic_switch(item: AudioItem) -> None:
+    """Report the topic switch latency when the first item of a new epoch airs."""
+    elapsed = global_state.first_audio_after_switch(item)
+    if elapsed is not None:
+        metrics.topic_switch_first_audio.observe(elapsed)
+        logger.info(f"🔀 First audio for topic epoch {item.epoch} after {elapsed:.2f}s")
+
+
+async def air_streamed_item(item: AudioItem) -> None:
+    """Air an item whose audio is still downloading, chunk by chunk as it arrives.
     
-    # Track consecutive empty checks to avoid too frequent refill attempts
+    Each message carries at least ``stream_chunk_ms`` of audio (the last one
+    may be shorter) and is paced in real time like whole items. Visemes
+    aren't known until the download completes, so chunks carry none.
+    
+    Raises:
+        DownloadError: If the download failed
+        asyncio.TimeoutError: If the download stalled
+    """
+    with item_context(item):
+        min_bytes = int(item.sample_rate * settings.stream_chunk_ms / 1000) * SAMPLE_WIDTH
+        chunk_index = 0
+        async for pcm in item.stream.chunks(min_bytes, timeout=settings.download_timeout_seconds):
+            duration_ms = pcm_duration_ms(pcm, item.sample_rate)
+            if settings.hls_enabled:
+                hls_pcm = pcm
+                if item.sample_rate != hls_segmenter.sample_rate:
+                    hls_pcm = await asyncio.get_running_loop().run_in_executor(
+                        None, resample_pcm, pcm, item.sample_rate, hls_segmenter.sample_rate,
+                    )
+                hls_segmenter.add_audio(hls_pcm, hls_segmenter.sample_rate, item.text)
+            header = {
+                "type": "audio_chunk",
+                "text": item.text,
+                "sample_rate": item.sample_rate,
+                "visemes": [],
+                "duration_ms": duration_ms,
+                "timestamp": item.created_at_iso,
+                "is_filler": item.is_filler,
+                "chunk_index": chunk_index,
+            }
+            build = lambda rate, wire_format: encode_audio(header, pcm, wire_format)
+            if chunk_index == 0:
+                attributes = {"streamed": True, "clients": len(broadcaster.clients)}
+                with tracer.span("ws.send", trace_id=item.trace_id, kind=KIND_SERVER, attributes=attributes) as span:
+                    span.set_attribute("bytes", broadcaster.publish(build))
+                started_at = item.generation_started_at or item.created_at
+                metrics.item_end_to_end.observe(time.time() - started_at)
+                observe_topic_switch(item)
+            else:
+                broadcaster.publish(build)
+            chunk_index += 1
+            await asyncio.sleep(duration_ms / 1000.0)
+        log_sampler.log("sent_streamed", "DEBUG", "📤 Sent streamed audio in {} chunks: {}...", lambda: chunk_index, lambda: item.text[:50])
+
+
+def audio_message_parts(item: AudioItem, sample_rate: Optional[int] = None, offset_ms: int = 0) -> Tuple[Dict, Union[bytes, memoryview]]:
+    """The fields and PCM of the message sent to WebSocket clients for an audio item.
+    
+    The cached ``sample_rate`` variant is used when available (see
+    ensure_audio_variant). With ``offset_ms``, only the audio from that
+    point on is sent (for clients joining mid-item): the PCM is sliced
+    without copying and the visemes are cut and shifted to match.
+    """
+    if sample_rate in item.variants:
+        audio_data = item.variants[sample_rate]
+    else:
+        audio_data, sample_rate = item.audio_data, item.sample_rate
+    if not offset_ms:
+        return {
+            "type": "audio_chunk",
+            "text": item.text,
+            "sample_rate": sample_rate,
+            "visemes": item.visemes.to_dicts(),
+            "duration_ms": item.duration_ms,
+            "timestamp": item.created_at_iso,
+            "is_filler": item.is_filler,
+        }, audio_data
+    
+    remainder = memoryview(audio_data)[int(sample_rate * offset_ms / 1000) * SAMPLE_WIDTH:]
+    return {
+        "type": "audio_chunk",
+        "text": item.text,
+        "sample_rate": sample_rate,
+        "visemes": item.visemes.sliced(offset_ms / 1000.0).to_dicts(),
+        "duration_ms": pcm_duration_ms(remainder, sample_rate),
+        "timestamp": item.created_at_iso,
+        "is_filler": item.is_filler,
+        "offset_ms": offset_ms,
+    }, remainder
+
+
+def build_audio_message(item: AudioItem, sample_rate: Optional[int] = None, offset_ms: int = 0) -> Dict:
+    """Build the JSON message sent to WebSocket clients for an audio item.
+    
+    Format: JSON with audio data (hex encoded) and visemes; see
+    audio_message_parts for ``sample_rate`` and ``offset_ms``.
+    """
+    header, pcm = audio_message_parts(item, sample_rate, offset_ms)
+    return {**header, "audio_data": pcm.hex()}  # Convert bytes to hex string for JSON
+
+
+def _frame_key(item: AudioItem, sample_rate: Optional[int], wire_format: str) -> Tuple[int, str]:
+    """Key of ``item.frames``; clients at the native rate share frames whether or not they asked for it."""
+    return (sample_rate if sample_rate in item.variants else item.sample_rate), wire_format
+
+
+def encode_item_frames(item: AudioItem, keys: Set[Tuple[int, str]]) -> Dict[Tuple[int, str], Payload]:
+    """Encode an item's message once per (sample rate, wire format)."""
+    frames = {}
+    for sample_rate, wire_format in keys:
+        frames[sample_rate, wire_format] = encode_audio(*audio_message_parts(item, sample_rate), wire_format)
+    return frames
+
+
+def get_wire_frame(item: AudioItem, sample_rate: Optional[int], wire_format: str) -> Payload:
+    """The item's cached frame for a client, encoding it here if the client joined after ensure_wire_frames."""
+    key = _frame_key(item, sample_rate, wire_format)
+    frame = item.frames.get(key)
+    if frame is None:
+        frame = item.frames[key] = encode_audio(*audio_message_parts(item, key[0]), wire_format)
+    return frame
+
+
+async def ensure_wire_frames(item: AudioItem) -> None:
+    """Encode the item for every connected client's rate and format, and cache it on the item.
+    
+    Encoding (hex, visemes, JSON) runs in a worker thread; fan-out then
+    queues the prebuilt payloads. Filler clips keep their frames, so a clip
+    that airs again is not encoded again.
+    """
+    keys = {_frame_key(item, rate, wire_format) for rate, wire_format in broadcaster.wire_keys()}
+    missing = keys - item.frames.keys()
+    if not missing:
+        return
+    loop = asyncio.get_running_loop()
+    item.frames.update(await loop.run_in_executor(None, encode_item_frames, item, missing))
+
+
+async def join_live(client: ClientConnection) -> None:
+    """Add a client to the broadcast, starting with the rest of the item airing now.
+    
+    The current item is sliced at the live playout position, so a late
+    viewer hears the same moment as everyone else instead of waiting for
+    the next item.
+    """
+    while _now_playing is not None:
+        item, started_at = _now_playing
+        if client.sample_rate not in (None, item.sample_rate) and client.sample_rate not in item.variants:
+            await ensure_audio_variant(item, client.sample_rate)
+            continue  # The live item may have moved on meanwhile
+        offset_ms = int((time.monotonic() - started_at) * 1000)
+        if item.duration_ms - offset_ms >= LIVE_JOIN_MIN_REMAINING_MS:
+            client.send(encode_audio(*audio_message_parts(item, client.sample_rate, offset_ms), client.wire_format))
+            logger.opt(lazy=True).debug("⏩ Joined {}ms into: {}...", lambda: offset_ms, lambda: item.text[:50])
+        break
+    # No await since the join message, so the next item can't overtake it
+    broadcaster.add(client)
+
+
+async def air_item(item: AudioItem) -> None:
+    """Send a whole item to every connected client, at each client's sample rate, and to the HLS timeline."""
+    with item_context(item):
+        rates = broadcaster.sample_rates() | ({hls_segmenter.sample_rate} if settings.hls_enabled else set())
+        await asyncio.gather(*(ensure_audio_variant(item, rate) for rate in rates))
+        await ensure_wire_frames(item)
+        if settings.hls_enabled:
+            pcm = item.variants.get(hls_segmenter.sample_rate, item.audio_data)
+            hls_segmenter.add_audio(pcm, hls_segmenter.sample_rate, item.text, item.visemes, item.is_filler)
+        build = lambda rate, wire_format: get_wire_frame(item, rate, wire_format)
+        if item.is_filler:
+            broadcaster.publish(build)
+            log_sampler.log("sent_filler", "DEBUG", "🧩 Sent filler clip: {}...", lambda: item.text[:50])
+            return
+        
+        with tracer.span("ws.send", trace_id=item.trace_id, kind=KIND_SERVER, attributes={"clients": len(broadcaster.clients)}) as span:
+            span.set_attribute("bytes", broadcaster.publish(build))
+        log_sampler.log("sent_item", "DEBUG", "📤 Sent audio chunk: {}...", lambda: item.text[:50])
+        started_at = item.generation_started_at or item.created_at
+        metrics.item_end_to_end.observe(time.time() - started_at)
+        observe_topic_switch(item)
+
+
+async def playout_loop() -> None:
+    """Air the playlist to every connected client, in order and in real time.
+    
+    There is one playout shared by all clients; it runs while at least one
+    is connected, or HLS viewers are polling the playlist. When the playlist is empty it triggers a refill and covers
+    the gap with pre-synthesized filler clips until real content arrives;
+    while upstream is degraded it loops recently aired items instead.
+    Every aired item is recorded in the replay history.
+    """
+    global _now_playing
+    
+    # Track consecutive empty checks so each underrun is reported once
     empty_check_count = 0
-    max_empty_checks_before_refill = 2  # Wait 2 checks (2 seconds) before refilling
     
-    try:
-        while True:
+    while broadcaster.clients or hls_watched():
+        try:
             # Pop audio item from playlist
             item = await global_state.pop_from_playlist()
             
             if item is None:
                 # Playlist is empty
                 empty_check_count += 1
-                playlist_size = await global_state.get_playlist_size()
+                is_streaming = await global_state.is_currently_streaming()
+                if not is_streaming:
+                    # Streaming is not active, just wait
+                    logger.debug("⏸️ Streaming not active, waiting...")
+                    if settings.hls_enabled:
+                        hls_segmenter.add_silence(1000)
+                    await asyncio.sleep(1)
+                    continue
                 
-                # Check if we should trigger auto-refill
-                if empty_check_count >= max_empty_checks_before_refill:
-                    # Check if streaming is still active
-                    is_streaming = await global_state.is_currently_streaming()
-                    if is_streaming:
-                        logger.info("📭 Playlist empty, triggering auto-refill...")
-                        
-                        # Send a status message to client
-                        status_message = {
-                            "type": "status",
-                            "message": "Playlist empty, generating new content...",
-                            "status": "refilling"
-                        }
-                        try:
-                            await websocket.send_json(status_message)
-                        except:
-                            pass  # Client may have disconnected
-                        
-                        # Trigger auto-refill in background
-                        # Don't await it to avoid blocking the loop
-                        refill_task = asyncio.create_task(auto_refill_playlist())
-                        
-                        # Wait a bit for refill to complete, but don't block too long
-                        try:
-                            await asyncio.wait_for(refill_task, timeout=30.0)
-                            if refill_task.result():
-                                logger.info("✅ Auto-refill completed successfully")
-                                empty_check_count = 0  # Reset counter
-                            else:
-                                logger.warning("⚠️ Auto-refill completed but no items were added")
-                        except asyncio.TimeoutError:
-                            logger.warning("⏱️ Auto-refill timed out, continuing...")
-                        except Exception as e:
-                            logger.error(f"❌ Auto-refill error: {e}")
+                # Count the transition into an empty playlist as one underrun
+                if empty_check_count == 1:
+                    metrics.underruns.inc()
+                    logger.info("📭 Playlist empty, triggering auto-refill...")
+                    
+                    # Send a status message to clients
+                    if upstream_health.degraded:
+                        status = {"message": "Content service unavailable, replaying recent content...", "status": "degraded"}
                     else:
-                        # Streaming is not active, just wait
-                        logger.debug("⏸️ Streaming not active, waiting...")
+                        status = {"message": "Playlist empty, generating new content...", "status": "refilling"}
+                    status_message = serialize_message({"type": "status", **status})
+                    broadcaster.publish(lambda rate, wire_format: status_message)
+                
+                # Refill in the background; the loop hands back to real content
+                # as soon as it lands in the playlist
+                trigger_refill()
+                
+                # Cover the gap instead of going silent: loop recently aired
+                # items while upstream is down, filler clips otherwise
+                topic = await global_state.get_topic()
+                filler = None
+                if settings.replay_enabled and upstream_health.degraded:
+                    filler = replay_history.next_item(topic)
+                    if filler is not None:
+                        metrics.replayed_items.inc()
+                if filler is None and settings.filler_enabled:
+                    filler = filler_pool.next_filler(topic)
+                    if filler is not None:
+                        metrics.filler_clips_played.inc()
+                if filler is not None:
+                    await air_item(filler)
+                    _now_playing = (filler, time.monotonic())
+                    await asyncio.sleep(filler.duration_ms / 1000.0)
+                    _now_playing = None
+                    continue
                 
                 # Wait before checking again
+                if settings.hls_enabled:
+                    hls_segmenter.add_silence(1000)
                 await asyncio.sleep(1)
                 continue
             
             # Reset empty check counter when we get an item
             empty_check_count = 0
             
-            # Send audio data to client
-            # Format: JSON with audio data and visemes
-            message = {
-                "type": "audio_chunk",
-                "text": item.text,
-                "audio_data": item.audio_data.hex(),  # Convert bytes to hex string for JSON
-                "visemes": item.visemes,
-                "duration_ms": item.duration_ms,
-                "timestamp": item.created_at.isoformat(),
-            }
+            if item.stream is not None and not item.audio_data:
+                try:
+                    if broadcaster.sample_rates() <= {None, item.sample_rate}:
+                        # Air the item while its audio is still downloading
+                        await air_streamed_item(item)
+                        await record_aired(item)  # Kept if its download has completed
+                        await maybe_refresh_fillers()
+                        continue
+                    await complete_streamed_item(item)  # Resampling needs the whole clip
+                except (DownloadError, asyncio.TimeoutError) as e:
+                    logger.error(f"❌ Skipping item whose audio failed to download: {e}")
+                    continue
             
-            try:
-                await websocket.send_json(message)
-                logger.debug(f"📤 Sent audio chunk: {item.text[:50]}...")
-            except Exception as e:
-                logger.error(f"❌ Failed to send audio chunk: {e}")
-                # Put the item back in the playlist if send failed
-                await global_state.add_to_playlist(item)
-                break  # Exit loop on send failure
+            await air_item(item)
+            _now_playing = (item, time.monotonic())
+            await record_aired(item)
             
-            # Wait for the duration of the audio before sending next chunk
+            # Top up filler clips while there's plenty of audio queued
+            await maybe_refresh_fillers()
+            
+            # Wait for the duration of the audio before sending the next item
             # This simulates real-time playback
-            await asyncio.sleep(item.duration_ms / 1000.0)
+            await asyncio.sleep(max(item.duration_ms / 1000.0 - (time.monotonic() - _now_playing[1]), 0.0))
+            _now_playing = None
             
-    except WebSocketDisconnect:
-        logger.info("🔌 WebSocket client disconnected")
-    except Exception as e:
-        logger.error(f"❌ WebSocket error: {e}")
+        except Exception as e:
+            logger.error(f"❌ Playout error: {e}")
+            _now_playing = None
+            await asyncio.sleep(1)
+
+
+async def record_aired(item: AudioItem) -> None:
+    """Keep an aired item for replay while upstream is degraded."""
+    if settings.replay_enabled:
+        replay_history.record(await global_state.get_topic(), item)
+
+
+def hls_watched() -> bool:
+    """Whether HLS viewers are following the playout."""
+    return settings.hls_enabled and hls_segmenter.is_watched(settings.hls_idle_seconds)
+
+
+def ensure_playout() -> None:
+    """Start the playout loop unless it is already running on this event loop."""
+    global _playout_task
+    
+    loop = asyncio.get_running_loop()
+    if _playout_task is not None and not _playout_task.done() and _playout_task.get_loop() is loop:
+        return
+    _playout_task = _spawn_background(playout_loop(), name="playout_loop")
+
+
+def stop_playout() -> None:
+    """Stop the playout loop (when the last client leaves)."""
+    global _now_playing
+    
+    _now_playing = None
+    if _playout_task is not None and not _playout_task.done() and _playout_task.get_loop() is asyncio.get_running_loop():
+        _playout_task.cancel()
+
+
+@app.websocket("/ws/stream")
+async def websocket_stream(
+    websocket: WebSocket,
+    sample_rate: Optional[int] = None,
+    wire_format: str = Query(FORMAT_JSON, alias="format"),
+):
+    """WebSocket endpoint for streaming audio to clients.
+    
+    Every client hears the same playout (see playout_loop), which refills
+    the playlist automatically and covers empty stretches with filler clips.
+    A client joining mid-item starts at the live position (see join_live).
+    Each client has its own bounded send queue and ping/pong heartbeat
+    (see broadcaster.py), so a slow or dead client never holds up the others
+    or changes the order content plays in.
+    
+    Clients may pass ``?sample_rate=`` (one of SUPPORTED_SAMPLE_RATES) to
+    receive audio resampled to that rate, and ``?format=binary`` to receive
+    audio as binary frames (see broadcaster.encode_audio).
+    """
+    if sample_rate is not None and sample_rate not in SUPPORTED_SAMPLE_RATES:
+        logger.warning(f"⚠️ Rejecting WebSocket client with unsupported sample rate: {sample_rate}")
+        await websocket.close(code=1008, reason=f"Unsupported sample_rate, use one of {SUPPORTED_SAMPLE_RATES}")
+        return
+    if wire_format not in WIRE_FORMATS:
+        logger.warning(f"⚠️ Rejecting WebSocket client with unsupported format: {wire_format}")
+        await websocket.close(code=1008, reason=f"Unsupported format, use one of {WIRE_FORMATS}")
+        return
+    
+    await websocket.accept()
+    client_id = f"{websocket.client.host}:{websocket.client.port}" if websocket.client else "unknown"
+    client = ClientConnection(
+        websocket,
+        client_id,
+        sample_rate,
+        wire_format,
+        max_queue=settings.ws_send_queue_size,
+        send_timeout=settings.ws_send_timeout_seconds,
+        ping_interval=settings.ws_ping_interval_seconds,
+        ping_timeout=settings.ws_ping_timeout_seconds,
+    )
+    logger.info("🔌 WebSocket client connected")
+    metrics.connected_clients.inc()
+    
+    try:
+        await join_live(client)
+        ensure_playout()
+        reason = await client.run()
+    finally:
+        broadcaster.remove(client)
+        metrics.connected_clients.dec()
+        if not broadcaster.clients and not hls_watched():
+            stop_playout()
+    
+    logger.info(f"🔌 WebSocket client disconnected ({reason})")
+    if reason != DISCONNECTED:
+        # Dead or stalled peer: don't wait long for the close handshake
         try:
-            await websocket.close()
-        except:
+            await asyncio.wait_for(websocket.close(code=1001), timeout=1.0)
+        except Exception:
             pass
 
 
@@ -0,0 +1,359 @@
+"""Prometheus-style metrics for the generation and playout pipeline.
+
+A small, dependency-free implementation of counters, gauges and histograms
+rendered in the Prometheus text exposition format (version 0.0.4).
+"""
+from typing import Dict, Iterable, List, Optional, Tuple
+from contextlib import contextmanager
+import threading
+import time
+
+
+LabelValues = Tuple[str, ...]
+
+# Latency buckets in seconds, spanning fast cache hits to slow upstream calls
+DEFAULT_LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _escape_label_value(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labelnames: Iterable[str], labelvalues: Iterable[str], extra: str = "") -> str:
+    pairs = [
+        f'{name}="{_escape_label_value(str(value))}"'
+        for name, value in zip(labelnames, labelvalues)
+    ]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class _Metric:
+    """Base class holding one value series per label combination."""
+
+    metric_type = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        # Values may be updated from executor threads as well as the event loop
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> LabelValues:
+        if not labels and not self.labelnames:
+            return ()  # Fast path for unlabelled metrics updated on every enqueue/pop
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def render(self) -> List[str]:
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.metric_type}",
+        ]
+        lines.extend(self._render_samples())
+        return lines
+
+    def _render_samples(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    """Monotonically increasing counter."""
+
+    metric_type = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[LabelValues, float] = {} if labelnames else {(): 0.0}
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        """Increment the counter by a non-negative amount."""
+        if amount < 0:
+            raise ValueError("Counters can only be incremented")
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def get(self, **labels: str) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels), 0.0)
+
+    def _render_samples(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return [
+            f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+            for key, value in items
+        ]
+
+
+class Gauge(_Metric):
+    """Value that can go up and down."""
+
+    metric_type = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[LabelValues, float] = {} if labelnames else {(): 0.0}
+
+    def set(self, value: float, **labels: str) -> None:
+        if not labels and not self.labelnames:
+            self._values[()] = float(value)  # Replacing an existing key is atomic; skip the lock
+            return
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = float(value)
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, **labels: str) -> None:
+        self.inc(-amount, **labels)
+
+    def get(self, **labels: str) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels), 0.0)
+
+    @contextmanager
+    def track_inprogress(self, **labels: str):
+        """Increment the gauge for the duration of the block."""
+        self.inc(**labels)
+        try:
+            yield
+        finally:
+            self.dec(**labels)
+
+    def _render_samples(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return [
+            f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+            for key, value in items
+        ]
+
+
+class Histogram(_Metric):
+    """Cumulative histogram with fixed upper bounds."""
+
+    metric_type = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Tuple[str, ...] = (),
+        buckets: Tuple[float, ...] = DEFAULT_LATENCY_BUCKETS,
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+        # Per label combination: [bucket counts..., sum, count]
+        self._values: Dict[LabelValues, List[float]] = {}
+        if not labelnames:
+            self._values[()] = [0.0] * (len(self.buckets) + 2)
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            series = self._values.get(key)
+            if series is None:
+                series = self._values[key] = [0.0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+                    break
+            series[-2] += value
+            series[-1] += 1
+
+    @contextmanager
+    def time(self, **labels: str):
+        """Observe the wall-clock duration of the block in seconds."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def get_count(self, **labels: str) -> float:
+        with self._lock:
+            series = self._values.get(self._key(labels))
+            return series[-1] if series else 0.0
+
+    def _render_samples(self) -> List[str]:
+        with self._lock:
+            items = sorted((key, list(series)) for key, series in self._values.items())
+        lines = []
+        for key, series in items:
+            cumulative = 0.0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {_format_value(cumulative)}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(series[-2])}")
+            lines.append(f"{self.name}_count{labels} {_format_value(series[-1])}")
+        return lines
+
+
+class MetricsRegistry:
+    """Collection of metrics rendered together by the /metrics endpoint."""
+
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+
+    def register(self, metric: _Metric) -> _Metric:
+        if any(existing.name == metric.name for existing in self._metrics):
+            raise ValueError(f"Metric already registered: {metric.name}")
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        """Render all metrics in the Prometheus text exposition format."""
+        lines: List[str] = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+class PipelineMetrics:
+    """All metrics exported by the AI Streamer."""
+
+    def __init__(self, registry: Optional[MetricsRegistry] = None):
+        self.registry = registry or MetricsRegistry()
+        r = self.registry
+
+        # Histograms
+        self.llm_latency = r.register(Histogram(
+            "ai_streamer_llm_latency_seconds",
+            "Latency of LLM script generation calls.",
+        ))
+        self.tts_latency = r.register(Histogram(
+            "ai_streamer_tts_latency_seconds",
+            "Latency of TTS synthesis, including audio download.",
+        ))
+        self.item_end_to_end = r.register(Histogram(
+            "ai_streamer_item_end_to_end_seconds",
+            "Time from the start of script generation to an item being sent to a client.",
+            buckets=(1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0, 600.0),
+        ))
+        self.download_first_audio = r.register(Histogram(
+            "ai_streamer_download_first_audio_seconds",
+            "Time from starting an audio URL download to its first decoded PCM.",
+        ))
+        self.topic_switch_first_audio = r.register(Histogram(
+            "ai_streamer_topic_switch_first_audio_seconds",
+            "Time from a topic change to the first audio for the new topic being sent.",
+            buckets=(0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0),
+        ))
+
+        # Gauges
+        self.buffered_seconds = r.register(Gauge(
+            "ai_streamer_buffered_seconds",
+            "Seconds of audio waiting in the playlist.",
+        ))
+        self.buffered_bytes = r.register(Gauge(
+            "ai_streamer_buffered_bytes",
+            "Memory held by items waiting in the playlist.",
+        ))
+        self.playlist_items = r.register(Gauge(
+            "ai_streamer_playlist_items",
+            "Number of audio items waiting in the playlist.",
+        ))
+        self.connected_clients = r.register(Gauge(
+            "ai_streamer_connected_clients",
+            "Number of connected /ws/stream clients.",
+        ))
+        self.upstream_inflight = r.register(Gauge(
+            "ai_streamer_upstream_inflight",
+            "Upstream LLM/TTS calls currently in flight.",
+            labelnames=("upstream",),
+        ))
+        self.provider_latency = r.register(Gauge(
+            "ai_streamer_provider_latency_seconds",
+            "Rolling latency of successful calls, per upstream provider.",
+            labelnames=("upstream", "provider"),
+        ))
+        self.upstream_degraded = r.register(Gauge(
+            "ai_streamer_upstream_degraded",
+            "1 while upstream calls keep failing and recent items are replayed.",
+        ))
+
+        # Counters
+        self.underruns = r.register(Counter(
+            "ai_streamer_underruns_total",
+            "Times a client found the playlist empty while streaming.",
+        ))
+        self.filler_clips_played = r.register(Counter(
+            "ai_streamer_filler_clips_played_total",
+            "Filler clips sent to cover an empty playlist.",
+        ))
+        self.llm_cache_lookups = r.register(Counter(
+            "ai_streamer_llm_cache_lookups_total",
+            "Script batch cache lookups by result (hit, miss, expired).",
+            labelnames=("result",),
+        ))
+        self.ws_messages_dropped = r.register(Counter(
+            "ai_streamer_ws_messages_dropped_total",
+            "Messages dropped because a client's send queue was full.",
+        ))
+        self.ws_disconnects = r.register(Counter(
+            "ai_streamer_ws_disconnects_total",
+            "WebSocket clients that went away, by reason (disconnected, send_timeout, heartbeat_timeout).",
+            labelnames=("reason",),
+        ))
+        self.playlist_budget_waits = r.register(Counter(
+            "ai_streamer_playlist_budget_waits_total",
+            "Times a producer waited because the playlist budget was used up.",
+        ))
+        self.replayed_items = r.register(Counter(
+            "ai_streamer_replayed_items_total",
+            "Recently aired items replayed while upstream was degraded.",
+        ))
+        self.provider_calls = r.register(Counter(
+            "ai_streamer_provider_calls_total",
+            "Upstream calls per provider, by result (ok, error).",
+            labelnames=("upstream", "provider", "result"),
+        ))
+        self.singleflight_calls = r.register(Counter(
+            "ai_streamer_singleflight_calls_total",
+            "Calls through single-flight groups, by group and result (leader, coalesced).",
+            labelnames=("group", "result"),
+        ))
+        self.stale_items_dropped = r.register(Counter(
+            "ai_streamer_stale_items_dropped_total",
+            "Queued items for a previous topic dropped on a topic change.",
+        ))
+        self.fallback_scripts = r.register(Counter(
+            "ai_streamer_fallback_scripts_total",
+            "Fallback scripts returned instead of LLM output.",
+        ))
+        self.tts_failures_skipped = r.register(Counter(
+            "ai_streamer_tts_failures_skipped_total",
+            "Scripts skipped because TTS synthesis failed.",
+        ))
+        self.bytes_sent = r.register(Counter(
+            "ai_streamer_bytes_sent_total",
+            "Bytes sent to WebSocket clients.",
+        ))
+
+        for upstream in ("llm", "tts"):
+            self.upstream_inflight.set(0, upstream=upstream)
+
+    def render(self) -> str:
+        return self.registry.render()
+
+
+# Global metrics instance
+metrics = PipelineMetrics()
@@ -0,0 +1,208 @@
+"""On-demand sampling CPU profiler for the live server.
+
+A profiling run samples from a background thread, periodically snapshotting
+every thread's stack with ``sys._current_frames()``. Samples on the event loop
+thread are attributed to the asyncio task that was running at that moment
+(request tasks are named after their route by ``TaskNamingMiddleware``),
+and samples on executor threads to the thread name (AIService uses its own
+``ai_service`` pool). Nothing runs between profiling runs.
+
+Results can be rendered as collapsed stacks (flamegraph.pl, speedscope,
+inferno) or as a speedscope JSON document with one profile per thread/task.
+"""
+from typing import Dict, List, Optional, Tuple
+from collections import Counter
+from starlette.routing import Match
+import asyncio
+import os
+import sys
+import threading
+import time
+
+
+# Upper bound for a single profiling run, in seconds
+MAX_PROFILE_SECONDS = 60.0
+MIN_INTERVAL_SECONDS = 0.001
+
+# Label used for loop thread samples taken while no task was running
+IDLE_TASK = "<event loop>"
+
+def _frame_label(code) -> str:
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def _walk_stack(frame) -> List[str]:
+    """Return the stack as a list of labels, outermost frame first."""
+    labels = []
+    while frame is not None:
+        labels.append(_frame_label(frame.f_code))
+        frame = frame.f_back
+    labels.reverse()
+    return labels
+
+
+class ProfileResult:
+    """Aggregated samples from one profiling run."""
+
+    def __init__(self, samples: Counter, interval: float, duration: float):
+        # Stack tuples are (thread/task label, frames...) -> sample count
+        self.samples = samples
+        self.interval = interval
+        self.duration = duration
+
+    @property
+    def sample_count(self) -> int:
+        return sum(self.samples.values())
+
+    def to_collapsed(self) -> str:
+        """Render in the collapsed-stack format: ``a;b;c <count>`` per line."""
+        lines = [f"{';'.join(stack)} {count}" for stack, count in self.samples.most_common()]
+        return "\n".join(lines) + ("\n" if lines else "")
+
+    def to_speedscope(self, name: str = "ai-streamer") -> Dict:
+        """Render as a speedscope file with one sampled profile per thread/task."""
+        frames: List[Dict] = []
+        frame_index: Dict[str, int] = {}
+        groups: Dict[str, Tuple[List[List[int]], List[float]]] = {}
+
+        for stack, count in sorted(self.samples.items()):
+            group, frame_labels = stack[0], stack[1:]
+            indices = []
+            for label in frame_labels:
+                if label not in frame_index:
+                    frame_index[label] = len(frames)
+                    func, _, location = label.partition(" (")
+                    file, _, line = location.rstrip(")").rpartition(":")
+                    frames.append({"name": func, "file": file, "line": int(line) if line.isdigit() else 0})
+                indices.append(frame_index[label])
+            samples, weights = groups.setdefault(group, ([], []))
+            samples.append(indices)
+            weights.append(count * self.interval)
+
+        profiles = [
+            {
+                "type": "sampled",
+                "name": group,
+                "unit": "seconds",
+                "startValue": 0,
+                "endValue": sum(weights),
+                "samples": samples,
+                "weights": weights,
+            }
+            for group, (samples, weights) in sorted(groups.items())
+        ]
+        return {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "name": name,
+            "exporter": "ai-streamer profiler",
+            "activeProfileIndex": 0,
+            "shared": {"frames": frames},
+            "profiles": profiles,
+        }
+
+
+class SamplingProfiler:
+    """Samples all thread stacks of the current process on demand."""
+
+    def __init__(self):
+        self._running = threading.Lock()
+
+    @property
+    def is_running(self) -> bool:
+        return self._running.locked()
+
+    def profile(
+        self,
+        duration: float,
+        interval: float = 0.01,
+        loop: Optional[asyncio.AbstractEventLoop] = None,
+        loop_thread_id: Optional[int] = None,
+    ) -> ProfileResult:
+        """Sample stacks for ``duration`` seconds (blocking; call from a thread).
+
+        Args:
+            duration: Length of the run in seconds (capped at MAX_PROFILE_SECONDS)
+            interval: Seconds between samples
+            loop: Event loop whose running task should be attributed
+            loop_thread_id: Thread identifier the loop runs on
+
+        Raises:
+            RuntimeError: If another profiling run is in progress
+        """
+        if not self._running.acquire(blocking=False):
+            raise RuntimeError("A profiling run is already in progress")
+        try:
+            return self._sample(
+                min(max(duration, interval), MAX_PROFILE_SECONDS),
+                max(interval, MIN_INTERVAL_SECONDS),
+                loop,
+                loop_thread_id,
+            )
+        finally:
+            self._running.release()
+
+    def _sample(self, duration, interval, loop, loop_thread_id) -> ProfileResult:
+        samples: Counter = Counter()
+        own_id = threading.get_ident()
+        current_tasks = getattr(asyncio.tasks, "_current_tasks", {})
+        started = time.perf_counter()
+        deadline = started + duration
+
+        while True:
+            thread_names = {thread.ident: thread.name for thread in threading.enumerate()}
+            task = current_tasks.get(loop) if loop is not None else None
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                group = f"thread:{thread_names.get(thread_id, thread_id)}"
+                if thread_id == loop_thread_id:
+                    group = f"task:{task.get_name() if task is not None else IDLE_TASK}"
+                samples[(group, *_walk_stack(frame))] += 1
+            frame = None  # Don't keep the last sampled frame alive while sleeping
+
+            if time.perf_counter() >= deadline:
+                break
+            time.sleep(interval)
+
+        return ProfileResult(samples, interval, time.perf_counter() - started)
+
+
+# Task name of requests that match no route (scanners, typos)
+UNMATCHED_ROUTE = "<unmatched>"
+
+
+def route_template(scope) -> str:
+    """Path template of the app route a request matches, e.g. ``/api/jobs/{job_id}``."""
+    partial = None
+    for route in scope["app"].router.routes:
+        match, _ = route.matches(scope)
+        if match == Match.FULL:
+            return route.path
+        if match == Match.PARTIAL and partial is None:
+            partial = route.path  # Path matches, method doesn't
+    return partial or UNMATCHED_ROUTE
+
+
+class TaskNamingMiddleware:
+    """ASGI middleware naming each request's task after its route template.
+
+    Uvicorn runs every HTTP request and WebSocket connection in its own task,
+    so the name lets profiles attribute event loop time per route. Names use
+    the template rather than the path, so every job id or segment number
+    falls in the same profile group.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] in ("http", "websocket"):
+            task = asyncio.current_task()
+            if task is not None:
+                method = scope.get("method", "WS")
+                task.set_name(f"{method} {route_template(scope)}")
+        await self.app(scope, receive, send)
+
+
+# Global profiler instance
+profiler = SamplingProfiler()
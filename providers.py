@@ -0,0 +1,597 @@
+"""LLM and TTS providers with latency-aware routing.
+
+AIService builds prompts, caches batches, splits, decodes and post-processes
+audio; the upstream call itself goes through a provider:
+
+- ``complete(prompt, max_tokens, temperature) -> str`` for script generation
+- ``synthesize(text, span, format, sample_rate) -> Dict`` for speech: the
+  raw TTS result tagged with a 'format' key ('direct', 'base64', 'url',
+  'sdk' or 'json'; see AIService._extract_audio_data)
+
+Two implementations ship: DashScope (``qwen-turbo``; ``qwen3-tts-flash``
+with the sambert HTTP fallbacks) and a local deterministic one for offline
+runs (template scripts and synthetic speech, no network or API key).
+``RecordedProvider`` stubs replay captured latencies (see capture.py).
+
+Providers are configured per service as a comma-separated list of
+``name[:model][=cost]`` (``LLM_PROVIDERS``, ``TTS_PROVIDERS``), e.g.
+``dashscope:qwen-turbo,dashscope:qwen-plus=4``. A ``ProviderRouter`` tries
+them in order of score: rolling latency, plus the rolling error rate times
+``provider_error_penalty_seconds``, plus cost times
+``provider_cost_weight_seconds``. A failed call moves on to the next
+provider at once, and a provider failing ``provider_eject_failures`` times
+in a row is tried last for ``provider_eject_seconds``. The error rate
+halves every ``provider_eject_seconds`` without calls, so a provider that
+lost its place to errors gets tried again.
+"""
+from concurrent.futures import Executor
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple, TypeVar
+from loguru import logger
+import asyncio
+import json
+import re
+import time
+import zlib
+
+import dashscope
+import numpy as np
+import requests
+
+from config import settings
+from metrics import metrics
+from tracing import tracer, KIND_CLIENT, STATUS_ERROR
+from capture import traffic_recorder
+
+
+T = TypeVar("T")
+
+# Weight of the newest call in the rolling latency and error rate
+ROLLING_SMOOTHING = 0.2
+
+# Latency assumed for a provider before its first successful call
+INITIAL_LATENCY_SECONDS = 1.0
+
+# Lines of the local script provider, per segment of the selling spec
+LOCAL_SCRIPT_TEMPLATES = {
+    "intro": "欢迎来到直播间，今天给大家带来{topic}！",
+    "pain_point": "还在为挑不到好用的{topic}发愁吗？",
+    "solution": "这款{topic}品质过硬，用过的朋友都说好！",
+    "price": "今天直播间下单{topic}，价格真的超值！",
+    "cta": "喜欢{topic}的朋友赶紧点击下方链接下单！",
+}
+
+# Synthetic speech of the local TTS provider
+LOCAL_SPEECH_MS_PER_CHAR = 180
+LOCAL_SPEECH_AMPLITUDE = 6000
+
+
+class Provider:
+    """Base of script and speech providers.
+
+    Args:
+        model: Model name (``default_model`` when omitted)
+        cost: Relative cost per call (``default_cost`` when omitted)
+    """
+
+    kind = ""
+    default_model = ""
+    default_cost = 1.0
+
+    def __init__(self, model: Optional[str] = None, cost: Optional[float] = None):
+        self.model = model or self.default_model
+        self.cost = self.default_cost if cost is None else cost
+
+    @property
+    def name(self) -> str:
+        return f"{self.kind}:{self.model}"
+
+
+class DashScopeScriptProvider(Provider):
+    """Qwen text generation through the DashScope SDK, run in ``executor``."""
+
+    kind = "dashscope"
+    default_model = "qwen-turbo"
+
+    def __init__(self, executor: Optional[Executor] = None, model: Optional[str] = None, cost: Optional[float] = None):
+        super().__init__(model, cost)
+        self.executor = executor
+
+    async def complete(self, prompt: str, max_tokens: int, temperature: float) -> str:
+        loop = asyncio.get_event_loop()
+        response = await loop.run_in_executor(
+            self.executor,
+            lambda: dashscope.Generation.call(
+                model=self.model,
+                prompt=prompt,
+                max_tokens=max_tokens,
+                temperature=temperature,
+            )
+        )
+        if response.status_code != 200:
+            raise Exception(f"Qwen API error: {response.message}")
+        return response.output.text
+
+
+class DashScopeSpeechProvider(Provider):
+    """DashScope TTS: the SDK first, then HTTP endpoints, run in ``executor``."""
+
+    kind = "dashscope"
+    default_model = "qwen3-tts-flash"
+
+    def __init__(self, executor: Optional[Executor] = None, model: Optional[str] = None, cost: Optional[float] = None):
+        super().__init__(model, cost)
+        self.executor = executor
+
+    async def synthesize(self, text: str, span, format: str, sample_rate: int) -> Dict:
+        """Call the TTS endpoints (SDK first, then HTTP fallbacks) in the executor.
+
+        Returns:
+            The raw result, tagged with a 'format' key
+        """
+        loop = asyncio.get_event_loop()
+
+        def call_tts():
+            # Try using dashscope SDK first (MultiModalConversation)
+            sdk_endpoint = "sdk:MultiModalConversation"
+            attempt = tracer.start_span(
+                "tts.attempt", parent=span, kind=KIND_CLIENT,
+                attributes={"tts.endpoint": sdk_endpoint, "tts.model": self.model, "tts.fallback_index": 0},
+            )
+            sdk_failed = False
+            try:
+                response = dashscope.MultiModalConversation.call(
+                    model=self.model,
+                    text=text,
+                    voice='Cherry',
+                    language_type='Chinese'
+                )
+
+                if hasattr(response, 'status_code') and response.status_code == 200:
+                    # First, try get_audio_data() method if available
+                    if hasattr(response, 'get_audio_data'):
+                        try:
+                            audio_bytes = response.get_audio_data()
+                            if audio_bytes:
+                                return {'audio_data': audio_bytes, 'format': 'direct'}
+                        except Exception as e:
+                            logger.debug(f"get_audio_data() failed: {e}")
+
+                    # Check response format
+                    if hasattr(response, 'output'):
+                        output = response.output
+
+                        # Check for audio attribute first (actual structure: output.audio.url)
+                        if hasattr(output, 'audio'):
+                            audio_obj = output.audio
+                            # Audio is a dict/object with 'url' key (actual structure from API)
+                            if hasattr(audio_obj, 'url'):
+                                audio_url = audio_obj.url
+                                if audio_url:
+                                    return {'audio_url': audio_url, 'format': 'url'}
+                            elif isinstance(audio_obj, dict) and 'url' in audio_obj:
+                                audio_url = audio_obj['url']
+                                if audio_url:
+                                    return {'audio_url': audio_url, 'format': 'url'}
+                            elif isinstance(audio_obj, str):
+                                return {'audio_data': audio_obj, 'format': 'base64'}
+
+                        # Check for audio_url (backup)
+                        if hasattr(output, 'audio_url'):
+                            audio_url = output.audio_url
+                            if audio_url:
+                                return {'audio_url': audio_url, 'format': 'url'}
+
+                        # Check for choices structure (multimodal API format)
+                        if hasattr(output, 'choices') and output.choices is not None and len(output.choices) > 0:
+                            choice = output.choices[0]
+                            if hasattr(choice, 'message') and hasattr(choice.message, 'content'):
+                                content = choice.message.content
+                                # Content might be a list of items
+                                if isinstance(content, list):
+                                    for item in content:
+                                        if isinstance(item, dict) and item.get('type') == 'audio':
+                                            audio_str = item.get('audio', '')
+                                            if isinstance(audio_str, str):
+                                                return {'audio_data': audio_str, 'format': 'base64'}
+                                elif isinstance(content, str) and len(content) > 100:
+                                    # Might be base64 string directly
+                                    return {'audio_data': content, 'format': 'base64'}
+
+                        # Check for audio_data attribute
+                        if hasattr(output, 'audio_data'):
+                            audio_data = output.audio_data
+                            if isinstance(audio_data, str):
+                                return {'audio_data': audio_data, 'format': 'base64'}
+                            elif isinstance(audio_data, bytes):
+                                return {'audio_data': audio_data, 'format': 'direct'}
+
+                    # If we can't extract directly, return response for later parsing
+                    return {'response': response, 'format': 'sdk'}
+                else:
+                    # Fall back to HTTP request
+                    error_msg = getattr(response, 'message', getattr(response, 'code', 'Unknown error'))
+                    raise Exception(f"SDK call failed: {error_msg}")
+            except (ImportError, AttributeError) as e:
+                # SDK method not available, use HTTP
+                logger.debug(f"SDK method not available, using HTTP: {e}")
+                sdk_failed = True
+                attempt.set_status(STATUS_ERROR, str(e))
+            except Exception as e:
+                # SDK call failed, fall back to HTTP
+                logger.debug(f"SDK call failed, using HTTP: {e}")
+                sdk_failed = True
+                attempt.set_status(STATUS_ERROR, str(e))
+            finally:
+                attempt.end()
+                if not sdk_failed:
+                    # Only a successful return leaves the SDK block without an exception
+                    span.set_attribute("tts.endpoint", sdk_endpoint)
+                    span.set_attribute("tts.fallback_index", 0)
+
+            # Fallback: Use HTTP request directly
+            # Based on documentation, use correct endpoint and format
+            headers = {
+                "Authorization": f"Bearer {settings.dashscope_api_key}",
+                "Content-Type": "application/json"
+            }
+
+            # Try different endpoints and formats
+            url_formats = [
+                {
+                    "url": "https://dashscope.aliyuncs.com/api/v1/services/aigc/multimodal-generation/generation",
+                    "data": {
+                        "task_group": "aigc",
+                        "task": "multimodal-generation",
+                        "model": self.model,
+                        "input": {
+                            "text": text,
+                            "voice": "Cherry",
+                            "language_type": "Chinese"
+                        }
+                    }
+                },
+                {
+                    "url": "https://dashscope.aliyuncs.com/api/v1/services/aigc/multimodal-generation/generation",
+                    "data": {
+                        "task_group": "aigc",
+                        "task": "multimodal-generation",
+                        "model": "sambert-zhichu-v1",
+                        "input": {
+                            "text": text
+                        },
+                        "parameters": {
+                            "format": format,
+                            "sample_rate": sample_rate
+                        }
+                    }
+                },
+                {
+                    "url": "https://dashscope.aliyuncs.com/api/v1/services/audio/tts",
+                    "data": {
+                        "task_group": "aigc",
+                        "task": "tts",
+                        "model": "sambert-zhichu-v1",
+                        "text": text,
+                        "format": format,
+                        "sample_rate": sample_rate
+                    }
+                }
+            ]
+
+            last_error = None
+            for index, url_format in enumerate(url_formats, start=1):
+                attempt = tracer.start_span(
+                    "tts.attempt", parent=span, kind=KIND_CLIENT,
+                    attributes={
+                        "tts.endpoint": url_format["url"],
+                        "tts.model": url_format["data"]["model"],
+                        "tts.fallback_index": index,
+                    },
+                )
+                try:
+                    resp = requests.post(
+                        url_format["url"],
+                        headers=headers,
+                        json=url_format["data"],
+                        timeout=30
+                    )
+                    attempt.set_attribute("http.status_code", resp.status_code)
+
+                    if resp.status_code == 200:
+                        span.set_attribute("tts.endpoint", url_format["url"])
+                        span.set_attribute("tts.model", url_format["data"]["model"])
+                        span.set_attribute("tts.fallback_index", index)
+                        return {'response': resp.json(), 'format': 'json'}
+                    elif resp.status_code != 400:  # 400 means wrong format, try next
+                        logger.error(f"TTS API Error {resp.status_code}: {resp.text}")
+                        resp.raise_for_status()
+                    else:
+                        last_error = resp.text
+                        attempt.set_status(STATUS_ERROR, "400 Bad Request")
+                        continue  # Try next format
+                except Exception as e:
+                    last_error = str(e)
+                    attempt.set_status(STATUS_ERROR, last_error)
+                    continue
+                finally:
+                    attempt.end()
+
+            # If all formats failed, raise error with last error message
+            logger.error(f"All TTS API formats failed. Last error: {last_error}")
+            raise Exception(f"TTS API call failed with all formats. Last error: {last_error}")
+        return await loop.run_in_executor(self.executor, call_tts)
+
+
+class LocalScriptProvider(Provider):
+    """Deterministic template scripts, for offline runs.
+
+    Understands the prompts AIService builds: the topic is the first quoted
+    string and the count the first "N 条"; JSON is returned when the prompt
+    asks for it.
+    """
+
+    kind = "local"
+    default_model = "templates"
+    default_cost = 0.0
+
+    def __init__(self, executor: Optional[Executor] = None, model: Optional[str] = None, cost: Optional[float] = None):
+        super().__init__(model, cost)
+
+    async def complete(self, prompt: str, max_tokens: int, temperature: float) -> str:
+        topic_match = re.search(r'"([^"]+)"', prompt)
+        count_match = re.search(r"(\d+)\s*条", prompt)
+        topic = topic_match.group(1) if topic_match else "好物"
+        count = int(count_match.group(1)) if count_match else 5
+        segments = list(LOCAL_SCRIPT_TEMPLATES)
+        scripts = []
+        for i in range(count):
+            segment = segments[i % len(segments)]
+            line = LOCAL_SCRIPT_TEMPLATES[segment].format(topic=topic)
+            round_ = i // len(segments)
+            scripts.append({"segment": segment, "text": f"{line}（{round_ + 1}）" if round_ else line})
+        if "JSON" in prompt:
+            return json.dumps({"scripts": scripts}, ensure_ascii=False)
+        return "\n".join(script["text"] for script in scripts)
+
+
+class LocalSpeechProvider(Provider):
+    """Deterministic synthetic speech (one tone burst per character), for offline runs."""
+
+    kind = "local"
+    default_model = "tones"
+    default_cost = 0.0
+
+    def __init__(self, executor: Optional[Executor] = None, model: Optional[str] = None, cost: Optional[float] = None):
+        super().__init__(model, cost)
+
+    async def synthesize(self, text: str, span, format: str, sample_rate: int) -> Dict:
+        samples_per_char = sample_rate * LOCAL_SPEECH_MS_PER_CHAR // 1000
+        t = np.arange(samples_per_char) / sample_rate
+        envelope = np.sin(np.pi * np.arange(samples_per_char) / samples_per_char)  # Silent at both ends
+        bursts = [
+            envelope * np.sin(2 * np.pi * (150 + zlib.crc32(char.encode("utf-8")) % 200) * t)
+            for char in text
+        ]
+        pcm = (np.concatenate(bursts) * LOCAL_SPEECH_AMPLITUDE).astype("<i2") if bursts else np.zeros(0, "<i2")
+        span.set_attribute("tts.model", self.name)
+        return {"audio_data": pcm.tobytes(), "format": "direct"}
+
+
+class RecordedProvider(Provider):
+    """Stub replaying one provider's captured calls, with local output.
+
+    Each call sleeps for the next recorded latency (times ``latency_scale``)
+    and fails if the recorded call failed, cycling when the recording runs
+    out.
+
+    Args:
+        name: Recorded provider name ("kind:model")
+        calls: Recorded ``(seconds, ok)`` calls in order; when empty every
+            call succeeds after ``default_seconds``
+        cost: The recorded provider's cost
+        latency_scale: Factor applied to recorded latencies
+        default_seconds: Latency used when nothing was recorded
+    """
+
+    def __init__(
+        self,
+        name: str,
+        calls: List[Tuple[float, bool]],
+        cost: Optional[float] = None,
+        latency_scale: float = 1.0,
+        default_seconds: float = 1.0,
+    ):
+        kind, _, model = name.partition(":")
+        self.kind = kind
+        super().__init__(model, cost)
+        self.calls = calls or [(default_seconds, True)]
+        self.latency_scale = latency_scale
+        self.replayed = 0
+        self._script = LocalScriptProvider()
+        self._speech = LocalSpeechProvider()
+
+    async def _replay_call(self) -> None:
+        seconds, ok = self.calls[self.replayed % len(self.calls)]
+        self.replayed += 1
+        await asyncio.sleep(seconds * self.latency_scale)
+        if not ok:
+            raise Exception(f"Recorded failure of {self.name}")
+
+    async def complete(self, prompt: str, max_tokens: int, temperature: float) -> str:
+        await self._replay_call()
+        return await self._script.complete(prompt, max_tokens, temperature)
+
+    async def synthesize(self, text: str, span, format: str, sample_rate: int) -> Dict:
+        await self._replay_call()
+        return await self._speech.synthesize(text, span, format, sample_rate)
+
+
+SCRIPT_PROVIDERS = {"dashscope": DashScopeScriptProvider, "local": LocalScriptProvider}
+SPEECH_PROVIDERS = {"dashscope": DashScopeSpeechProvider, "local": LocalSpeechProvider}
+
+
+def parse_provider_specs(spec: str) -> List[Tuple[str, Optional[str], Optional[float]]]:
+    """Parse ``name[:model][=cost]`` entries separated by commas.
+
+    Raises:
+        ValueError: If a cost isn't a number
+    """
+    entries = []
+    for entry in spec.split(","):
+        entry = entry.strip()
+        if not entry:
+            continue
+        entry, _, cost = entry.partition("=")
+        name, _, model = entry.strip().partition(":")
+        entries.append((name.strip().lower(), model.strip() or None, float(cost) if cost.strip() else None))
+    return entries
+
+
+def build_providers(spec: str, registry: Dict[str, type], executor: Optional[Executor] = None) -> List[Provider]:
+    """Instantiate the providers listed in ``spec`` from ``registry``.
+
+    Raises:
+        ValueError: If a provider name is unknown or the list is empty
+    """
+    providers = []
+    for name, model, cost in parse_provider_specs(spec):
+        if name not in registry:
+            raise ValueError(f"Unknown provider {name!r}, expected one of {sorted(registry)}")
+        providers.append(registry[name](executor, model=model, cost=cost))
+    if not providers:
+        raise ValueError(f"No providers configured in {spec!r}")
+    return providers
+
+
+class ProviderStats:
+    """Rolling health of one provider."""
+
+    __slots__ = ("latency", "error_rate", "updated_at", "consecutive_failures", "ejected_until")
+
+    def __init__(self):
+        self.latency = INITIAL_LATENCY_SECONDS  # Of successful calls, in seconds
+        self.error_rate = 0.0  # As of updated_at
+        self.updated_at = 0.0
+        self.consecutive_failures = 0
+        self.ejected_until = 0.0  # Clock time until which the provider is tried last
+
+
+class ProviderRouter:
+    """Routes each call to the best-scoring provider, falling over on errors.
+
+    Args:
+        upstream: "llm" or "tts", for metrics and logs
+        providers: Candidates; ties keep this order
+        error_penalty_seconds: Score added per unit of rolling error rate
+        cost_weight_seconds: Score added per unit of provider cost
+        eject_failures: Consecutive failures after which a provider is tried last
+        eject_seconds: How long an ejected provider stays last
+        clock: Time source (for tests)
+    """
+
+    def __init__(
+        self,
+        upstream: str,
+        providers: List[Provider],
+        error_penalty_seconds: float = 10.0,
+        cost_weight_seconds: float = 1.0,
+        eject_failures: int = 3,
+        eject_seconds: float = 30.0,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.upstream = upstream
+        self.providers = providers
+        self.error_penalty_seconds = error_penalty_seconds
+        self.cost_weight_seconds = cost_weight_seconds
+        self.eject_failures = eject_failures
+        self.eject_seconds = eject_seconds
+        self.clock = clock
+        self.stats: Dict[str, ProviderStats] = {provider.name: ProviderStats() for provider in providers}
+
+    @property
+    def key(self) -> str:
+        """Identifies the configured providers (part of cache keys)."""
+        return ",".join(provider.name for provider in self.providers)
+
+    def error_rate(self, provider: Provider) -> float:
+        """Rolling error rate, halved for every ``eject_seconds`` since the last call."""
+        stats = self.stats[provider.name]
+        if not stats.error_rate:
+            return 0.0
+        return stats.error_rate * 0.5 ** ((self.clock() - stats.updated_at) / self.eject_seconds)
+
+    def score(self, provider: Provider) -> float:
+        """Lower is better."""
+        stats = self.stats[provider.name]
+        return stats.latency + self.error_rate(provider) * self.error_penalty_seconds + provider.cost * self.cost_weight_seconds
+
+    def ranked(self) -> List[Provider]:
+        """Providers in the order they are tried: healthy by score, then ejected ones."""
+        now = self.clock()
+        return sorted(
+            self.providers,
+            key=lambda provider: (self.stats[provider.name].ejected_until > now, self.score(provider)),
+        )
+
+    async def call(self, request: Callable[[Provider], Awaitable[T]]) -> T:
+        """Run ``request(provider)`` on the best provider, trying the next one on failure.
+
+        Raises:
+            Exception: The last provider's error when every provider failed
+        """
+        last_error: Optional[Exception] = None
+        for provider in self.ranked():
+            started = self.clock()
+            try:
+                result = await request(provider)
+            except Exception as e:
+                self._record(provider, self.clock() - started, ok=False)
+                logger.warning(f"⚠️ {self.upstream} provider {provider.name} failed: {e}")
+                last_error = e
+                continue
+            self._record(provider, self.clock() - started, ok=True)
+            return result
+        raise last_error
+
+    def _record(self, provider: Provider, seconds: float, ok: bool) -> None:
+        stats = self.stats[provider.name]
+        error_rate = self.error_rate(provider)
+        stats.error_rate = error_rate + ROLLING_SMOOTHING * ((0.0 if ok else 1.0) - error_rate)
+        stats.updated_at = self.clock()
+        traffic_recorder.record("up", u=self.upstream, p=provider.name, d=round(seconds, 4), ok=int(ok))
+        metrics.provider_calls.inc(upstream=self.upstream, provider=provider.name, result="ok" if ok else "error")
+        if ok:
+            stats.latency += ROLLING_SMOOTHING * (seconds - stats.latency)
+            stats.consecutive_failures = 0
+            metrics.provider_latency.set(stats.latency, upstream=self.upstream, provider=provider.name)
+            return
+        stats.consecutive_failures += 1
+        if stats.consecutive_failures >= self.eject_failures and len(self.providers) > 1:
+            stats.ejected_until = self.clock() + self.eject_seconds
+            logger.warning(f"⚠️ {self.upstream} provider {provider.name} ejected for {self.eject_seconds:.0f}s")
+
+    def status(self) -> List[Dict[str, Any]]:
+        now = self.clock()
+        return [
+            {
+                "provider": provider.name,
+                "score": round(self.score(provider), 3),
+                "latency_seconds": round(self.stats[provider.name].latency, 3),
+                "error_rate": round(self.error_rate(provider), 3),
+                "cost": provider.cost,
+                "ejected": self.stats[provider.name].ejected_until > now,
+            }
+            for provider in self.ranked()
+        ]
+
+
+def build_router(upstream: str, spec: str, registry: Dict[str, type], executor: Optional[Executor] = None) -> ProviderRouter:
+    """A router over the providers in ``spec``, tuned by the ``provider_*`` settings."""
+    return ProviderRouter(
+        upstream,
+        build_providers(spec, registry, executor),
+        error_penalty_seconds=settings.provider_error_penalty_seconds,
+        cost_weight_seconds=settings.provider_cost_weight_seconds,
+        eject_failures=settings.provider_eject_failures,
+        eject_seconds=settings.provider_eject_seconds,
+    )
@@ -0,0 +1,132 @@
+"""Recently aired items, looped while upstream is degraded.
+
+spec.md asks for an auto-loop: when DashScope is down the stream should
+keep going on what it already has, rather than going silent or repeating
+the single fallback line. The playout records every item it airs here,
+per topic. While ``upstream_health`` reports degraded mode (see health.py)
+and the playlist is empty, it airs items from this history instead:
+
+- Items are drawn in shuffled order, and an item isn't replayed again
+  within ``no_repeat`` replays (fewer when the topic has fewer items).
+- The history is bounded: ``max_items`` per topic, oldest dropped first,
+  and ``max_bytes`` overall, taken from the least recently aired topic.
+- Entries are compact: they share the aired item's PCM (at its native
+  rate) and packed viseme track, but not its resampled variants or
+  encoded frames. Each replay airs a fresh copy, so anything encoded for
+  it is freed once it has aired.
+"""
+from collections import OrderedDict, deque
+from typing import Deque, Dict, Optional
+import random
+
+from config import settings
+from state import AudioItem
+from llm_cache import normalize_topic
+
+
+class ReplayHistory:
+    """Bounded per-topic history of aired items.
+
+    Args:
+        max_items: Items kept per topic
+        max_bytes: Audio and visemes kept across all topics
+        no_repeat: Replays before an item may be replayed again
+        rng: Random source for the shuffle (for tests)
+    """
+
+    def __init__(
+        self,
+        max_items: int = 50,
+        max_bytes: int = 32_000_000,
+        no_repeat: int = 10,
+        rng: Optional[random.Random] = None,
+    ):
+        self.max_items = max_items
+        self.max_bytes = max_bytes
+        self.no_repeat = no_repeat
+        self.rng = rng or random.Random()
+        # Normalized topic -> text -> entry, oldest first; topics least recently aired first
+        self._topics: "OrderedDict[str, OrderedDict[str, AudioItem]]" = OrderedDict()
+        self._recent: Dict[str, Deque[str]] = {}  # Normalized topic -> texts replayed last
+        self.nbytes = 0
+
+    def size(self, topic: Optional[str]) -> int:
+        """Number of items that can be replayed for a topic."""
+        return len(self._topics.get(normalize_topic(topic or ""), ()))
+
+    def record(self, topic: Optional[str], item: AudioItem) -> None:
+        """Keep an aired item for ``topic``; fillers and items without audio are ignored."""
+        if not topic or item.is_filler or not item.audio_data:
+            return
+        key = normalize_topic(topic)
+        entries = self._topics.get(key)
+        if entries is None:
+            entries = self._topics[key] = OrderedDict()
+        previous = entries.pop(item.text, None)
+        if previous is not None:
+            self.nbytes -= previous.nbytes
+        entry = AudioItem(
+            text=item.text,
+            audio_data=item.audio_data,
+            visemes=item.visemes,
+            duration_ms=item.duration_ms,
+            created_at=item.created_at,
+            sample_rate=item.sample_rate,
+        )
+        entries[item.text] = entry
+        self.nbytes += entry.nbytes
+        self._topics.move_to_end(key)
+
+        while len(entries) > self.max_items:
+            self._drop_oldest(key)
+        while self.nbytes > self.max_bytes and self._topics:
+            self._drop_oldest(next(iter(self._topics)))
+
+    def _drop_oldest(self, key: str) -> None:
+        entries = self._topics[key]
+        _, dropped = entries.popitem(last=False)
+        self.nbytes -= dropped.nbytes
+        if not entries:
+            del self._topics[key]
+            self._recent.pop(key, None)
+
+    def next_item(self, topic: Optional[str]) -> Optional[AudioItem]:
+        """A copy of a randomly chosen item for ``topic``, outside the no-repeat window.
+
+        The copy is marked as a filler: it isn't new content, so it doesn't
+        count towards end-to-end latency or topic switch metrics.
+        """
+        key = normalize_topic(topic or "")
+        entries = self._topics.get(key)
+        if not entries:
+            return None
+        recent = self._recent.setdefault(key, deque())
+        while len(recent) > min(self.no_repeat, len(entries) - 1):
+            recent.popleft()
+        blocked = set(recent)
+        text = self.rng.choice([text for text in entries if text not in blocked])
+        recent.append(text)
+
+        entry = entries[text]
+        return AudioItem(
+            text=entry.text,
+            audio_data=entry.audio_data,
+            visemes=entry.visemes,
+            duration_ms=entry.duration_ms,
+            created_at=None,
+            is_filler=True,
+            sample_rate=entry.sample_rate,
+        )
+
+    def clear(self) -> None:
+        self._topics.clear()
+        self._recent.clear()
+        self.nbytes = 0
+
+
+# Global replay history instance
+replay_history = ReplayHistory(
+    max_items=settings.replay_max_items,
+    max_bytes=settings.replay_max_bytes,
+    no_repeat=settings.replay_no_repeat,
+)
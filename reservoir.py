@@ -0,0 +1,163 @@
+"""Per-topic reservoir of LLM-generated scripts.
+
+Asking the LLM for 5 short lines per refill lets per-call overhead
+dominate. Instead, scripts are generated in large batches
+(``script_batch_size``, 50 by default) as structured JSON with each line
+tagged by its segment of the selling spec (see ``SCRIPT_SEGMENTS``:
+intro -> pain_point -> solution -> price -> cta). Batches are validated
+once when they arrive and kept per topic and segment.
+
+Refills draw from the reservoir in spec order, continuing the cycle where
+the previous draw stopped, and only wait for the LLM when the topic has
+nothing left; when the stock runs low the next batch is generated in the
+background. Prepared scripts added with ``add`` (a scheduled slot's script
+pack, see schedule.py) are drawn before generated ones.
+"""
+from collections import OrderedDict, deque
+from typing import Awaitable, Callable, Deque, Dict, List, Optional
+from loguru import logger
+import asyncio
+
+from config import settings
+from metrics import metrics
+from ai_service import ai_service, SCRIPT_SEGMENTS
+from llm_cache import normalize_topic
+from health import upstream_health
+from singleflight import SingleFlight
+
+
+# Topics whose scripts are kept; the least recently used are dropped first
+MAX_RESERVOIR_TOPICS = 8
+
+Script = Dict[str, Optional[str]]
+
+
+class ScriptReservoir:
+    """Keeps batches of segment-tagged scripts per topic and hands them out in spec order.
+
+    Args:
+        generate_batch: ``async (topic, count) -> [{"segment", "text"}, ...]``
+        batch_size: Scripts requested per LLM call
+        low_watermark: Start generating the next batch when fewer scripts remain
+        max_topics: Topics kept before the least recently used is dropped
+    """
+
+    def __init__(
+        self,
+        generate_batch: Callable[[str, int], Awaitable[List[Script]]],
+        batch_size: int = 50,
+        low_watermark: int = 10,
+        max_topics: int = MAX_RESERVOIR_TOPICS,
+    ):
+        self.generate_batch = generate_batch
+        self.batch_size = batch_size
+        self.low_watermark = low_watermark
+        self.max_topics = max_topics
+        # Normalized topic -> segment -> scripts; untagged lines are kept under None
+        self._stock: "OrderedDict[str, Dict[Optional[str], Deque[str]]]" = OrderedDict()
+        self._cursor: Dict[str, int] = {}  # Next segment to draw, per topic
+        self._packs: Dict[str, Deque[str]] = {}  # Prepared scripts, drawn first
+        self._fills = SingleFlight("scripts")  # One batch generation per topic at a time
+
+    def size(self, topic: str) -> int:
+        """Number of scripts left for a topic."""
+        key = normalize_topic(topic)
+        return len(self._packs.get(key, ())) + sum(len(lines) for lines in self._stock.get(key, {}).values())
+
+    def add(self, topic: str, scripts: List[str], front: bool = False) -> None:
+        """Queue prepared scripts for a topic, ahead of generated ones.
+
+        With ``front`` they also go ahead of the prepared scripts already
+        queued (for scripts handed back unused).
+        """
+        if not scripts:
+            return
+        pack = self._packs.setdefault(normalize_topic(topic), deque())
+        if front:
+            pack.extendleft(reversed(scripts))
+        else:
+            pack.extend(scripts)
+
+    def is_filling(self, topic: str) -> bool:
+        return self._fills.in_flight(normalize_topic(topic)) is not None
+
+    async def take(self, topic: str, count: int) -> List[Script]:
+        """Draw up to ``count`` scripts for a topic in spec order.
+
+        Waits for the LLM only when the topic has no scripts left; returns
+        fallback scripts if even that produced nothing (none while upstream
+        is degraded).
+        """
+        key = normalize_topic(topic)
+        if not self.size(topic):
+            await asyncio.shield(self._start_fill(key, topic))
+
+        scripts = self._draw(key, count)
+        if scripts and self.size(topic) < self.low_watermark:
+            self._start_fill(key, topic)  # Top up in the background
+
+        if not scripts:
+            if upstream_health.degraded:
+                return []  # Aired items are replayed instead of the fallback line
+            metrics.fallback_scripts.inc(count)
+            return [{"segment": None, "text": f"欢迎了解{topic}，这里有最优质的产品和服务！"}] * count
+        logger.debug("🪣 Drew {} scripts for {}, {} left", len(scripts), topic, self.size(topic))
+        return scripts
+
+    def _draw(self, key: str, count: int) -> List[Script]:
+        scripts = []
+        pack = self._packs.get(key)
+        while pack and len(scripts) < count:
+            scripts.append({"segment": None, "text": pack.popleft()})
+        if pack is not None and not pack:
+            del self._packs[key]
+
+        stock = self._stock.get(key)
+        if not stock:
+            return scripts
+        self._stock.move_to_end(key)
+        cursor = self._cursor.get(key, 0)
+        while len(scripts) < count:
+            # Next segment in spec order that still has lines
+            for step in range(len(SCRIPT_SEGMENTS)):
+                segment = SCRIPT_SEGMENTS[(cursor + step) % len(SCRIPT_SEGMENTS)]
+                if stock[segment]:
+                    scripts.append({"segment": segment, "text": stock[segment].popleft()})
+                    cursor = (cursor + step + 1) % len(SCRIPT_SEGMENTS)
+                    break
+            else:
+                if not stock[None]:
+                    break
+                scripts.append({"segment": None, "text": stock[None].popleft()})
+        self._cursor[key] = cursor
+        return scripts
+
+    def _start_fill(self, key: str, topic: str) -> asyncio.Task:
+        """Start generating a batch for the topic unless one is already running."""
+        return self._fills.start(key, lambda: self._fill(key, topic), name="fill_script_reservoir")
+
+    async def _fill(self, key: str, topic: str) -> None:
+        try:
+            scripts = await self.generate_batch(topic, self.batch_size)
+        except Exception as e:
+            logger.error(f"❌ Error generating script batch: {e}")
+            return
+
+        stock = self._stock.get(key)
+        if stock is None:
+            stock = self._stock[key] = {segment: deque() for segment in (*SCRIPT_SEGMENTS, None)}
+        for script in scripts:
+            stock[script["segment"]].append(script["text"])
+        self._stock.move_to_end(key)
+        while len(self._stock) > self.max_topics:
+            evicted, _ = self._stock.popitem(last=False)
+            self._cursor.pop(evicted, None)
+        logger.info(f"🪣 Script reservoir for {topic}: {self.size(topic)} scripts")
+
+
+# Global script reservoir instance
+script_reservoir = ScriptReservoir(
+    ai_service.generate_script_batch,
+    batch_size=settings.script_batch_size,
+    low_watermark=settings.script_low_watermark,
+)
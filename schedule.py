@@ -0,0 +1,260 @@
+"""Scheduled topic calendar with lookahead pre-rendering.
+
+Shows rotate products on a timetable. The calendar is a list of slots
+(start time, topic, optional script pack) set with ``PUT /api/schedule``.
+A manual ``POST /api/start_stream`` begins with a cold gap while the first
+scripts and audio are generated; a scheduled switch doesn't:
+
+- Ahead of each slot, its first ``schedule_preroll_items`` items are
+  rendered and held back (not queued, so they survive the epoch change).
+- How far ahead is derived from measured generation throughput: the
+  average time to draw scripts and to synthesize one item, times
+  ``schedule_lead_safety``, and at least ``schedule_min_lead_seconds``.
+- At the slot start the switch callback (``main.start_scheduled_slot``)
+  starts the new topic's epoch and queues the pre-rendered items first.
+  The item airing at that moment plays to its end, so the new topic
+  starts at the next item boundary with no dead air.
+
+A slot's script pack is handed to the script reservoir when pre-rendering
+starts, so it is used before any generated scripts for that topic.
+
+While upstream is degraded (see health.py) pre-rendering is deferred, like
+the auto-refill, so it doesn't spend calls the outage probe rations; a slot
+that starts before upstream is back switches with no items ready.
+"""
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+from loguru import logger
+import asyncio
+import time
+
+from config import settings
+from state import AudioItem
+from audio import DEFAULT_SAMPLE_RATE
+from ai_service import ai_service
+from health import UpstreamHealth, upstream_health
+from reservoir import ScriptReservoir, script_reservoir
+
+
+# Weight of the newest sample in the throughput averages
+THROUGHPUT_SMOOTHING = 0.3
+
+# While upstream is degraded, how often a deferred pre-render checks again
+DEGRADED_RECHECK_SECONDS = 5.0
+
+SynthesizeFn = Callable[[str], Awaitable[Dict]]
+
+
+@dataclass(eq=False)
+class Slot:
+    """One entry of the calendar (compared by identity)."""
+    start: float  # time.time() when the topic goes on air
+    topic: str
+    scripts: List[str] = field(default_factory=list)  # Optional script pack
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "start": datetime.fromtimestamp(self.start).isoformat(),
+            "topic": self.topic,
+            "scripts": len(self.scripts),
+        }
+
+
+class ShowScheduler:
+    """Switches topics on a calendar, rendering each slot's opening ahead of time.
+
+    Args:
+        synthesize: Coroutine function returning a TTS result dict, e.g.
+            ``AIService.text_to_speech``
+        reservoir: Script reservoir the slots draw from
+        preroll_items: Items rendered ahead of each slot
+        lead_safety: Factor applied to the estimated render time
+        min_lead_seconds: Never start rendering later than this before a slot
+        item_seconds: Initial estimate of the time to synthesize one item
+        script_seconds: Initial estimate of the time to draw a slot's scripts
+        health: Upstream health; pre-rendering waits while it is degraded
+    """
+
+    def __init__(
+        self,
+        synthesize: SynthesizeFn,
+        reservoir: ScriptReservoir,
+        preroll_items: int = 3,
+        lead_safety: float = 1.5,
+        min_lead_seconds: float = 10.0,
+        item_seconds: float = 3.0,
+        script_seconds: float = 5.0,
+        health: Optional[UpstreamHealth] = None,
+    ):
+        self.synthesize = synthesize
+        self.reservoir = reservoir
+        self.preroll_items = preroll_items
+        self.lead_safety = lead_safety
+        self.min_lead_seconds = min_lead_seconds
+        self.item_seconds = item_seconds  # Average wall time to synthesize one item
+        self.script_seconds = script_seconds  # Average wall time to draw scripts for a new topic
+        self.health = health
+        self.slots: List[Slot] = []  # Sorted by start
+        self._preroll: Optional[Slot] = None  # Slot whose items are in _preroll_items
+        self._preroll_items: List[AudioItem] = []
+        self._changed = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    def observe_render(self, seconds: float) -> None:
+        """Record how long synthesizing one item took."""
+        self.item_seconds += THROUGHPUT_SMOOTHING * (seconds - self.item_seconds)
+
+    def observe_scripts(self, seconds: float) -> None:
+        """Record how long drawing scripts for a topic with no stock took."""
+        self.script_seconds += THROUGHPUT_SMOOTHING * (seconds - self.script_seconds)
+
+    def lead_seconds(self, slot: Slot) -> float:
+        """How long before ``slot`` starts its items must start rendering."""
+        estimate = self.preroll_items * self.item_seconds
+        if self._needs_scripts(slot):
+            estimate += self.script_seconds
+        return max(estimate * self.lead_safety, self.min_lead_seconds)
+
+    def _needs_scripts(self, slot: Slot) -> bool:
+        """Whether pre-rendering the slot has to wait for the LLM."""
+        return self.reservoir.size(slot.topic) + len(slot.scripts) < self.preroll_items
+
+    def set_slots(self, slots: List[Slot]) -> None:
+        """Replace the calendar.
+
+        Of the slots that have already started only the latest is kept; it
+        is switched to right away.
+        """
+        now = time.time()
+        slots = sorted(slots, key=lambda slot: slot.start)
+        started = [slot for slot in slots if slot.start <= now]
+        self.slots = started[-1:] + [slot for slot in slots if slot.start > now]
+        if self._preroll is not None and self._preroll not in self.slots:
+            self._preroll, self._preroll_items = None, []
+        self._changed.set()
+
+    def status(self) -> Dict[str, Any]:
+        upcoming = self.slots[0] if self.slots else None
+        return {
+            "slots": [slot.to_dict() for slot in self.slots],
+            "next_render_at": (
+                datetime.fromtimestamp(upcoming.start - self.lead_seconds(upcoming)).isoformat()
+                if upcoming else None
+            ),
+            "prerendered_items": len(self._preroll_items) if upcoming is not None and self._preroll is upcoming else 0,
+            "item_seconds": round(self.item_seconds, 3),
+            "script_seconds": round(self.script_seconds, 3),
+        }
+
+    async def prerender(self, slot: Slot) -> List[AudioItem]:
+        """Draw and synthesize the opening items of a slot; failed scripts are skipped."""
+        needs_scripts = self._needs_scripts(slot)
+        self.reservoir.add(slot.topic, slot.scripts)
+        started = time.monotonic()
+        drawn = await self.reservoir.take(slot.topic, self.preroll_items)
+        if len(drawn) < self.preroll_items:
+            # A short pack or stock: wait for the batch its draw started
+            drawn += await self.reservoir.take(slot.topic, self.preroll_items - len(drawn))
+        if needs_scripts:
+            self.observe_scripts(time.monotonic() - started)
+
+        items = []
+        for index, script in enumerate(drawn):
+            if self._degraded():
+                # Keep the rest for the slot's job instead of spending calls during an outage
+                self.reservoir.add(slot.topic, [rest["text"] for rest in drawn[index:]], front=True)
+                logger.warning(f"🩺 Upstream degraded, stopped pre-rendering {slot.topic}")
+                break
+            started = time.monotonic()
+            try:
+                tts_result = await self.synthesize(script["text"])
+            except Exception as e:
+                logger.warning(f"⚠️ Failed to pre-render a script for {slot.topic}: {e}")
+                continue
+            self.observe_render(time.monotonic() - started)
+            items.append(AudioItem(
+                text=script["text"],
+                audio_data=tts_result["audio_data"],
+                visemes=tts_result["visemes"],
+                duration_ms=tts_result["duration_ms"],
+                created_at=None,
+                sample_rate=tts_result.get("sample_rate", DEFAULT_SAMPLE_RATE),
+            ))
+        logger.info(f"🗓️ Pre-rendered {len(items)} items for {slot.topic}")
+        return items
+
+    def _degraded(self) -> bool:
+        return self.health is not None and self.health.degraded
+
+    def start(self, switch: Callable[[Slot, List[AudioItem]], Awaitable[Any]]) -> None:
+        """Run the calendar on the current event loop unless it already is.
+
+        ``switch(slot, items)`` is awaited at each slot start with the
+        slot's pre-rendered items.
+        """
+        if self._task is not None and not self._task.done() and self._task.get_loop() is asyncio.get_running_loop():
+            return
+        self._changed = asyncio.Event()
+        self._task = asyncio.create_task(self._run(switch), name="show_scheduler")
+
+    def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _wait(self, timeout: Optional[float]) -> None:
+        """Sleep until ``timeout`` elapses or the calendar changes."""
+        self._changed.clear()
+        try:
+            await asyncio.wait_for(self._changed.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+    async def _run(self, switch: Callable[[Slot, List[AudioItem]], Awaitable[Any]]) -> None:
+        while True:
+            if not self.slots:
+                await self._wait(None)
+                continue
+            slot = self.slots[0]
+            now = time.time()
+
+            if self._preroll is not slot:
+                render_at = slot.start - self.lead_seconds(slot)
+                if now < render_at:
+                    await self._wait(render_at - now)
+                    continue
+                if self._degraded():
+                    if now < slot.start:
+                        await self._wait(min(slot.start - now, DEGRADED_RECHECK_SECONDS))
+                    else:
+                        self._preroll, self._preroll_items = slot, []  # Switch without an opening
+                    continue
+                items = await self.prerender(slot)
+                if slot in self.slots:  # Not removed from the calendar meanwhile
+                    self._preroll, self._preroll_items = slot, items
+                continue
+
+            if now < slot.start:
+                await self._wait(slot.start - now)
+                continue
+            items = self._preroll_items
+            self.slots.remove(slot)
+            self._preroll, self._preroll_items = None, []
+            late = now - slot.start
+            logger.info(f"🗓️ Scheduled switch to {slot.topic} ({len(items)} items ready, {late:.1f}s after slot start)")
+            try:
+                await switch(slot, items)
+            except Exception as e:
+                logger.error(f"❌ Scheduled switch to {slot.topic} failed: {e}")
+
+
+# Global scheduler instance
+show_scheduler = ShowScheduler(
+    ai_service.text_to_speech,
+    script_reservoir,
+    preroll_items=settings.schedule_preroll_items,
+    lead_safety=settings.schedule_lead_safety,
+    min_lead_seconds=settings.schedule_min_lead_seconds,
+    health=upstream_health,
+)
@@ -0,0 +1,78 @@
+"""Single-flight coalescing of concurrent calls.
+
+Several callers often ask for the same work at once: repeated
+``start_stream`` calls for a topic, an auto-refill racing a manual start,
+two jobs synthesizing the same line. A ``SingleFlight`` group runs one
+call per key at a time; callers arriving while it is in flight share its
+task instead of starting their own. Keys identify the work, e.g.
+``(topic, epoch)`` for a generation run or ``(topic, epoch, text)`` for a
+synthesis.
+
+Calls per group are counted in ``ai_streamer_singleflight_calls_total``,
+split into ``leader`` (started the work) and ``coalesced`` (joined it).
+"""
+from typing import Awaitable, Callable, Dict, Hashable, Optional, TypeVar
+import asyncio
+
+from metrics import metrics
+
+
+T = TypeVar("T")
+
+
+class SingleFlight:
+    """One in-flight task per key.
+
+    Args:
+        name: Group name, used as the ``group`` metric label and task name
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._calls: Dict[Hashable, asyncio.Task] = {}
+        self._waiters: Dict[asyncio.Task, int] = {}  # Callers awaiting each task through do()
+
+    def in_flight(self, key: Hashable) -> Optional[asyncio.Task]:
+        """The task running for ``key`` on the current event loop, if any."""
+        task = self._calls.get(key)
+        if task is None or task.done() or task.get_loop() is not asyncio.get_running_loop():
+            return None
+        return task
+
+    def start(self, key: Hashable, fn: Callable[[], Awaitable[T]], name: Optional[str] = None) -> "asyncio.Task[T]":
+        """Start ``fn()`` as a task for ``key``, or return the one already running.
+
+        ``fn`` is only called when no task is in flight for the key.
+        """
+        task = self.in_flight(key)
+        if task is not None:
+            metrics.singleflight_calls.inc(group=self.name, result="coalesced")
+            return task
+        metrics.singleflight_calls.inc(group=self.name, result="leader")
+        task = asyncio.create_task(fn(), name=name or self.name)
+        self._calls[key] = task
+        task.add_done_callback(lambda done: self._forget(key, done))
+        return task
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[T]]) -> T:
+        """Await the result of ``fn()`` for ``key``, shared with concurrent callers.
+
+        A caller that is cancelled doesn't cancel the shared call while
+        others still wait for it; the last one to leave does.
+        """
+        task = self.start(key, fn)
+        self._waiters[task] = self._waiters.get(task, 0) + 1
+        try:
+            return await asyncio.shield(task)
+        except asyncio.CancelledError:
+            if self._waiters[task] == 1 and not task.done():
+                task.cancel()
+            raise
+        finally:
+            self._waiters[task] -= 1
+            if not self._waiters[task]:
+                del self._waiters[task]
+
+    def _forget(self, key: Hashable, task: asyncio.Task) -> None:
+        if self._calls.get(key) is task:
+            del self._calls[key]
@@ -1,68 +1,304 @@
 """Global state management for in-memory playlist."""
-from typing import List, Dict, Optional
-from dataclasses import dataclass
+from typing import List, Dict, Optional, Tuple, Union
+from dataclasses import dataclass, field
 from datetime import datetime
 import asyncio
+import time
 
+from config import settings
+from metrics import metrics
+from tracing import tracer, KIND_PRODUCER, KIND_CONSUMER
+from audio import DEFAULT_SAMPLE_RATE
+from downloader import PcmStream
+from llm_cache import normalize_topic
+from visemes import VisemeTrack
 
-@dataclass
+
+@dataclass(slots=True)
 class AudioItem:
-    """Represents a single audio item in the playlist."""
+    """Represents a single audio item in the playlist.
+    
+    Slotted to keep per-item overhead small. Visemes may be passed as a list
+    of dicts and are packed into a ``VisemeTrack``; ``created_at`` may be a
+    datetime and is stored as a Unix timestamp.
+    """
     text: str
     audio_data: bytes
-    visemes: List[Dict]  # List of viseme data for lip-sync
+    visemes: VisemeTrack  # Viseme frames for lip-sync
     duration_ms: int
-    created_at: datetime
+    created_at: Optional[float]  # time.time() when the item was made
+    generation_started_at: Optional[float] = None  # time.time() when script generation began
+    trace_id: Optional[str] = None  # Lifecycle trace (see tracing.py)
+    enqueued_at_ns: Optional[int] = None  # time.time_ns() when added to the playlist
+    is_filler: bool = False  # Pre-synthesized clip covering an underrun
+    sample_rate: int = DEFAULT_SAMPLE_RATE  # Rate of audio_data (16-bit mono PCM)
+    variants: Dict[int, bytes] = field(default_factory=dict, repr=False)  # Resampled audio by rate
+    frames: Dict[Tuple[int, str], Union[str, bytes]] = field(default_factory=dict, repr=False)  # Encoded messages by (rate, wire format)
+    stream: Optional[PcmStream] = field(default=None, repr=False)  # Audio still downloading (audio_data empty until done)
+    epoch: Optional[int] = None  # Topic epoch the item was made for (None: not tied to a topic)
+    item_id: Optional[str] = None  # "<job id>-<index>" for generated items, in log lines (see logs.py)
+    queued_bytes: int = field(default=0, repr=False)  # nbytes counted into GlobalState.buffered_bytes while queued
     
     def __post_init__(self):
+        self.visemes = VisemeTrack.coerce(self.visemes)
         if self.created_at is None:
-            self.created_at = datetime.now()
+            self.created_at = time.time()
+        elif isinstance(self.created_at, datetime):
+            self.created_at = self.created_at.timestamp()
+    
+    @property
+    def nbytes(self) -> int:
+        """Memory held by the item's audio, variants, encoded frames and visemes."""
+        nbytes = len(self.audio_data) + self.visemes.frames.nbytes
+        if self.variants:
+            nbytes += sum(map(len, self.variants.values()))
+        if self.frames:
+            nbytes += sum(map(len, self.frames.values()))
+        return nbytes
+    
+    @property
+    def created_at_iso(self) -> str:
+        return datetime.fromtimestamp(self.created_at).isoformat()
 
 
 class GlobalState:
     """Global state manager for the AI Streamer.
     
     This class holds the playlist in memory and manages the streaming state.
+    
+    Each topic change starts a new epoch. Items made for an earlier epoch are
+    dropped from the playlist, and are refused if they arrive afterwards.
+    
+    Queued audio is accounted in bytes and in milliseconds. Producers call
+    ``wait_for_room`` before making an item, which blocks while either
+    budget is used up, so the playlist overshoots a budget by at most one
+    item per producer.
+    
+    Args:
+        max_bytes: Byte budget of queued items (0: unlimited)
+        max_seconds: Duration budget of queued audio (0: unlimited)
     """
     
-    def __init__(self):
+    def __init__(self, max_bytes: int = 0, max_seconds: float = 0.0):
         self.playlist: List[AudioItem] = []
         self.current_topic: Optional[str] = None
         self.is_streaming: bool = False
+        self.max_bytes = max_bytes
+        self.max_seconds = max_seconds
+        self.buffered_ms: int = 0  # Total duration of queued audio
+        self.buffered_bytes: int = 0  # Total memory of queued items (AudioItem.nbytes)
+        self.epoch: int = 0  # Bumped on every topic change
+        self.epoch_started_at: Optional[float] = None  # time.monotonic() of the last change, until its first audio airs
         self.lock = asyncio.Lock()
+        self.room = asyncio.Condition(self.lock)  # Notified whenever queued audio shrinks
+    
+    def _update_buffer_metrics(self) -> None:
+        """Publish playlist depth to the metrics gauges (call with lock held)."""
+        metrics.playlist_items.set(len(self.playlist))
+        metrics.buffered_seconds.set(self.buffered_ms / 1000.0)
+        metrics.buffered_bytes.set(self.buffered_bytes)
+    
+    def _recount(self) -> None:
+        """Recompute the buffer totals from the playlist (call with lock held)."""
+        for item in self.playlist:
+            item.queued_bytes = item.nbytes
+        self.buffered_ms = sum(item.duration_ms for item in self.playlist)
+        self.buffered_bytes = sum(item.queued_bytes for item in self.playlist)
+        self._update_buffer_metrics()
+    
+    def _count_in(self, item: AudioItem) -> None:
+        """Add a queued item to the buffer totals, recording the bytes counted (call with lock held)."""
+        item.queued_bytes = item.nbytes
+        self.buffered_ms += item.duration_ms
+        self.buffered_bytes += item.queued_bytes
+    
+    def _count_out(self, item: AudioItem) -> None:
+        """Take an item out of the buffer totals, exactly as it was counted in (call with lock held)."""
+        self.buffered_ms -= item.duration_ms
+        self.buffered_bytes -= item.queued_bytes
+        item.queued_bytes = 0
+    
+    def _has_room(self) -> bool:
+        if not self.playlist:
+            return True  # An item larger than the budget must not block forever
+        if self.max_bytes and self.buffered_bytes >= self.max_bytes:
+            return False
+        if self.max_seconds and self.buffered_ms >= self.max_seconds * 1000:
+            return False
+        return True
+    
+    def _trace_enqueue(self, item: AudioItem) -> None:
+        """Stamp the enqueue time and record it on the item's trace."""
+        item.enqueued_at_ns = time.time_ns()
+        if not tracer.is_sampled(item.trace_id):
+            return  # Skip building span attributes on the hot path
+        tracer.record_span(
+            "playlist.enqueue", item.trace_id, item.enqueued_at_ns, kind=KIND_PRODUCER,
+            attributes={"playlist.size": len(self.playlist), "playlist.buffered_ms": self.buffered_ms},
+        )
     
-    async def add_to_playlist(self, item: AudioItem) -> None:
-        """Add an audio item to the playlist."""
+    def _is_stale_epoch(self, epoch: Optional[int]) -> bool:
+        return epoch is not None and epoch != self.epoch
+    
+    def _is_stale(self, item: AudioItem) -> bool:
+        return self._is_stale_epoch(item.epoch)
+    
+    async def add_to_playlist(self, item: AudioItem) -> bool:
+        """Add an audio item to the playlist.
+        
+        Returns:
+            False if the item was made for an earlier topic epoch and was dropped
+        """
         async with self.lock:
+            if self._is_stale(item):
+                metrics.stale_items_dropped.inc()
+                return False
             self.playlist.append(item)
+            self._count_in(item)
+            self._update_buffer_metrics()
+            self._trace_enqueue(item)
+            return True
     
     async def add_batch_to_playlist(self, items: List[AudioItem]) -> None:
         """Add multiple audio items to the playlist."""
         async with self.lock:
             self.playlist.extend(items)
+            for item in items:
+                self._count_in(item)
+            self._update_buffer_metrics()
+            for item in items:
+                self._trace_enqueue(item)
+    
+    async def add_epoch_opening(self, items: List[AudioItem], epoch: int) -> bool:
+        """Queue items ahead of everything else queued for ``epoch``.
+        
+        For a scheduled slot's pre-rendered opening: it goes in before the
+        epoch's generated items however the generation job was scheduled,
+        and behind items not tied to it.
+        
+        Returns:
+            False if ``epoch`` is no longer current and the items were dropped
+        """
+        async with self.lock:
+            if self._is_stale_epoch(epoch):
+                metrics.stale_items_dropped.inc(len(items))
+                return False
+            for item in items:
+                item.epoch = epoch
+            head = next((i for i, queued in enumerate(self.playlist) if queued.epoch == epoch), len(self.playlist))
+            self.playlist[head:head] = items
+            for item in items:
+                self._count_in(item)
+            self._update_buffer_metrics()
+            for item in items:
+                self._trace_enqueue(item)
+            return True
     
     async def pop_from_playlist(self) -> Optional[AudioItem]:
         """Pop the first item from the playlist."""
         async with self.lock:
             if self.playlist:
-                return self.playlist.pop(0)
+                item = self.playlist.pop(0)
+                self._count_out(item)
+                self._update_buffer_metrics()
+                self.room.notify_all()
+                # The dequeue span covers the time the item spent queued
+                if tracer.is_sampled(item.trace_id):
+                    now_ns = time.time_ns()
+                    tracer.record_span(
+                        "playlist.dequeue", item.trace_id, item.enqueued_at_ns or now_ns, now_ns,
+                        kind=KIND_CONSUMER, attributes={"playlist.size": len(self.playlist)},
+                    )
+                return item
             return None
     
+    async def complete_item(self, item: AudioItem, audio_data: bytes, visemes: VisemeTrack, duration_ms: int) -> None:
+        """Fill in a streamed item's audio, visemes and duration once downloaded.
+        
+        Done under the lock, so the buffer totals stay in step whether or not
+        the item is still queued.
+        """
+        async with self.lock:
+            queued = any(queued is item for queued in self.playlist)
+            if queued:
+                self._count_out(item)
+            item.audio_data = audio_data
+            item.visemes = visemes
+            item.duration_ms = duration_ms
+            if queued:
+                self._count_in(item)
+                self._update_buffer_metrics()
+    
+    async def wait_for_room(self, epoch: Optional[int] = None) -> bool:
+        """Wait until queued audio is within the byte and duration budgets.
+        
+        Args:
+            epoch: Topic epoch the caller is producing for; stop waiting if it is superseded
+            
+        Returns:
+            False if ``epoch`` is no longer current (the caller's work is stale)
+        """
+        async with self.room:
+            if not self._has_room():
+                metrics.playlist_budget_waits.inc()
+                await self.room.wait_for(lambda: self._has_room() or self._is_stale_epoch(epoch))
+            return not self._is_stale_epoch(epoch)
+    
     async def get_playlist_size(self) -> int:
         """Get the current playlist size."""
         async with self.lock:
             return len(self.playlist)
     
+    async def get_buffered_seconds(self) -> float:
+        """Get the total duration of queued audio in seconds."""
+        async with self.lock:
+            return self.buffered_ms / 1000.0
+    
     async def clear_playlist(self) -> None:
         """Clear the entire playlist."""
         async with self.lock:
             self.playlist.clear()
+            self.buffered_ms = 0
+            self.buffered_bytes = 0
+            self._update_buffer_metrics()
+            self.room.notify_all()
     
     async def set_topic(self, topic: str) -> None:
         """Set the current streaming topic."""
         async with self.lock:
             self.current_topic = topic
     
+    async def switch_topic(self, topic: str) -> Optional[List[AudioItem]]:
+        """Set the topic, starting a new epoch if it changed.
+        
+        Queued items from earlier epochs are removed; fillers stay.
+        
+        Returns:
+            The removed items, or None if the topic didn't change
+        """
+        async with self.lock:
+            if self.current_topic is not None and normalize_topic(self.current_topic) == normalize_topic(topic):
+                self.current_topic = topic
+                return None
+            self.current_topic = topic
+            self.epoch += 1
+            self.epoch_started_at = time.monotonic()
+            dropped = [item for item in self.playlist if self._is_stale(item)]
+            if dropped:
+                self.playlist = [item for item in self.playlist if not self._is_stale(item)]
+                self._recount()
+                metrics.stale_items_dropped.inc(len(dropped))
+            self.room.notify_all()  # Producers waiting for the old epoch give up
+            return dropped
+    
+    def first_audio_after_switch(self, item: AudioItem) -> Optional[float]:
+        """Seconds since the topic change if ``item`` is the first of its epoch to air, else None."""
+        if self.epoch_started_at is None or item.epoch != self.epoch:
+            return None
+        elapsed = time.monotonic() - self.epoch_started_at
+        self.epoch_started_at = None
+        return elapsed
+    
     async def get_topic(self) -> Optional[str]:
         """Get the current streaming topic."""
         async with self.lock:
@@ -80,4 +316,7 @@ class GlobalState:
 
 
 # Global state instance
-global_state = GlobalState()
+global_state = GlobalState(
+    max_bytes=settings.playlist_max_bytes,
+    max_seconds=settings.playlist_max_seconds,
+)
@@ -352,6 +352,10 @@ class AIStreamer {
             case 'status':
                 this.handleStatusMessage(message);
                 break;
+            case 'ping':
+                // Heartbeat: the server drops clients that stop answering
+                this.ws.send(JSON.stringify({ type: 'pong', timestamp: message.timestamp }));
+                break;
             default:
                 console.log('Unknown message type:', message.type);
         }
@@ -368,8 +372,8 @@ class AIStreamer {
             const audioBytes = this.hexToBytes(message.audio_data);
             
             // Convert PCM bytes to AudioBuffer
-            // Assuming PCM format: 16-bit, mono, 24000 Hz sample rate
-            const sampleRate = 24000;
+            // PCM format: 16-bit, mono, at the rate reported by the server
+            const sampleRate = message.sample_rate || 24000;
             const numChannels = 1;
             const bytesPerSample = 2;
             const numSamples = audioBytes.length / bytesPerSample;
@@ -409,6 +413,9 @@ class AIStreamer {
         if (message.status === 'refilling') {
             this.updateStatus('playback', 'refilling', '生成新内容中...');
             document.getElementById('status-text').textContent = message.message;
+        } else if (message.status === 'degraded') {
+            this.updateStatus('playback', 'refilling', '内容服务不可用，重播近期内容...');
+            document.getElementById('status-text').textContent = message.message;
         }
     }
 
@@ -22,6 +22,26 @@ def main():
     test_files = [
         "test_config.py",
         "test_state.py",
+        "test_metrics.py",
+        "test_tracing.py",
+        "test_profiler.py",
+        "test_filler.py",
+        "test_jobs.py",
+        "test_audio.py",
+        "test_decoder.py",
+        "test_downloader.py",
+        "test_reservoir.py",
+        "test_llm_cache.py",
+        "test_epochs.py",
+        "test_broadcaster.py",
+        "test_hls.py",
+        "test_playlist_budget.py",
+        "test_schedule.py",
+        "test_replay.py",
+        "test_singleflight.py",
+        "test_providers.py",
+        "test_capture.py",
+        "test_logs.py",
         "test_llm.py",
         "test_tts_api_direct.py",  # Run this before test_tts.py to debug API
         "test_tts.py",
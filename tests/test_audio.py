@@ -0,0 +1,231 @@
+"""Test PCM segmentation and stitching for long scripts."""
+import os
+import sys
+import time
+import asyncio
+from pathlib import Path
+from types import SimpleNamespace
+
+import numpy as np
+
+# Add parent directory to path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from audio import split_sentences, stitch_pcm, pcm_duration_ms, postprocess_pcm, resample_pcm
+
+
+LONG_SCRIPT = (
+    "这款咖啡机采用意式高压萃取，十五巴压力让每一杯都香浓醇厚！"
+    "它还支持一键打奶泡，拿铁卡布奇诺随心做。"
+    "今天直播间下单立减五十元，还送咖啡豆一包，数量有限，先到先得哦！"
+)
+
+
+def test_split_sentences():
+    """Test splitting at Chinese punctuation boundaries."""
+    print("\n" + "="*60)
+    print("🧪 Testing Sentence Segmentation")
+    print("="*60)
+
+    assert split_sentences("短文案！", 30) == ["短文案！"]
+    assert split_sentences(LONG_SCRIPT, 0) == [LONG_SCRIPT]
+    assert split_sentences("  ", 30) == []
+
+    segments = split_sentences(LONG_SCRIPT, 30)
+    assert "".join(segments) == LONG_SCRIPT, "Segmentation must not lose text"
+    assert all(len(segment) <= 30 for segment in segments), segments
+    assert segments[0].endswith("！") and segments[1].endswith("。"), segments
+    print(f"   ✅ {len(segments)} segments: {segments}")
+
+    # Closing quotes stay with their sentence
+    assert split_sentences("“好的。”他说：哈哈！", 5) == ["“好的。”", "他说：", "哈哈！"]
+
+    # A run without any punctuation is hard-wrapped
+    assert [len(s) for s in split_sentences("啊" * 25, 10)] == [10, 10, 5]
+    print("   ✅ Quotes and hard wraps handled")
+
+
+def test_stitch_pcm():
+    """Test concatenation with boundary crossfades."""
+    print("\n" + "="*60)
+    print("🧪 Testing PCM Stitching")
+    print("="*60)
+
+    a = np.full(2400, 1000, dtype="<i2").tobytes()
+    b = np.full(2400, -1000, dtype="<i2").tobytes()
+
+    assert stitch_pcm([a, b], 24000) == a + b
+    assert stitch_pcm([a], 24000, 20) == a
+    assert stitch_pcm([], 24000) == b""
+
+    stitched = np.frombuffer(stitch_pcm([a, b, a], 24000, 20), dtype="<i2")
+    assert len(stitched) == 3 * 2400 - 2 * 480, len(stitched)
+    fade = stitched[2400 - 480:2400]
+    assert fade[0] == 1000 and fade[-1] == -1000, (fade[0], fade[-1])
+    assert np.all(np.diff(fade.astype(np.int32)) <= 0), "Crossfade should ramp monotonically"
+    assert pcm_duration_ms(stitched.tobytes(), 24000) == 260
+    print(f"   ✅ Stitched {len(stitched)} samples with 20ms crossfades")
+
+
+def test_postprocess_pcm():
+    """Test silence trimming, loudness normalization and edge fades."""
+    print("\n" + "="*60)
+    print("🧪 Testing Audio Post-Processing")
+    print("="*60)
+
+    rate = 24000
+    t = np.arange(int(rate * 0.5)) / rate
+    tone = (1000 * np.sin(2 * np.pi * 220 * t)).astype("<i2")  # About -33 dBFS RMS
+    noise = np.random.default_rng(0).integers(-20, 20, size=len(tone) * 2).astype("<i2")  # About -67 dBFS
+    pcm = np.concatenate([noise[:int(rate * 0.3)], tone, noise[:int(rate * 0.4)]]).tobytes()
+
+    processed, lead_trim = postprocess_pcm(pcm, rate, threshold_db=-45.0, target_dbfs=-20.0, fade_ms=10.0)
+    samples = np.frombuffer(processed, dtype="<i2")
+    assert abs(lead_trim - int(rate * 0.27)) <= rate * 0.01, lead_trim
+    assert abs(len(samples) - int(rate * 0.56)) <= rate * 0.02, len(samples)
+    print(f"   ✅ Trimmed {pcm_duration_ms(pcm, rate) - pcm_duration_ms(processed, rate)}ms of silence")
+
+    speech = samples[int(rate * 0.05):-int(rate * 0.05)].astype(np.float64) / 32768.0
+    level_db = 10 * np.log10(np.mean(speech ** 2))
+    assert abs(level_db - (-20.0)) < 1.0, f"Expected about -20 dBFS, got {level_db:.1f}"
+    assert abs(int(samples[0])) <= 1 and abs(int(samples[-1])) <= 1, "Edges should fade to silence"
+    print(f"   ✅ Normalized to {level_db:.1f} dBFS with faded edges")
+
+    # Loud input is attenuated without clipping
+    loud = (32000 * np.sin(2 * np.pi * 220 * t)).astype("<i2").tobytes()
+    processed, _ = postprocess_pcm(loud, rate, target_dbfs=-20.0)
+    assert np.max(np.abs(np.frombuffer(processed, dtype="<i2"))) < 32767 * 0.2
+
+    # Pure silence is passed through untouched
+    silence = bytes(4800)
+    assert postprocess_pcm(silence, rate) == (silence, 0)
+    print("   ✅ Loud and silent input handled")
+
+
+def test_resample_pcm():
+    """Test polyphase resampling accuracy and anti-aliasing."""
+    print("\n" + "="*60)
+    print("🧪 Testing Polyphase Resampling")
+    print("="*60)
+
+    rate = 24000
+    t = np.arange(rate) / rate
+    tone = (10000 * np.sin(2 * np.pi * 1000 * t)).astype("<i2").tobytes()
+    assert resample_pcm(tone, rate, rate) is tone
+
+    for target in (16000, 22050, 48000):
+        out = np.frombuffer(resample_pcm(tone, rate, target), dtype="<i2")
+        assert len(out) == target, f"{target}: {len(out)} samples"
+        expected = 10000 * np.sin(2 * np.pi * 1000 * np.arange(len(out)) / target)
+        middle = slice(len(out) // 4, 3 * len(out) // 4)
+        error = np.max(np.abs(out[middle] - expected[middle]))
+        assert error < 10, f"{target}: max error {error}"
+        print(f"   ✅ 24000 -> {target} Hz, max error {error:.1f}")
+
+    # A 10 kHz tone is above the 8 kHz Nyquist limit of 16 kHz audio and must be filtered out
+    high = (10000 * np.sin(2 * np.pi * 10000 * t)).astype("<i2").tobytes()
+    out = np.frombuffer(resample_pcm(high, rate, 16000), dtype="<i2").astype(np.float64)
+    assert np.sqrt(np.mean(out[1000:-1000] ** 2)) < 50, "Aliasing not suppressed"
+    print("   ✅ Out-of-band tone suppressed")
+
+
+def test_stream_sample_rate():
+    """Test that /ws/stream clients receive their requested sample rate."""
+    print("\n" + "="*60)
+    print("🧪 Testing Per-Client Sample Rate")
+    print("="*60)
+
+    from fastapi.testclient import TestClient
+    from starlette.websockets import WebSocketDisconnect
+    import main
+    from state import global_state, AudioItem
+
+    item = AudioItem(
+        text="测试文本",
+        audio_data=np.zeros(2400, dtype="<i2").tobytes(),
+        visemes=[],
+        duration_ms=100,
+        created_at=None,
+    )
+    client = TestClient(main.app)
+    asyncio.run(global_state.clear_playlist())
+    asyncio.run(global_state.add_to_playlist(item))
+    try:
+        with client.websocket_connect("/ws/stream?sample_rate=16000") as ws:
+            chunk = ws.receive_json()
+        assert chunk["sample_rate"] == 16000, chunk["sample_rate"]
+        assert len(bytes.fromhex(chunk["audio_data"])) == 1600 * 2
+        assert set(item.variants) == {16000}, "Variant should be cached on the item"
+        print("   ✅ Received 16 kHz audio, variant cached")
+
+        try:
+            with client.websocket_connect("/ws/stream?sample_rate=12345") as ws:
+                ws.receive_json()
+            raise AssertionError("Unsupported sample rate was accepted")
+        except WebSocketDisconnect as e:
+            assert e.code == 1008, e.code
+        print("   ✅ Unsupported sample rate rejected")
+    finally:
+        asyncio.run(global_state.clear_playlist())
+
+
+def test_parallel_segment_synthesis():
+    """Test that text_to_speech synthesizes segments in parallel and merges the result."""
+    print("\n" + "="*60)
+    print("🧪 Testing Parallel Segment Synthesis")
+    print("="*60)
+
+    import ai_service as ai_service_module
+    from ai_service import ai_service
+    from config import settings
+
+    calls = []
+
+    def fake_call(**kwargs):
+        calls.append(kwargs["text"])
+        time.sleep(0.2)
+        audio = np.full(4800, 100, dtype="<i2").tobytes()  # 200ms per segment
+        return SimpleNamespace(status_code=200, get_audio_data=lambda: audio)
+
+    original_call = ai_service_module.dashscope.MultiModalConversation.call
+    original_max_chars = settings.tts_segment_max_chars
+    ai_service_module.dashscope.MultiModalConversation.call = fake_call
+    settings.tts_segment_max_chars = 30
+    try:
+        started = time.perf_counter()
+        result = asyncio.run(ai_service.text_to_speech(LONG_SCRIPT))
+        elapsed = time.perf_counter() - started
+    finally:
+        ai_service_module.dashscope.MultiModalConversation.call = original_call
+        settings.tts_segment_max_chars = original_max_chars
+
+    segments = split_sentences(LONG_SCRIPT, 30)
+    assert sorted(calls) == sorted(segments), calls
+    assert elapsed < 0.2 * len(segments) * 0.75, f"Segments were not synthesized in parallel ({elapsed:.2f}s)"
+    print(f"   ✅ {len(calls)} segments synthesized in {elapsed:.2f}s")
+
+    crossfade = int(24000 * settings.tts_crossfade_ms / 1000)
+    expected_samples = len(segments) * 4800 - (len(segments) - 1) * crossfade
+    assert len(result["audio_data"]) == expected_samples * 2
+    assert result["duration_ms"] == pcm_duration_ms(result["audio_data"], 24000)
+    offsets = [viseme["offset"] for viseme in result["visemes"]]
+    assert offsets == sorted(offsets), "Viseme tracks must be in order"
+    assert offsets[-1] < result["duration_ms"] / 1000.0
+    print(f"   ✅ Stitched {result['duration_ms']}ms with {len(offsets)} visemes")
+
+
+if __name__ == "__main__":
+    try:
+        test_split_sentences()
+        test_stitch_pcm()
+        test_postprocess_pcm()
+        test_resample_pcm()
+        test_stream_sample_rate()
+        test_parallel_segment_synthesis()
+        print("\n✅ Audio test passed!")
+        sys.exit(0)
+    except Exception as e:
+        print(f"\n❌ Audio test failed: {e}")
+        import traceback
+        traceback.print_exc()
+        sys.exit(1)
@@ -0,0 +1,290 @@
+"""Test per-client send queues, heartbeats and the shared playout."""
+import sys
+import json
+import time
+import asyncio
+from pathlib import Path
+
+# Add parent directory to path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from broadcaster import (
+    Broadcaster, ClientConnection, serialize_message,
+    DISCONNECTED, SEND_TIMEOUT, HEARTBEAT_TIMEOUT, FORMAT_JSON, FORMAT_BINARY,
+)
+
+
+class FakeWebSocket:
+    """Records sent payloads; optionally slow, stuck, or answering pings."""
+
+    def __init__(self, send_delay: float = 0.0, answers_pings: bool = True):
+        self.send_delay = send_delay
+        self.answers_pings = answers_pings
+        self.sent = []
+        self.inbox = asyncio.Queue()
+
+    async def send_text(self, payload):
+        await asyncio.sleep(self.send_delay)
+        self.sent.append(json.loads(payload))
+        if self.answers_pings and self.sent[-1]["type"] == "ping":
+            self.inbox.put_nowait({"type": "websocket.receive", "text": '{"type":"pong"}'})
+
+    async def receive(self):
+        return await self.inbox.get()
+
+
+def test_bounded_queue_skips_ahead():
+    """Test that a full queue drops its oldest message instead of blocking."""
+    print("\n" + "="*60)
+    print("🧪 Testing Bounded Send Queue")
+    print("="*60)
+
+    client = ClientConnection(FakeWebSocket(), "test", max_queue=2)
+    results = [client.send(serialize_message({"seq": i})) for i in range(4)]
+    assert results == [True, True, False, False], results
+    assert client.dropped == 2 and [json.loads(p)["seq"] for p in client._queue] == [2, 3]
+    print("   ✅ Oldest messages dropped, newest kept")
+
+
+def test_slow_client_does_not_hold_up_others():
+    """Test that fan-out never waits for a slow client and keeps each client's order."""
+    print("\n" + "="*60)
+    print("🧪 Testing Slow Consumer Isolation")
+    print("="*60)
+
+    async def run():
+        broadcaster = Broadcaster()
+        fast = ClientConnection(FakeWebSocket(), "fast", max_queue=4)
+        slow = ClientConnection(FakeWebSocket(send_delay=0.05), "slow", max_queue=4)
+        tasks = []
+        for client in (fast, slow):
+            broadcaster.add(client)
+            tasks.append(asyncio.create_task(client.run()))
+
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        for seq in range(20):
+            broadcaster.publish(lambda rate, wire_format: serialize_message({"type": "audio_chunk", "seq": seq}))
+            await asyncio.sleep(0.005)
+        publish_time = loop.time() - started
+        await asyncio.sleep(0.3)
+        for task in tasks:
+            task.cancel()
+        return fast, slow, publish_time
+
+    fast, slow, publish_time = asyncio.run(run())
+    fast_seqs = [m["seq"] for m in fast.websocket.sent]
+    slow_seqs = [m["seq"] for m in slow.websocket.sent]
+    assert fast_seqs == list(range(20)), fast_seqs
+    assert slow.dropped > 0 and slow_seqs == sorted(slow_seqs) and slow_seqs[-1] == 19, slow_seqs
+    assert publish_time < 0.5, f"Publishing waited for the slow client ({publish_time:.2f}s)"
+    print(f"   ✅ Fast client got all 20, slow client skipped {slow.dropped} and caught up in order")
+
+
+def test_dead_peers_are_detected():
+    """Test stalled sends and missing pongs end the connection quickly."""
+    print("\n" + "="*60)
+    print("🧪 Testing Dead Peer Detection")
+    print("="*60)
+
+    async def serve(websocket, **kwargs):
+        client = ClientConnection(websocket, "peer", **kwargs)
+        client.send(serialize_message({"type": "status"}))
+        return await asyncio.wait_for(client.run(), timeout=2)
+
+    async def disconnect_after_pings(websocket):
+        await asyncio.sleep(0.3)
+        websocket.inbox.put_nowait({"type": "websocket.disconnect"})
+
+    async def run():
+        stuck = await serve(FakeWebSocket(send_delay=10), send_timeout=0.1)
+        silent = await serve(FakeWebSocket(answers_pings=False), ping_interval=0.05, ping_timeout=0.15)
+        alive_ws = FakeWebSocket()
+        closer = asyncio.create_task(disconnect_after_pings(alive_ws))
+        alive = await serve(alive_ws, ping_interval=0.05, ping_timeout=0.15)
+        await closer
+        return stuck, silent, alive, alive_ws
+
+    stuck, silent, alive, alive_ws = asyncio.run(run())
+    assert stuck == SEND_TIMEOUT, stuck
+    assert silent == HEARTBEAT_TIMEOUT, silent
+    assert alive == DISCONNECTED, "A client answering pings must not be dropped"
+    pings = sum(1 for m in alive_ws.sent if m["type"] == "ping")
+    assert pings >= 3, pings
+    print(f"   ✅ Stalled send -> {stuck}, no pongs -> {silent}")
+    print(f"   ✅ Client answering {pings} pings stayed connected until it left")
+
+
+def test_clients_share_one_playout():
+    """Test that connected clients hear the same items in playlist order."""
+    print("\n" + "="*60)
+    print("🧪 Testing Shared Playout")
+    print("="*60)
+
+    import numpy as np
+    from fastapi.testclient import TestClient
+    import main
+    from state import global_state, AudioItem
+
+    def item(text):
+        return AudioItem(
+            text=text, audio_data=np.zeros(7200, dtype="<i2").tobytes(),
+            visemes=[], duration_ms=300, created_at=None,
+        )
+
+    asyncio.run(global_state.clear_playlist())
+    try:
+        with TestClient(main.app) as client:
+            asyncio.run(global_state.add_batch_to_playlist([item("第一条"), item("第二条")]))
+            with client.websocket_connect("/ws/stream") as first:
+                assert first.receive_json()["text"] == "第一条"
+                with client.websocket_connect("/ws/stream?sample_rate=16000") as second:
+                    joined = second.receive_json()
+                    if "offset_ms" in joined:
+                        joined = second.receive_json()  # Joined mid-item (see test_late_join_starts_mid_item)
+                    following = first.receive_json()
+            size = asyncio.run(global_state.get_playlist_size())
+    finally:
+        asyncio.run(global_state.clear_playlist())
+
+    assert following["text"] == joined["text"] == "第二条", (following, joined)
+    assert joined["sample_rate"] == 16000 and following["sample_rate"] == 24000
+    assert size == 0, "Items must not be put back on the playlist"
+    print("   ✅ Both clients heard 第二条 at their own sample rates, playlist consumed once")
+
+
+def test_late_join_starts_mid_item():
+    """Test that a late client gets the rest of the live item with matching visemes."""
+    print("\n" + "="*60)
+    print("🧪 Testing Live-Position Join")
+    print("="*60)
+
+    import numpy as np
+    from fastapi.testclient import TestClient
+    import main
+    from state import global_state, AudioItem
+
+    # Sample values count up so the received slice reveals its offset
+    pcm = (np.arange(24000) % 30000).astype("<i2")
+    visemes = [{"offset": i / 10, "coefficients": [i]} for i in range(10)]
+    item = AudioItem(
+        text="现在播出", audio_data=pcm.tobytes(), visemes=visemes, duration_ms=1000, created_at=None,
+    )
+
+    message = main.build_audio_message(item, offset_ms=250)
+    assert bytes.fromhex(message["audio_data"]) == pcm[6000:].tobytes()
+    assert message["duration_ms"] == 750 and message["offset_ms"] == 250
+    assert [v["coefficients"][0] for v in message["visemes"]] == list(range(2, 10))
+    assert message["visemes"][0]["offset"] == 0.0 and abs(message["visemes"][1]["offset"] - 0.05) < 1e-9
+    print("   ✅ PCM sliced at the offset, visemes cut and re-timed")
+
+    asyncio.run(global_state.clear_playlist())
+    try:
+        with TestClient(main.app) as client:
+            asyncio.run(global_state.add_to_playlist(item))
+            with client.websocket_connect("/ws/stream") as first:
+                first.receive_json()
+                time.sleep(0.4)
+                with client.websocket_connect("/ws/stream") as late:
+                    joined = late.receive_json()
+    finally:
+        asyncio.run(global_state.clear_playlist())
+
+    audio = np.frombuffer(bytes.fromhex(joined["audio_data"]), dtype="<i2")
+    assert joined["text"] == "现在播出" and 300 <= joined["offset_ms"] <= 700, joined["offset_ms"]
+    assert audio[0] == int(joined["offset_ms"] * 24), "Audio should start at the live position"
+    assert joined["duration_ms"] == 1000 - joined["offset_ms"]
+    print(f"   ✅ Late client joined {joined['offset_ms']}ms into the live item")
+
+
+def test_frames_encoded_once():
+    """Test that an item is encoded once per rate and format and shared by all clients."""
+    print("\n" + "="*60)
+    print("🧪 Testing Encode-Once Wire Frames")
+    print("="*60)
+
+    import struct
+    import numpy as np
+    from fastapi.testclient import TestClient
+    from starlette.websockets import WebSocketDisconnect
+    import main
+    from state import global_state, AudioItem
+
+    pcm = (np.arange(4800) % 1000).astype("<i2").tobytes()
+    item = AudioItem(
+        text="编码一次", audio_data=pcm, visemes=[{"offset": 0.0, "coefficients": [0.5]}],
+        duration_ms=200, created_at=None, is_filler=True,
+    )
+    clients = [
+        ClientConnection(None, "json-native"),
+        ClientConnection(None, "json-24k", sample_rate=24000),
+        ClientConnection(None, "binary", wire_format=FORMAT_BINARY),
+        ClientConnection(None, "binary-2", wire_format=FORMAT_BINARY),
+    ]
+    encoded = []
+    original_encode = main.encode_audio
+
+    def counting_encode(header, audio, wire_format=FORMAT_JSON):
+        encoded.append(wire_format)
+        return original_encode(header, audio, wire_format)
+
+    main.encode_audio = counting_encode
+    try:
+        for client in clients:
+            main.broadcaster.add(client)
+        asyncio.run(main.air_item(item))
+        asyncio.run(main.air_item(item))  # Filler clips air again without re-encoding
+    finally:
+        main.encode_audio = original_encode
+        for client in clients:
+            main.broadcaster.remove(client)
+
+    assert sorted(encoded) == [FORMAT_BINARY, FORMAT_JSON], encoded
+    assert set(item.frames) == {(24000, FORMAT_JSON), (24000, FORMAT_BINARY)}
+    assert clients[0]._queue[0] is clients[1]._queue[0] and clients[2]._queue[0] is clients[3]._queue[0]
+    print(f"   ✅ 4 clients, 2 airings, {len(encoded)} encodes; clients share the prebuilt payloads")
+
+    frame = clients[2]._queue[0]
+    (header_length,) = struct.unpack(">I", frame[:4])
+    header = json.loads(frame[4:4 + header_length])
+    assert frame[4 + header_length:] == pcm and "audio_data" not in header
+    assert header["text"] == "编码一次" and header["visemes"] == [{"offset": 0.0, "coefficients": [0.5]}]
+    assert len(frame) < len(clients[0]._queue[0]) * 0.6, "Binary frames skip the hex doubling"
+    print(f"   ✅ Binary frame {len(frame)} bytes vs JSON {len(clients[0]._queue[0])}")
+
+    asyncio.run(global_state.clear_playlist())
+    try:
+        with TestClient(main.app) as client:
+            asyncio.run(global_state.add_to_playlist(
+                AudioItem(text="二进制", audio_data=pcm, visemes=[], duration_ms=200, created_at=None)
+            ))
+            with client.websocket_connect("/ws/stream?format=binary") as ws:
+                frame = ws.receive_bytes()
+            try:
+                with client.websocket_connect("/ws/stream?format=xml"):
+                    raise AssertionError("Unknown format accepted")
+            except WebSocketDisconnect as e:
+                rejected = e.code
+    finally:
+        asyncio.run(global_state.clear_playlist())
+    (header_length,) = struct.unpack(">I", frame[:4])
+    assert json.loads(frame[4:4 + header_length])["text"] == "二进制" and frame[4 + header_length:] == pcm
+    assert rejected == 1008, rejected
+    print("   ✅ ?format=binary served over WebSocket, unknown formats rejected")
+
+
+if __name__ == "__main__":
+    try:
+        test_bounded_queue_skips_ahead()
+        test_slow_client_does_not_hold_up_others()
+        test_dead_peers_are_detected()
+        test_clients_share_one_playout()
+        test_late_join_starts_mid_item()
+        test_frames_encoded_once()
+        print("\n✅ Broadcaster test passed!")
+        sys.exit(0)
+    except Exception as e:
+        print(f"\n❌ Broadcaster test failed: {e}")
+        import traceback
+        traceback.print_exc()
+        sys.exit(1)
@@ -0,0 +1,171 @@
+"""Test traffic capture and its replay against a local server."""
+import sys
+import json
+import asyncio
+import tempfile
+import importlib.util
+from pathlib import Path
+from urllib.parse import urlencode
+
+# Add parent directory to path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from capture import TrafficRecorder, load_captures
+from providers import ProviderRouter, RecordedProvider, LocalScriptProvider
+
+
+def _load_replay_tool():
+    path = Path(__file__).parent.parent / "benchmarks" / "replay_traffic.py"
+    spec = importlib.util.spec_from_file_location("replay_traffic", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def test_recorder_appends_captures():
+    """Test that events are written compactly, one capture after another."""
+    print("\n" + "="*60)
+    print("🧪 Testing Traffic Recorder")
+    print("="*60)
+
+    now = [100.0]
+    recorder = TrafficRecorder(clock=lambda: now[0])
+    with tempfile.TemporaryDirectory() as tmp:
+        path = str(Path(tmp) / "capture.jsonl")
+        recorder.record("api", m="GET", p="/api/status")  # Not capturing yet
+        recorder.start(path, providers={"llm": [["local:templates", 0.0]]})
+        now[0] = 101.5
+        recorder.record("ws_open", id=recorder.new_session_id())
+        recorder.record("api", at=101.0, m="POST", p="/api/start_stream", q="topic=咖啡机", s=202, d=0.5)
+        recorder.stop()
+        recorder.record("ws_close", id=1)  # Stopped
+        recorder.start(path)
+        recorder.record("up", u="tts", p="local:tones", d=0.2, ok=1)
+        recorder.stop()
+        raw = Path(path).read_text(encoding="utf-8")
+        with open(path, "a", encoding="utf-8") as f:
+            f.write('{"t": 3, "k": "up", "u"')  # Cut off by a crash
+        captures = load_captures(path)
+
+    assert ', ' not in raw and "咖啡机" in raw, "Compact separators, text kept readable"
+    assert len(captures) == 2
+    first, second = captures
+    assert first.header["providers"] == {"llm": [["local:templates", 0.0]]}
+    assert [(event["k"], event["t"]) for event in first.events] == [("api", 1.0), ("ws_open", 1.5)], first.events
+    assert first.duration == 1.5
+    assert second.upstream_calls() == {"tts": {"local:tones": [(0.2, True)]}}
+    print(f"   ✅ {len(captures)} captures read back, events ordered by arrival, truncated line skipped")
+
+
+def test_recorded_provider_replays_latencies():
+    """Test that stubs reproduce recorded latencies and failures in order."""
+    print("\n" + "="*60)
+    print("🧪 Testing Recorded Provider Stubs")
+    print("="*60)
+
+    async def run():
+        flaky = RecordedProvider("dashscope:qwen-turbo", [(0.05, True), (0.01, False)], cost=1.0)
+        backup = RecordedProvider("dashscope:qwen-plus", [], cost=4.0, default_seconds=0.0)
+        router = ProviderRouter("llm", [flaky, backup], error_penalty_seconds=0, cost_weight_seconds=0.001)
+        loop = asyncio.get_running_loop()
+        timings = []
+        for _ in range(3):
+            started = loop.time()
+            text = await router.call(lambda provider: provider.complete('话题"咖啡机"，3 条', 100, 0.8))
+            timings.append(loop.time() - started)
+        return flaky, backup, timings, text
+
+    flaky, backup, timings, text = asyncio.run(run())
+    assert flaky.name == "dashscope:qwen-turbo" and backup.cost == 4.0
+    assert flaky.replayed == 2 and backup.replayed == 2, "Recorded failure failed over, then the faster backup leads"
+    assert timings[0] >= 0.05 and timings[1] >= 0.01, timings
+    assert text == asyncio.run(LocalScriptProvider().complete('话题"咖啡机"，3 条', 100, 0.8))
+    print(f"   ✅ Calls took {', '.join(f'{t * 1000:.0f}ms' for t in timings)}, recorded failure failed over")
+
+
+def test_capture_and_replay_round_trip():
+    """Test that a captured session replays against a local server with stubbed upstreams."""
+    print("\n" + "="*60)
+    print("🧪 Testing Capture and Replay")
+    print("="*60)
+
+    from fastapi.testclient import TestClient
+    import main
+    from capture import traffic_recorder
+    from state import global_state
+    from replay import replay_history
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = str(Path(tmp) / "capture.jsonl")
+        traffic_recorder.start(path, providers={"llm": [["dashscope:qwen-turbo", 1.0]]})
+        try:
+            with TestClient(main.app) as client:
+                client.get("/api/status")
+                client.put("/api/schedule", json={"slots": []})
+                with client.websocket_connect("/ws/stream?format=binary"):
+                    pass
+                client.get("/static/missing.js")  # Not an API call
+        finally:
+            traffic_recorder.stop()
+        captured = load_captures(path)[0]
+
+    kinds = [(event["k"], event.get("p")) for event in captured.events]
+    assert kinds == [("api", "/api/status"), ("api", "/api/schedule"), ("ws_open", None), ("ws_close", None)], kinds
+    status, schedule, ws_open, _ = captured.events
+    assert status["s"] == 200 and status["d"] >= 0 and json.loads(schedule["b"]) == {"slots": []}
+    assert ws_open["q"] == "format=binary"
+    print(f"   ✅ Captured {len(captured.events)} events from API calls and a WebSocket session")
+
+    capture_lines = [
+        {"k": "capture", "v": 1, "started": "2024-01-01T20:00:00", "providers": {
+            "llm": [["dashscope:qwen-turbo", 1.0]], "tts": [["dashscope:qwen3-tts-flash", 1.0]],
+        }},
+        {"t": 0.0, "k": "ws_open", "id": 1},
+        {"t": 0.2, "k": "api", "m": "POST", "p": "/api/start_stream", "q": urlencode({"topic": "重放测试"}), "s": 202, "d": 0.01},
+        {"t": 0.2, "k": "api", "m": "GET", "p": "/api/jobs/abc123", "s": 200, "d": 0.002},  # Before start_stream returns
+        {"t": 0.3, "k": "up", "u": "llm", "p": "dashscope:qwen-turbo", "d": 0.1, "ok": 1},
+        {"t": 0.4, "k": "api", "m": "GET", "p": "/api/jobs/abc123", "s": 200, "d": 0.002},
+        {"t": 0.5, "k": "up", "u": "tts", "p": "dashscope:qwen3-tts-flash", "d": 0.05, "ok": 1},
+        {"t": 3.0, "k": "ws_close", "id": 1},
+    ]
+    replay_tool = _load_replay_tool()
+    original_llm, original_tts = main.ai_service.llm, main.ai_service.tts
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "capture.jsonl"
+        path.write_text("\n".join(json.dumps(line) for line in capture_lines) + "\n", encoding="utf-8")
+        capture = load_captures(str(path))[0]
+        try:
+            report = asyncio.run(replay_tool.Replayer(capture, speed=2.0).run())
+        finally:
+            asyncio.run(global_state.set_streaming(False))
+            asyncio.run(global_state.clear_playlist())
+            replay_history.clear()
+
+    assert main.ai_service.llm is original_llm and main.ai_service.tts is original_tts, "Providers restored"
+    assert 1.4 <= report["wall_seconds"] < 3.0, report["wall_seconds"]
+    assert report["api"]["POST /api/start_stream"]["status_mismatches"] == 0, report["api"]
+    jobs = report["api"]["GET /api/jobs/{job_id}"]
+    assert jobs["count"] == 2 and jobs["status_mismatches"] == 0, "Recorded job id mapped to the replayed job"
+    assert report["ws"]["sessions"] == 1 and report["ws"]["failed"] == 0 and report["ws"]["first_audio_p50_ms"] is not None, report["ws"]
+    assert report["upstream"]["llm"]["replayed_calls"] >= 1 and report["upstream"]["tts"]["replayed_calls"] >= 1
+    print(f"   ✅ Replayed at 2x in {report['wall_seconds']:.2f}s, first audio after {report['ws']['first_audio_p50_ms']:.0f}ms")
+
+    slower = json.loads(json.dumps(report))
+    slower["ws"]["first_audio_p95_ms"] = report["ws"]["first_audio_p95_ms"] + 1000
+    assert replay_tool.compare(slower, report, 0.5) == ["ws first_audio_p95_ms"]
+    assert replay_tool.compare(report, report, 0.5) == []
+    print("   ✅ Regression against a baseline report detected")
+
+
+if __name__ == "__main__":
+    try:
+        test_recorder_appends_captures()
+        test_recorded_provider_replays_latencies()
+        test_capture_and_replay_round_trip()
+        print("\n✅ Capture test passed!")
+        sys.exit(0)
+    except Exception as e:
+        print(f"\n❌ Capture test failed: {e}")
+        import traceback
+        traceback.print_exc()
+        sys.exit(1)
@@ -0,0 +1,179 @@
+"""Test decoding of WAV and compressed TTS responses to PCM."""
+import os
+import sys
+import time
+import shutil
+import struct
+import asyncio
+import tempfile
+from pathlib import Path
+from types import SimpleNamespace
+
+import numpy as np
+
+# Add parent directory to path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from decoder import DecodeError, FFmpegDecoderPool, decode_audio, parse_wav, sniff_format
+
+
+def _make_wav(samples: np.ndarray, sample_rate: int, bits: int = 16, channels: int = 1, extra_chunk: bool = False) -> bytes:
+    """Build a WAV file from int16-scaled samples (interleaved when multi-channel)."""
+    if bits == 16:
+        data = samples.astype("<i2").tobytes()
+    elif bits == 24:
+        values = samples.astype(np.int32) << 8
+        data = np.stack([values & 0xFF, (values >> 8) & 0xFF, (values >> 16) & 0xFF], axis=1).astype(np.uint8).tobytes()
+    else:
+        raise ValueError(bits)
+    block_align = channels * bits // 8
+    fmt = struct.pack("<HHIIHH", 1, channels, sample_rate, sample_rate * block_align, block_align, bits)
+    chunks = b"fmt " + struct.pack("<I", len(fmt)) + fmt
+    if extra_chunk:
+        chunks += b"LIST" + struct.pack("<I", 3) + b"abc\x00"  # Odd size, padded
+    chunks += b"data" + struct.pack("<I", len(data)) + data
+    return b"RIFF" + struct.pack("<I", 4 + len(chunks)) + b"WAVE" + chunks
+
+
+def _write_fake_ffmpeg(directory: str, delay: float = 0.0) -> str:
+    """Write a stand-in for ffmpeg that copies stdin to stdout, ignoring its arguments."""
+    path = os.path.join(directory, "fake-ffmpeg")
+    with open(path, "w") as f:
+        f.write(f"#!/bin/sh\nsleep {delay}\nexec cat\n")
+    os.chmod(path, 0o755)
+    return path
+
+
+def test_sniff_format():
+    """Test container detection from magic bytes."""
+    print("\n" + "="*60)
+    print("🧪 Testing Format Sniffing")
+    print("="*60)
+
+    assert sniff_format(_make_wav(np.zeros(10), 24000)) == "wav"
+    assert sniff_format(b"ID3\x04\x00" + bytes(20)) == "mp3"
+    assert sniff_format(b"\xff\xfb\x90\x64" + bytes(20)) == "mp3"
+    assert sniff_format(b"\xff\xf1\x50\x80" + bytes(20)) == "aac"
+    assert sniff_format(b"OggS" + bytes(20)) == "ogg"
+    assert sniff_format(b"\x00\x00\x00\x20ftypM4A " + bytes(20)) == "mp4"
+    assert sniff_format(bytes(100)) == "pcm"
+    assert sniff_format(b"\xff\xff" * 50) == "pcm", "PCM starting with -1 samples is not MP3"
+    print("   ✅ Containers identified")
+
+
+def test_parse_wav():
+    """Test WAV parsing for different layouts."""
+    print("\n" + "="*60)
+    print("🧪 Testing WAV Parsing")
+    print("="*60)
+
+    tone = (8000 * np.sin(2 * np.pi * 440 * np.arange(2400) / 24000)).astype(np.int16)
+
+    pcm, rate = parse_wav(_make_wav(tone, 24000, extra_chunk=True))
+    assert rate == 24000 and pcm == tone.tobytes()
+    print("   ✅ 16-bit mono (with extra chunk)")
+
+    pcm, rate = parse_wav(_make_wav(tone, 24000, bits=24))
+    assert np.array_equal(np.frombuffer(pcm, dtype="<i2"), tone)
+    print("   ✅ 24-bit mono")
+
+    stereo = np.stack([tone, tone // 2], axis=1).reshape(-1)
+    pcm, rate = parse_wav(_make_wav(stereo, 24000, channels=2))
+    expected = np.rint((tone.astype(np.float32) + tone // 2) / 2)
+    assert np.array_equal(np.frombuffer(pcm, dtype="<i2"), expected.astype(np.int16))
+    print("   ✅ Stereo downmixed to mono")
+
+    try:
+        parse_wav(b"RIFF\x04\x00\x00\x00WAVE")
+        raise AssertionError("Malformed WAV accepted")
+    except DecodeError:
+        print("   ✅ Malformed WAV rejected")
+
+
+def test_decode_audio():
+    """Test PCM passthrough, WAV resampling and the ffmpeg subprocess path."""
+    print("\n" + "="*60)
+    print("🧪 Testing decode_audio")
+    print("="*60)
+
+    raw = bytes(4800)
+    assert asyncio.run(decode_audio(raw, 24000)) is raw
+
+    wav = _make_wav(np.zeros(4800, dtype=np.int16), 48000)
+    pcm = asyncio.run(decode_audio(wav, 24000))
+    assert len(pcm) == 2400 * 2, "48 kHz WAV should be resampled to 24 kHz"
+    print("   ✅ PCM passthrough and WAV resampling")
+
+    mp3 = b"ID3\x04\x00" + os.urandom(100_000)  # Larger than a pipe buffer
+    with tempfile.TemporaryDirectory() as tmp:
+        pool = FFmpegDecoderPool(_write_fake_ffmpeg(tmp), max_workers=2)
+        assert asyncio.run(decode_audio(mp3, 24000, pool=pool)) == mp3
+        print("   ✅ Data streamed through the decoder subprocess")
+
+        slow_pool = FFmpegDecoderPool(_write_fake_ffmpeg(tmp, delay=0.2), max_workers=2)
+
+        async def run_many():
+            return await asyncio.gather(*(slow_pool.decode(b"x", 24000) for _ in range(4)))
+
+        started = time.perf_counter()
+        asyncio.run(run_many())
+        elapsed = time.perf_counter() - started
+        assert elapsed >= 0.4, f"Pool should run at most 2 decoders at once ({elapsed:.2f}s)"
+        print(f"   ✅ Concurrency bounded ({elapsed:.2f}s for 4 decodes with 2 workers)")
+
+    missing = FFmpegDecoderPool("/nonexistent/ffmpeg")
+    try:
+        asyncio.run(missing.decode(mp3, 24000))
+        raise AssertionError("Missing ffmpeg not reported")
+    except DecodeError:
+        print("   ✅ Missing ffmpeg reported")
+
+    if shutil.which("ffmpeg"):
+        pool = FFmpegDecoderPool()
+        pcm = asyncio.run(pool.decode(_make_wav(np.zeros(4800, dtype=np.int16), 48000), 24000))
+        assert abs(len(pcm) - 4800) <= 64
+        print("   ✅ Real ffmpeg decode")
+
+
+def test_tts_wav_response_duration():
+    """Test that WAV responses yield PCM and an exact duration."""
+    print("\n" + "="*60)
+    print("🧪 Testing Exact Duration for WAV Responses")
+    print("="*60)
+
+    import ai_service as ai_service_module
+    from ai_service import ai_service
+    from config import settings
+
+    tone = (8000 * np.sin(2 * np.pi * 440 * np.arange(22050) / 22050)).astype(np.int16)
+    wav = _make_wav(tone, 22050)
+    response = SimpleNamespace(status_code=200, get_audio_data=lambda: wav)
+    original_call = ai_service_module.dashscope.MultiModalConversation.call
+    original_postprocess = settings.audio_postprocess_enabled
+    ai_service_module.dashscope.MultiModalConversation.call = lambda **kwargs: response
+    settings.audio_postprocess_enabled = False
+    try:
+        result = asyncio.run(ai_service.text_to_speech("测试文本"))
+    finally:
+        ai_service_module.dashscope.MultiModalConversation.call = original_call
+        settings.audio_postprocess_enabled = original_postprocess
+
+    assert not result["audio_data"].startswith(b"RIFF"), "WAV header leaked into PCM"
+    assert len(result["audio_data"]) == 24000 * 2, len(result["audio_data"])
+    assert result["duration_ms"] == 1000, result["duration_ms"]
+    print(f"   ✅ 1s WAV at 22.05 kHz -> {result['duration_ms']}ms of 24 kHz PCM")
+
+
+if __name__ == "__main__":
+    try:
+        test_sniff_format()
+        test_parse_wav()
+        test_decode_audio()
+        test_tts_wav_response_duration()
+        print("\n✅ Decoder test passed!")
+        sys.exit(0)
+    except Exception as e:
+        print(f"\n❌ Decoder test failed: {e}")
+        import traceback
+        traceback.print_exc()
+        sys.exit(1)
@@ -0,0 +1,222 @@
+"""Test streaming download of TTS audio URLs."""
+import sys
+import time
+import struct
+import asyncio
+from pathlib import Path
+from types import SimpleNamespace
+
+import httpx
+import numpy as np
+
+# Add parent directory to path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from downloader import AudioDownloader, DownloadError, PcmStream
+
+
+def _make_wav(samples: np.ndarray, sample_rate: int) -> bytes:
+    """Build a 16-bit mono WAV file."""
+    data = samples.astype("<i2").tobytes()
+    fmt = struct.pack("<HHIIHH", 1, 1, sample_rate, sample_rate * 2, 2, 16)
+    chunks = b"fmt " + struct.pack("<I", len(fmt)) + fmt + b"data" + struct.pack("<I", len(data)) + data
+    return b"RIFF" + struct.pack("<I", 4 + len(chunks)) + b"WAVE" + chunks
+
+
+def _slow_transport(body: bytes, pieces: int = 4, delay: float = 0.1) -> httpx.MockTransport:
+    """Serve ``body`` in ``pieces`` with ``delay`` seconds between them."""
+    size = -(-len(body) // pieces)
+
+    async def handler(request):
+        async def content():
+            for offset in range(0, len(body), size):
+                yield body[offset:offset + size]
+                await asyncio.sleep(delay)
+        return httpx.Response(200, content=content())
+
+    return httpx.MockTransport(handler)
+
+
+def test_pcm_stream():
+    """Test that readers follow a stream from the start while it fills in."""
+    print("\n" + "="*60)
+    print("🧪 Testing PcmStream")
+    print("="*60)
+
+    async def run():
+        stream = PcmStream(24000)
+        received = []
+
+        async def read():
+            async for chunk in stream.chunks(min_bytes=4):
+                received.append(chunk)
+
+        reader = asyncio.create_task(read())
+        stream.append(b"\x01\x00")
+        await asyncio.sleep(0)
+        assert not received, "Chunks smaller than min_bytes are held back"
+        stream.append(b"\x02\x00\x03\x00")
+        await asyncio.sleep(0)
+        stream.append(b"\x04\x00")
+        stream.finish()
+        await asyncio.wait_for(reader, timeout=1)
+
+        late = [chunk async for chunk in stream.chunks()]
+        failed = PcmStream(24000)
+        failed.finish(DownloadError("boom"))
+        try:
+            await failed.wait_complete()
+            raise AssertionError("Download error not raised")
+        except DownloadError:
+            pass
+        return received, late, await stream.wait_complete()
+
+    received, late, data = asyncio.run(run())
+    assert received == [b"\x01\x00\x02\x00\x03\x00", b"\x04\x00"], received
+    assert late == [data] and data == b"\x01\x00\x02\x00\x03\x00\x04\x00"
+    print(f"   ✅ Live reader got {len(received)} chunks, late reader got the whole clip")
+    print("   ✅ Download errors reach readers")
+
+
+def test_wav_frames_arrive_before_download_completes():
+    """Test that a WAV download is forwarded as PCM while it is still downloading."""
+    print("\n" + "="*60)
+    print("🧪 Testing Early Forwarding of Streamed WAV")
+    print("="*60)
+
+    tone = (8000 * np.sin(2 * np.pi * 440 * np.arange(24000) / 24000)).astype(np.int16)
+    downloader = AudioDownloader(transport=_slow_transport(_make_wav(tone, 24000), pieces=5, delay=0.1))
+
+    async def run():
+        stream = downloader.open("http://tts.test/audio.wav", 24000)
+        started = time.perf_counter()
+        first = None
+        async for chunk in stream.chunks(min_bytes=2400):
+            if first is None:
+                first = (time.perf_counter() - started, len(chunk), stream.done)
+        return first, await stream.wait_complete()
+
+    (first_at, first_len, done_then), pcm = asyncio.run(run())
+    assert not done_then, "First chunk should arrive before the download completes"
+    assert first_len >= 2400 and first_len % 2 == 0
+    assert pcm == tone.tobytes(), "Streamed PCM must match the WAV samples exactly"
+    print(f"   ✅ First {first_len} bytes after {first_at * 1000:.0f}ms, before the download finished")
+
+
+def test_buffered_decode_and_limits():
+    """Test resampled WAVs, body size limits, HTTP errors and the concurrency bound."""
+    print("\n" + "="*60)
+    print("🧪 Testing Buffered Decoding and Limits")
+    print("="*60)
+
+    wav = _make_wav(np.zeros(4800, dtype=np.int16), 48000)
+    pcm = asyncio.run(AudioDownloader(transport=_slow_transport(wav, delay=0)).fetch("http://tts.test/a.wav", 24000))
+    assert len(pcm) == 2400 * 2, "48 kHz WAV should be buffered and resampled to 24 kHz"
+    print("   ✅ WAV at another rate decoded once complete")
+
+    for downloader, reason in (
+        (AudioDownloader(max_bytes=1000, transport=_slow_transport(bytes(4000), delay=0)), "oversized body"),
+        (AudioDownloader(transport=httpx.MockTransport(lambda request: httpx.Response(404))), "HTTP 404"),
+    ):
+        try:
+            asyncio.run(downloader.fetch("http://tts.test/a.pcm", 24000))
+            raise AssertionError(f"{reason} not rejected")
+        except DownloadError:
+            print(f"   ✅ Rejected {reason}")
+
+    downloader = AudioDownloader(max_concurrent=2, transport=_slow_transport(bytes(4800), pieces=2, delay=0.1))
+
+    async def run_many():
+        return await asyncio.gather(*(downloader.fetch(f"http://tts.test/{i}.pcm", 24000) for i in range(4)))
+
+    started = time.perf_counter()
+    asyncio.run(run_many())
+    elapsed = time.perf_counter() - started
+    assert elapsed >= 0.4, f"At most 2 downloads should run at once ({elapsed:.2f}s)"
+    print(f"   ✅ Concurrency bounded ({elapsed:.2f}s for 4 downloads with 2 slots)")
+
+
+def test_tts_url_response():
+    """Test that a TTS response carrying output.audio.url is streamed and sent in chunks."""
+    print("\n" + "="*60)
+    print("🧪 Testing TTS URL Responses")
+    print("="*60)
+
+    import ai_service as ai_service_module
+    import main
+    from ai_service import ai_service
+    from broadcaster import ClientConnection
+    from config import settings
+    from state import AudioItem
+
+    tone = (8000 * np.sin(2 * np.pi * 440 * np.arange(12000) / 24000)).astype(np.int16)
+    response = SimpleNamespace(
+        status_code=200,
+        output=SimpleNamespace(audio=SimpleNamespace(url="http://tts.test/speech.wav")),
+    )
+    original_call = ai_service_module.dashscope.MultiModalConversation.call
+    original_downloader = ai_service_module.audio_downloader
+    original_chunk_ms = settings.stream_chunk_ms
+    ai_service_module.dashscope.MultiModalConversation.call = lambda **kwargs: response
+    ai_service_module.audio_downloader = AudioDownloader(transport=_slow_transport(_make_wav(tone, 24000), delay=0.05))
+    settings.stream_chunk_ms = 100
+
+    class FakeWebSocket:
+        def __init__(self):
+            self.sent = []
+
+        async def send_text(self, payload):
+            self.sent.append(payload)
+
+        async def receive(self):
+            await asyncio.Event().wait()
+
+    async def run():
+        result = await ai_service.text_to_speech("测试文本")
+        stream = await ai_service.open_speech_stream("测试文本")
+        item = AudioItem(text="测试文本", audio_data=b"", visemes=[], duration_ms=0, created_at=None, stream=stream)
+        websocket = FakeWebSocket()
+        client = ClientConnection(websocket, "test")
+        main.broadcaster.add(client)
+        serving = asyncio.create_task(client.run())
+        try:
+            await main.air_streamed_item(item)
+            await main.complete_streamed_item(item)
+            await asyncio.sleep(0.01)  # Let the writer drain the queue
+        finally:
+            main.broadcaster.remove(client)
+            serving.cancel()
+        return result, item, websocket.sent
+
+    try:
+        result, item, sent = asyncio.run(run())
+    finally:
+        ai_service_module.dashscope.MultiModalConversation.call = original_call
+        ai_service_module.audio_downloader = original_downloader
+        settings.stream_chunk_ms = original_chunk_ms
+
+    assert result["duration_ms"] > 0 and result["sample_rate"] == 24000
+    print(f"   ✅ text_to_speech fetched the URL: {result['duration_ms']}ms")
+
+    import json
+    messages = [json.loads(payload) for payload in sent]
+    assert len(messages) > 1, "Streamed item should be sent in several chunks"
+    assert [m["chunk_index"] for m in messages] == list(range(len(messages)))
+    assert b"".join(bytes.fromhex(m["audio_data"]) for m in messages) == tone.tobytes()
+    assert item.audio_data == tone.tobytes() and item.duration_ms == 500 and item.visemes
+    print(f"   ✅ Streamed item sent in {len(messages)} chunks, then completed ({item.duration_ms}ms)")
+
+
+if __name__ == "__main__":
+    try:
+        test_pcm_stream()
+        test_wav_frames_arrive_before_download_completes()
+        test_buffered_decode_and_limits()
+        test_tts_url_response()
+        print("\n✅ Downloader test passed!")
+        sys.exit(0)
+    except Exception as e:
+        print(f"\n❌ Downloader test failed: {e}")
+        import traceback
+        traceback.print_exc()
+        sys.exit(1)
@@ -0,0 +1,151 @@
+"""Test topic-switch epochs and cancellation of stale in-flight work."""
+import sys
+import asyncio
+from pathlib import Path
+
+# Add parent directory to path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from state import GlobalState, AudioItem
+from jobs import JobManager, JOB_FAILED
+
+
+def _item(text: str, epoch=None, is_filler: bool = False) -> AudioItem:
+    return AudioItem(
+        text=text, audio_data=b"\x00\x00" * 2400, visemes=[], duration_ms=100,
+        created_at=None, epoch=epoch, is_filler=is_filler,
+    )
+
+
+def test_switch_topic_drops_stale_items():
+    """Test that a topic change drops queued items from the previous epoch."""
+    print("\n" + "="*60)
+    print("🧪 Testing Topic Epochs in GlobalState")
+    print("="*60)
+
+    async def run():
+        state = GlobalState()
+        assert await state.switch_topic("咖啡机") == [] and state.epoch == 1
+        old = state.epoch
+        await state.add_batch_to_playlist([_item("a1", old), _item("filler", is_filler=True), _item("a2", old)])
+        assert await state.switch_topic("  咖啡机 ") is None, "Same topic shouldn't start an epoch"
+
+        dropped = await state.switch_topic("扫地机器人")
+        refused = not await state.add_to_playlist(_item("a3", old))
+        added = await state.add_to_playlist(_item("b1", state.epoch))
+        texts = [item.text for item in state.playlist]
+        first = state.first_audio_after_switch(state.playlist[-1])
+        again = state.first_audio_after_switch(state.playlist[-1])
+        return state, dropped, refused, added, texts, first, again
+
+    state, dropped, refused, added, texts, first, again = asyncio.run(run())
+    assert [item.text for item in dropped] == ["a1", "a2"], dropped
+    assert texts == ["filler", "b1"] and state.buffered_ms == 200, (texts, state.buffered_ms)
+    assert refused and added
+    print(f"   ✅ Epoch {state.epoch}: dropped {len(dropped)} old items, kept the filler")
+    assert first is not None and first >= 0 and again is None
+    print(f"   ✅ Switch latency reported once ({first * 1000:.1f}ms)")
+
+
+def test_cancel_stale_jobs():
+    """Test that only unfinished jobs from earlier epochs are cancelled."""
+    print("\n" + "="*60)
+    print("🧪 Testing Stale Job Cancellation")
+    print("="*60)
+
+    async def runner(job):
+        await asyncio.sleep(10)
+
+    async def run():
+        manager = JobManager()
+        running = manager.start("a", runner, epoch=1)
+        await asyncio.sleep(0)
+        pending = manager.start("a", runner, epoch=1)  # Cancelled before it starts
+        current = manager.start("b", runner, epoch=2)
+        untracked = manager.start("c", runner)
+        cancelled = manager.cancel_stale(2)
+        await asyncio.sleep(0)
+        statuses = [job.status for job in (running, pending, current, untracked)]
+        for job in (current, untracked):
+            job.task.cancel()
+        await asyncio.gather(*(job.task for job in manager.jobs.values()), return_exceptions=True)
+        return cancelled, statuses, running.error, pending.error
+
+    cancelled, statuses, running_error, pending_error = asyncio.run(run())
+    assert cancelled == 2, cancelled
+    assert statuses[:2] == [JOB_FAILED, JOB_FAILED] and JOB_FAILED not in statuses[2:], statuses
+    assert running_error == pending_error == "cancelled"
+    print(f"   ✅ Cancelled {cancelled} stale jobs, current and untracked jobs kept running")
+
+
+def test_start_stream_switch_cancels_old_topic():
+    """Test that switching topics cancels the old job and only new-topic audio is queued."""
+    print("\n" + "="*60)
+    print("🧪 Testing Topic Switch via start_stream")
+    print("="*60)
+
+    import main
+    from ai_service import ai_service
+    from config import settings
+    from state import global_state
+
+    synthesized = []
+
+    class FakeReservoir:
+        async def take(self, topic, count):
+            return [{"segment": None, "text": f"{topic}-{i}"} for i in range(count)]
+
+    async def fake_tts(text):
+        await asyncio.sleep(0.05)
+        synthesized.append(text)
+        return {"audio_data": b"\x00\x00" * 2400, "visemes": [], "duration_ms": 100, "sample_rate": 24000}
+
+    original_reservoir = main.script_reservoir
+    original_settings = (settings.stream_early_forward_seconds, settings.filler_enabled)
+    main.script_reservoir = FakeReservoir()
+    ai_service.text_to_speech = fake_tts
+    settings.stream_early_forward_seconds = 0
+    settings.filler_enabled = False
+
+    async def run():
+        await global_state.clear_playlist()
+        old = await main.start_stream("咖啡机")
+        await asyncio.sleep(0.12)  # Two old-topic items ready, the third in flight
+        new = await main.start_stream("扫地机器人")
+        old_job, new_job = main.job_manager.get(old["job_id"]), main.job_manager.get(new["job_id"])
+        await new_job.task
+        await asyncio.sleep(0.1)  # Old TTS calls would have finished by now
+        item = await global_state.pop_from_playlist()
+        main.observe_topic_switch(item)
+        return old_job, new_job, [item.text] + [queued.text for queued in global_state.playlist]
+
+    try:
+        old_job, new_job, texts = asyncio.run(run())
+    finally:
+        main.script_reservoir = original_reservoir
+        del ai_service.text_to_speech
+        settings.stream_early_forward_seconds, settings.filler_enabled = original_settings
+        asyncio.run(global_state.set_streaming(False))
+        asyncio.run(global_state.clear_playlist())
+
+    assert old_job.status == JOB_FAILED and old_job.error == "cancelled", old_job.to_dict()
+    assert new_job.epoch == old_job.epoch + 1 and new_job.items_enqueued == 5
+    assert texts == [f"扫地机器人-{i}" for i in range(5)], texts
+    old_calls = [text for text in synthesized if text.startswith("咖啡机")]
+    assert len(old_calls) <= 3, f"Old topic kept synthesizing: {old_calls}"
+    assert global_state.epoch_started_at is None, "Switch latency should have been observed"
+    print(f"   ✅ Old job cancelled after {len(old_calls)} TTS calls, playlist holds only the new topic")
+
+
+if __name__ == "__main__":
+    try:
+        test_switch_topic_drops_stale_items()
+        test_cancel_stale_jobs()
+        test_start_stream_switch_cancels_old_topic()
+        print("\n✅ Epochs test passed!")
+        sys.exit(0)
+    except Exception as e:
+        print(f"\n❌ Epochs test failed: {e}")
+        import traceback
+        traceback.print_exc()
+        sys.exit(1)
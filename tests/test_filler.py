@@ -0,0 +1,150 @@
+"""Test the filler clip pool that covers playlist underruns."""
+import os
+import sys
+import asyncio
+from pathlib import Path
+
+# Add parent directory to path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from filler import FillerPool, MAX_BRIDGE_TOPICS
+
+
+def _make_synthesize(calls, fail_on=()):
+    """Build a stub TTS function that records calls and fails on given lines."""
+    async def synthesize(text):
+        calls.append(text)
+        if text in fail_on:
+            raise Exception("TTS unavailable")
+        return {"audio_data": b"\x00\x00" * 240, "visemes": [{"offset": 0.0, "coefficients": [0.5]}], "duration_ms": 10}
+    return synthesize
+
+
+def test_refresh_and_rotation():
+    """Test that refresh synthesizes generic and bridging clips and playback rotates."""
+    print("\n" + "="*60)
+    print("🧪 Testing Filler Refresh and Rotation")
+    print("="*60)
+
+    calls = []
+    pool = FillerPool(
+        _make_synthesize(calls),
+        generic_lines=["欢迎", "点关注"],
+        bridge_templates=["说到{topic}"],
+    )
+    assert pool.next_filler("咖啡机") is None
+    assert pool.needs_refresh("咖啡机")
+
+    synthesized = asyncio.run(pool.refresh("咖啡机"))
+    assert synthesized == 3, f"Expected 3 clips, got {synthesized}"
+    assert pool.size("咖啡机") == 3
+    assert not pool.needs_refresh("咖啡机")
+    print(f"   ✅ Synthesized: {calls}")
+
+    played = [pool.next_filler("咖啡机").text for _ in range(6)]
+    assert played[:3] == ["说到咖啡机", "欢迎", "点关注"], played
+    assert played[3:] == played[:3], "Fillers should rotate"
+    item = pool.next_filler("咖啡机")
+    assert item.is_filler and item.visemes, "Clips keep their visemes"
+    print(f"   ✅ Rotation: {played[:3]}")
+
+    # A second refresh has nothing to do
+    assert asyncio.run(pool.refresh("咖啡机")) == 0
+    assert len(calls) == 3
+
+    # Spellings of one topic share its bridging clips
+    asyncio.run(pool.refresh("AI"))
+    assert not pool.needs_refresh("ai ") and pool.size(" Ａｉ") == 3
+    assert asyncio.run(pool.refresh("ai ")) == 0 and len(calls) == 4
+    print("   ✅ Bridging clips shared across spellings of a topic")
+
+
+def test_failed_lines_are_skipped():
+    """Test that TTS failures are skipped and retried on the next refresh."""
+    print("\n" + "="*60)
+    print("🧪 Testing Failed Filler Lines")
+    print("="*60)
+
+    calls = []
+    pool = FillerPool(_make_synthesize(calls, fail_on={"点关注"}), generic_lines=["欢迎", "点关注"], bridge_templates=[])
+    assert asyncio.run(pool.refresh(None)) == 1
+    assert pool.size() == 1
+    assert pool.needs_refresh(None), "Failed line should still be missing"
+    print("   ✅ Failed line skipped")
+
+    pool.synthesize = _make_synthesize(calls)
+    assert asyncio.run(pool.refresh(None)) == 1
+    assert pool.size() == 2
+    print("   ✅ Failed line retried")
+
+
+def test_stale_clips_and_eviction():
+    """Test that stale clips are re-synthesized and old topics evicted."""
+    print("\n" + "="*60)
+    print("🧪 Testing Stale Clips and Topic Eviction")
+    print("="*60)
+
+    calls = []
+    pool = FillerPool(_make_synthesize(calls), max_age_seconds=0, generic_lines=["欢迎"], bridge_templates=["说到{topic}"])
+    asyncio.run(pool.refresh("a"))
+    assert pool.needs_refresh("a"), "Clips older than max age should be stale"
+    print("   ✅ Stale clips detected")
+
+    pool.max_age_seconds = 3600
+    topics = [f"topic{i}" for i in range(MAX_BRIDGE_TOPICS + 2)]
+    for topic in topics:
+        asyncio.run(pool.refresh(topic))
+    asyncio.run(pool.refresh(topics[1]))  # Refreshing marks a topic as recent
+    assert len(pool.bridges) == MAX_BRIDGE_TOPICS
+    assert topics[-1] in pool.bridges and topics[1] in pool.bridges
+    assert "a" not in pool.bridges and topics[0] not in pool.bridges
+    print(f"   ✅ Kept bridging clips for: {list(pool.bridges)}")
+
+
+def test_underrun_plays_filler():
+    """Test that a client hears a filler clip the moment the playlist is empty."""
+    print("\n" + "="*60)
+    print("🧪 Testing Filler Playback on Underrun")
+    print("="*60)
+
+    from fastapi.testclient import TestClient
+    import main
+    from filler import filler_pool
+    from state import global_state
+
+    calls = []
+    original_trigger, original_synthesize = main.trigger_refill, filler_pool.synthesize
+    main.trigger_refill = lambda: False  # Keep the test offline
+    filler_pool.synthesize = _make_synthesize(calls)
+    try:
+        asyncio.run(filler_pool.refresh(None))
+
+        client = TestClient(main.app)
+        asyncio.run(global_state.clear_playlist())
+        asyncio.run(global_state.set_streaming(True))
+        with client.websocket_connect("/ws/stream") as ws:
+            status = ws.receive_json()
+            assert status["status"] == "refilling", status
+            chunk = ws.receive_json()
+            assert chunk["type"] == "audio_chunk" and chunk["is_filler"], chunk
+        print(f"   ✅ Filler played: {chunk['text']}")
+    finally:
+        asyncio.run(global_state.set_streaming(False))
+        main.trigger_refill = original_trigger
+        filler_pool.synthesize = original_synthesize
+        filler_pool.generic.clear()
+
+
+if __name__ == "__main__":
+    try:
+        test_refresh_and_rotation()
+        test_failed_lines_are_skipped()
+        test_stale_clips_and_eviction()
+        test_underrun_plays_filler()
+        print("\n✅ Filler test passed!")
+        sys.exit(0)
+    except Exception as e:
+        print(f"\n❌ Filler test failed: {e}")
+        import traceback
+        traceback.print_exc()
+        sys.exit(1)
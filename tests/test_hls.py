@@ -0,0 +1,177 @@
+"""Test HLS-style segmented delivery of the playout."""
+import sys
+import json
+import re
+from collections import Counter
+from pathlib import Path
+
+import numpy as np
+
+# Add parent directory to path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from hls import HlsSegmenter, parse_range
+from decoder import parse_wav
+
+
+def _tone(seconds: float, rate: int = 24000) -> bytes:
+    return (3000 * np.sin(2 * np.pi * 220 * np.arange(int(seconds * rate)) / rate)).astype("<i2").tobytes()
+
+
+def test_segmenter_cuts_timeline():
+    """Test segment boundaries, cue splitting and the rolling playlist."""
+    print("\n" + "="*60)
+    print("🧪 Testing HLS Segmenter")
+    print("="*60)
+
+    now = [0.0]
+    segmenter = HlsSegmenter(segment_seconds=2.0, playlist_segments=2, clock=lambda: now[0])
+    first = _tone(3.0)
+    segmenter.add_audio(first, 24000, "第一条", [{"offset": 0.5, "coefficients": [1]}, {"offset": 2.5, "coefficients": [2]}])
+    segmenter.add_audio(_tone(1.5, 16000), 16000, "第二条", is_filler=True)  # Resampled to 24 kHz
+    assert segmenter.get(0) is None and "segment_" not in segmenter.playlist(), "Nothing has aired yet"
+    now[0] = 4.5
+    assert [s.sequence for s in segmenter.segments] == [], "Published on request"
+    assert segmenter.get(1) is not None
+    assert [s.sequence for s in segmenter.segments] == [0, 1], "4.5s of audio -> two 2s segments"
+
+    pcm, rate = parse_wav(segmenter.segments[0].audio)
+    assert rate == 24000 and pcm == first[:96000], "Segment audio must be the aired PCM"
+    tracks = [json.loads(s.track) for s in segmenter.segments]
+    assert tracks[0]["subtitles"] == [{"start": 0, "end": 2000, "text": "第一条", "is_filler": False}]
+    assert tracks[1]["subtitles"] == [
+        {"start": 0, "end": 1000, "text": "第一条", "is_filler": False},
+        {"start": 1000, "end": 2000, "text": "第二条", "is_filler": True},
+    ], tracks[1]["subtitles"]
+    assert tracks[0]["visemes"] == [{"offset": 0.5, "coefficients": [1]}]
+    assert tracks[1]["visemes"] == [{"offset": 0.5, "coefficients": [2]}]
+    print("   ✅ Cues split at segment boundaries and re-timed")
+
+    segmenter.add_silence(2000)
+    now[0] = 6.0
+    playlist = segmenter.playlist()
+    assert "#EXT-X-MEDIA-SEQUENCE:1" in playlist and "#EXT-X-TARGETDURATION:2" in playlist
+    assert re.findall(r"segment_\d+\.wav", playlist) == ["segment_1.wav", "segment_2.wav"]
+    assert segmenter.get(0) is not None, "Segments just out of the window are still served"
+    print("   ✅ Playlist rolls forward with the media sequence")
+
+    segmenter = HlsSegmenter(segment_seconds=2.0, playlist_segments=2, clock=lambda: now[0])
+    now[0] = 100.0
+    segmenter.add_audio(_tone(30.0), 24000, "长条目")
+    published = []
+    for second in range(1, 31):
+        now[0] = 100.0 + second
+        published += [name for name in re.findall(r"segment_\d+\.wav", segmenter.playlist()) if name not in published]
+    assert published == [f"segment_{n}.wav" for n in range(15)], "Every segment of a long item listed in turn"
+    assert "#EXT-X-MEDIA-SEQUENCE:0" in HlsSegmenter(clock=lambda: 0.0).playlist()
+    print("   ✅ Segments of a 30s item published as it airs, none skipped")
+
+    # Idle gap: half a segment airs, nothing for ten minutes, then a 20s item
+    segmenter = HlsSegmenter(segment_seconds=2.0, playlist_segments=2, clock=lambda: now[0])
+    now[0] = 0.0
+    segmenter.add_audio(_tone(1.0), 24000, "之前")
+    now[0] = 600.0
+    segmenter.add_audio(_tone(20.0), 24000, "之后")
+    assert segmenter.get(0) is not None, "Leftover padded and published"
+    assert parse_wav(segmenter.get(0).audio)[0][48000:] == bytes(48000), "Padded with silence"
+    assert segmenter.get(1) is None, "The new item is not ahead of live"
+    now[0] = 602.0
+    assert segmenter.get(1) is not None and segmenter.get(2) is None
+    print("   ✅ Timeline restarts after an idle gap, new segments published as they air")
+
+    assert parse_range("bytes=0-9", 100) == (0, 9)
+    assert parse_range("bytes=90-", 100) == (90, 99)
+    assert parse_range("bytes=-10", 100) == (90, 99)
+    assert parse_range("bytes=50-500", 100) == (50, 99)
+    for bad in ("bytes=100-", "items=0-1", "bytes=5-1", "bytes=0-1,4-5"):
+        try:
+            parse_range(bad, 100)
+            raise AssertionError(f"Accepted {bad}")
+        except ValueError:
+            pass
+    print("   ✅ Byte ranges parsed, bad ones rejected")
+
+
+class CachingProxy:
+    """Stand-in for a CDN edge: caches GET responses for their Cache-Control max-age."""
+
+    def __init__(self, client):
+        self.client = client
+        self.cache = {}
+        self.origin_requests = Counter()
+
+    def get(self, path: str, now: float):
+        cached = self.cache.get(path)
+        if cached is not None and cached[0] > now:
+            return cached[1]
+        response = self.client.get(path)
+        self.origin_requests[path] += 1
+        max_age = re.search(r"max-age=(\d+)", response.headers.get("cache-control", ""))
+        if response.status_code == 200 and max_age:
+            self.cache[path] = (now + int(max_age.group(1)), response)
+        return response
+
+
+def test_http_delivery_through_cache():
+    """Test that a caching proxy lets the origin serve each segment once."""
+    print("\n" + "="*60)
+    print("🧪 Testing HLS Delivery Through a Cache")
+    print("="*60)
+
+    from fastapi.testclient import TestClient
+    import main
+    from config import settings
+
+    original_segmenter, original_enabled = main.hls_segmenter, settings.hls_enabled
+    now = [0.0]
+    main.hls_segmenter = HlsSegmenter(segment_seconds=2.0, playlist_segments=3, clock=lambda: now[0])
+    settings.hls_enabled = True
+    try:
+        with TestClient(main.app) as client:
+            main.hls_segmenter.add_audio(_tone(6.0), 24000, "直播内容")
+            now[0] = 6.0
+            proxy = CachingProxy(client)
+            for viewer in range(500):
+                playlist = proxy.get("/hls/live.m3u8", now=0.0)
+                for name in re.findall(r"segment_\d+\.wav", playlist.text):
+                    assert proxy.get(f"/hls/{name}", now=0.0).status_code == 200
+                    proxy.get(f"/hls/{name[:-4]}.json", now=0.0)
+            assert playlist.headers["content-type"].startswith("application/vnd.apple.mpegurl")
+            assert set(proxy.origin_requests.values()) == {1} and len(proxy.origin_requests) == 7, proxy.origin_requests
+            print(f"   ✅ 500 viewers, origin served {sum(proxy.origin_requests.values())} requests")
+
+            main.hls_segmenter.add_audio(_tone(2.0), 24000, "新内容")
+            now[0] = 8.0
+            assert "segment_3.wav" not in proxy.get("/hls/live.m3u8", now=0.5).text, "Playlist served from cache"
+            assert "segment_3.wav" in proxy.get("/hls/live.m3u8", now=1.5).text, "Playlist refreshed after max-age"
+            print("   ✅ Playlist cached for half a segment, then refreshed")
+
+            segment = main.hls_segmenter.get(1)
+            full = client.get("/hls/segment_1.wav")
+            assert "immutable" in full.headers["cache-control"] and full.content == segment.audio
+            partial = client.get("/hls/segment_1.wav", headers={"Range": "bytes=44-143"})
+            assert partial.status_code == 206 and partial.content == segment.audio[44:144]
+            assert partial.headers["content-range"] == f"bytes 44-143/{len(segment.audio)}"
+            assert client.get("/hls/segment_1.wav", headers={"If-None-Match": full.headers["etag"]}).status_code == 304
+            assert client.get("/hls/segment_1.wav", headers={"Range": "bytes=999999-"}).status_code == 416
+            assert client.get("/hls/segment_99.wav").status_code == 404
+            assert json.loads(client.get("/hls/segment_1.json").content)["subtitles"][0]["text"] == "直播内容"
+            print("   ✅ Byte ranges, ETags and missing segments handled")
+
+            settings.hls_enabled = False
+            assert client.get("/hls/live.m3u8").status_code == 404
+    finally:
+        main.hls_segmenter, settings.hls_enabled = original_segmenter, original_enabled
+
+
+if __name__ == "__main__":
+    try:
+        test_segmenter_cuts_timeline()
+        test_http_delivery_through_cache()
+        print("\n✅ HLS test passed!")
+        sys.exit(0)
+    except Exception as e:
+        print(f"\n❌ HLS test failed: {e}")
+        import traceback
+        traceback.print_exc()
+        sys.exit(1)
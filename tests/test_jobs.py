@@ -0,0 +1,182 @@
+"""Test background generation jobs and their progress events."""
+import os
+import sys
+import json
+import asyncio
+from pathlib import Path
+from types import SimpleNamespace
+
+# Add parent directory to path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from jobs import Job, JobManager, format_sse, JOB_COMPLETED, JOB_FAILED
+
+
+def _parse_sse(text):
+    """Parse a text/event-stream body into (event, data) tuples."""
+    events = []
+    for block in text.strip().split("\n\n"):
+        fields = dict(line.split(": ", 1) for line in block.splitlines() if not line.startswith(":"))
+        if fields:
+            events.append((fields["event"], json.loads(fields["data"])))
+    return events
+
+
+def test_job_lifecycle():
+    """Test that jobs run in the background and record their events."""
+    print("\n" + "="*60)
+    print("🧪 Testing Job Lifecycle")
+    print("="*60)
+
+    async def runner(job):
+        job.emit("step", value=1)
+        await asyncio.sleep(0.01)
+        job.items_enqueued = 1
+
+    async def failing(job):
+        raise RuntimeError("boom")
+
+    async def run():
+        manager = JobManager()
+        job = manager.start("咖啡机", runner)
+        assert manager.get(job.id) is job
+        assert manager.has_active_jobs()
+        await job.task
+        assert not manager.has_active_jobs()
+
+        failed = manager.start("咖啡机", failing)
+        await failed.task
+        return job, failed
+
+    job, failed = asyncio.run(run())
+    assert job.status == JOB_COMPLETED
+    assert [e["event"] for e in job.events] == ["step", JOB_COMPLETED]
+    assert job.events[-1]["data"]["items_enqueued"] == 1
+    assert failed.status == JOB_FAILED and failed.error == "boom"
+    assert failed.to_dict()["status"] == JOB_FAILED
+    print(f"   ✅ Job events: {[e['event'] for e in job.events]}")
+
+
+def test_stream_replays_and_follows():
+    """Test that subscribers get past events, then live ones until the job ends."""
+    print("\n" + "="*60)
+    print("🧪 Testing Event Stream")
+    print("="*60)
+
+    async def run():
+        job = Job("咖啡机")
+        job.emit("first")
+        received = []
+
+        async def subscribe():
+            async for entry in job.stream():
+                received.append(entry["event"])
+
+        task = asyncio.create_task(subscribe())
+        await asyncio.sleep(0)
+        job.emit("second")
+        job.finish(JOB_COMPLETED)
+        await asyncio.wait_for(task, timeout=1)
+
+        resumed = [entry["event"] async for entry in job.stream(last_event_id=1)]
+        return received, resumed
+
+    received, resumed = asyncio.run(run())
+    assert received == ["first", "second", JOB_COMPLETED], received
+    assert resumed == [JOB_COMPLETED], resumed
+    print(f"   ✅ Received: {received}, resumed: {resumed}")
+
+    sse = format_sse({"id": 3, "event": "enqueued", "data": {"index": 0}})
+    assert sse == 'id: 3\nevent: enqueued\ndata: {"index":0}\n\n'
+    assert format_sse(None).startswith(":")
+    print("   ✅ SSE formatting")
+
+
+def test_finished_jobs_are_evicted():
+    """Test that only the most recent finished jobs are kept."""
+    print("\n" + "="*60)
+    print("🧪 Testing Job Eviction")
+    print("="*60)
+
+    async def noop(job):
+        pass
+
+    async def run():
+        manager = JobManager(max_finished_jobs=2)
+        jobs = []
+        for _ in range(4):
+            job = manager.start("topic", noop)
+            await job.task
+            jobs.append(job)
+        manager.start("topic", noop)  # Eviction happens when a job starts
+        return manager, jobs
+
+    manager, jobs = asyncio.run(run())
+    assert manager.get(jobs[0].id) is None and manager.get(jobs[1].id) is None
+    assert manager.get(jobs[3].id) is jobs[3]
+    print(f"   ✅ Kept {len(manager.jobs)} jobs")
+
+
+def test_start_stream_job_api():
+    """Test that start_stream returns a job id and streams per-item progress."""
+    print("\n" + "="*60)
+    print("🧪 Testing start_stream Job API")
+    print("="*60)
+
+    from fastapi.testclient import TestClient
+    import ai_service as ai_service_module
+    from main import app
+    from state import global_state
+
+    llm_response = SimpleNamespace(
+        status_code=200,
+        output=SimpleNamespace(text="这款咖啡机真的很棒\n一键出品超方便\n今天下单立减五十"),
+    )
+    tts_response = SimpleNamespace(status_code=200, get_audio_data=lambda: b"\x00\x01" * 2400)
+    original_llm = ai_service_module.dashscope.Generation.call
+    original_tts = ai_service_module.dashscope.MultiModalConversation.call
+    ai_service_module.dashscope.Generation.call = lambda **kwargs: llm_response
+    ai_service_module.dashscope.MultiModalConversation.call = lambda **kwargs: tts_response
+    try:
+        with TestClient(app) as client:
+            asyncio.run(global_state.clear_playlist())
+            resp = client.post("/api/start_stream", params={"topic": "咖啡机"})
+            assert resp.status_code == 202, f"Expected 202, got {resp.status_code}"
+            data = resp.json()
+            assert data["job_id"], data
+            print(f"   ✅ Job started: {data['job_id']}")
+
+            resp = client.get(data["events_url"])
+            assert resp.headers["content-type"].startswith("text/event-stream")
+            events = _parse_sse(resp.text)
+            names = [name for name, _ in events]
+            assert names[0] == "scripts_generated", names
+            assert names.count("audio_ready") == names.count("enqueued") == 3, names
+            assert names[-1] == JOB_COMPLETED, names
+            print(f"   ✅ Events: {names}")
+
+            status = client.get(data["status_url"]).json()
+            assert status["status"] == JOB_COMPLETED and status["items_enqueued"] == 3, status
+            assert client.get("/api/jobs/missing").status_code == 404
+            assert client.get("/api/status").json()["playlist_size"] == 3
+            print("   ✅ Items enqueued and job status reported")
+    finally:
+        ai_service_module.dashscope.Generation.call = original_llm
+        ai_service_module.dashscope.MultiModalConversation.call = original_tts
+        asyncio.run(global_state.set_streaming(False))
+        asyncio.run(global_state.clear_playlist())
+
+
+if __name__ == "__main__":
+    try:
+        test_job_lifecycle()
+        test_stream_replays_and_follows()
+        test_finished_jobs_are_evicted()
+        test_start_stream_job_api()
+        print("\n✅ Jobs test passed!")
+        sys.exit(0)
+    except Exception as e:
+        print(f"\n❌ Jobs test failed: {e}")
+        import traceback
+        traceback.print_exc()
+        sys.exit(1)
@@ -0,0 +1,119 @@
+"""Test the LLM response cache: TTL, size bound and variant rotation."""
+import sys
+import json
+import asyncio
+from pathlib import Path
+from types import SimpleNamespace
+
+# Add parent directory to path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from llm_cache import ResponseCache, normalize_topic
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_normalize_topic():
+    """Test that equivalent spellings of a topic share a key."""
+    print("\n" + "="*60)
+    print("🧪 Testing Topic Normalization")
+    print("="*60)
+
+    assert normalize_topic("  Coffee   Machine ") == normalize_topic("coffee machine")
+    assert normalize_topic("咖啡机　") == normalize_topic("咖啡机")  # Full-width space
+    assert normalize_topic("ＡＢＣ") == "abc"  # Full-width letters
+    print("   ✅ Whitespace, width and case are normalized")
+
+
+def test_ttl_size_and_rotation():
+    """Test expiry, LRU eviction and round-robin variants."""
+    print("\n" + "="*60)
+    print("🧪 Testing TTL, Size Bound and Rotation")
+    print("="*60)
+
+    clock = FakeClock()
+    cache = ResponseCache(ttl_seconds=10, max_entries=2, variants=3, clock=clock)
+
+    cache.put("a", 1)
+    clock.now = 9.9
+    assert cache.get("a") == 1
+    clock.now = 10.0
+    assert cache.get("a") is None, "Entry should expire after the TTL"
+    print("   ✅ Entries expire after the TTL")
+
+    cache.put("a", 1)
+    cache.put("b", 2)
+    cache.get("a")  # "b" is now least recently used
+    cache.put("c", 3)
+    assert len(cache) == 2 and cache.get("b") is None and cache.get("a") == 1
+    print("   ✅ Least recently used entry evicted beyond max_entries")
+
+    assert [cache.next_variant("topic") for _ in range(7)] == [0, 1, 2, 0, 1, 2, 0]
+    assert cache.next_variant("other") == 0
+    print("   ✅ Variants rotate round-robin per base key")
+
+
+def test_script_batches_are_cached():
+    """Test that repeated topics rotate through cached batches without calling the LLM."""
+    print("\n" + "="*60)
+    print("🧪 Testing Cached Script Batches")
+    print("="*60)
+
+    import ai_service as ai_service_module
+    from ai_service import ai_service, SCRIPT_SEGMENTS, SCRIPT_STYLES
+
+    prompts = []
+
+    def fake_call(**kwargs):
+        prompts.append(kwargs["prompt"])
+        scripts = [{"segment": segment, "text": f"第{len(prompts)}批{segment}"} for segment in SCRIPT_SEGMENTS]
+        return SimpleNamespace(status_code=200, output=SimpleNamespace(text=json.dumps({"scripts": scripts})))
+
+    clock = FakeClock()
+    original_call = ai_service_module.dashscope.Generation.call
+    original_cache = ai_service.script_cache
+    ai_service_module.dashscope.Generation.call = fake_call
+    cache = ai_service.script_cache = ResponseCache(ttl_seconds=60, variants=2, clock=clock)
+    try:
+        batches = [
+            asyncio.run(ai_service.generate_script_batch(topic, 50))
+            for topic in ("咖啡机", " 咖啡机", "咖啡机 ", "咖啡机")
+        ]
+        calls_before_expiry = len(prompts)
+        clock.now = 60.0
+        asyncio.run(ai_service.generate_script_batch("咖啡机", 50))
+    finally:
+        ai_service_module.dashscope.Generation.call = original_call
+        ai_service.script_cache = original_cache
+
+    first_texts = [[s["text"] for s in batch][0] for batch in batches]
+    assert calls_before_expiry == 2, f"Only the two variants should be generated ({calls_before_expiry} calls)"
+    assert first_texts == ["第1批intro", "第2批intro", "第1批intro", "第2批intro"], first_texts
+    assert SCRIPT_STYLES[0] in prompts[0] and SCRIPT_STYLES[1] in prompts[1]
+    assert len(prompts) == 3, "Expired entries go back to the LLM"
+    print(f"   ✅ 4 requests -> {calls_before_expiry} LLM calls, rotating between variants")
+    print("   ✅ Expired variant regenerated")
+
+    batches[0][0]["text"] = "changed"
+    assert all(script["text"] != "changed" for _, value in cache._entries.values() for script in value)
+    print("   ✅ Callers get copies of cached batches")
+
+
+if __name__ == "__main__":
+    try:
+        test_normalize_topic()
+        test_ttl_size_and_rotation()
+        test_script_batches_are_cached()
+        print("\n✅ LLM cache test passed!")
+        sys.exit(0)
+    except Exception as e:
+        print(f"\n❌ LLM cache test failed: {e}")
+        import traceback
+        traceback.print_exc()
+        sys.exit(1)
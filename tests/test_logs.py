@@ -0,0 +1,140 @@
+"""Test the non-blocking log pipeline and hot-path sampling."""
+import io
+import sys
+import json
+import time
+from pathlib import Path
+
+# Add parent directory to path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from loguru import logger
+
+from config import settings
+from logs import LogSampler, configure_logging, item_context, log_sampler
+from state import AudioItem
+
+
+def _restore_logging():
+    configure_logging(settings.log_level, settings.log_format, settings.log_enqueue)
+
+
+def test_sampler_limits_hot_path_messages():
+    """Test that per-kind messages are rate limited and only formatted when emitted."""
+    print("\n" + "="*60)
+    print("🧪 Testing Hot-Path Log Sampling")
+    print("="*60)
+
+    now = [0.0]
+    sampler = LogSampler(per_second=1.0, burst=3, clock=lambda: now[0])
+    sampler.min_level_no = logger.level("INFO").no
+    formatted = []
+
+    def text():
+        formatted.append(1)
+        return "咖啡机"
+
+    lines = []
+    handler_id = logger.add(lines.append, format="{message}|{extra[suppressed]}|{function}", level="DEBUG", filter=lambda r: "sampled" in r["extra"])
+    try:
+        for _ in range(10):
+            sampler.log("air", "INFO", "📤 Sent: {}", text)
+        sampler.log("air", "DEBUG", "🔍 Below the level: {}", text)
+        sampler.log("other", "INFO", "🧩 Other kind")
+        now[0] = 2.0  # Two tokens refilled
+        for _ in range(3):
+            sampler.log("air", "INFO", "📤 Sent: {}", text)
+    finally:
+        logger.remove(handler_id)
+
+    lines = [line.strip() for line in lines]
+    assert lines[:3] == ["📤 Sent: 咖啡机|0|test_sampler_limits_hot_path_messages"] * 3, lines
+    assert lines[3] == "🧩 Other kind|0|test_sampler_limits_hot_path_messages", "Kinds are limited separately"
+    assert lines[4] == "📤 Sent: 咖啡机 (+7 similar suppressed)|7|test_sampler_limits_hot_path_messages", lines[4]
+    assert len(lines) == 6 and sampler.suppressed("air") == 1
+    assert len(formatted) == 5, "Arguments evaluated only for emitted messages"
+    print(f"   ✅ {len(lines)} of 15 messages emitted, {len(formatted)} formatted, suppressed count reported")
+
+
+def test_json_lines_carry_item_ids():
+    """Test structured JSON output with item and trace ids from the item context."""
+    print("\n" + "="*60)
+    print("🧪 Testing JSON Log Lines")
+    print("="*60)
+
+    item = AudioItem(text="文本", audio_data=b"", visemes=[], duration_ms=0, created_at=None, trace_id="ab" * 16, item_id="job1-0")
+    filler = AudioItem(text="垫场", audio_data=b"", visemes=[], duration_ms=0, created_at=None, is_filler=True)
+    output = io.StringIO()
+    try:
+        configure_logging("INFO", "json", enqueue=True, sink=output)
+        with item_context(item):
+            log_sampler.log("test_json", "INFO", "📤 Sent audio chunk: {}...", lambda: item.text)
+            try:
+                raise ValueError("boom")
+            except ValueError:
+                logger.exception("❌ Failed")
+        with item_context(filler):
+            logger.info("🧩 Filler {}", "clip")
+        logger.debug("🔍 Filtered out")
+        logger.complete()
+    finally:
+        _restore_logging()
+
+    records = [json.loads(line) for line in output.getvalue().splitlines()]
+    assert len(records) == 3, records
+    sent, failed, filler_line = records
+    assert sent["message"] == "📤 Sent audio chunk: 文本..." and sent["level"] == "INFO"
+    assert sent["item_id"] == "job1-0" and sent["trace_id"] == "ab" * 16 and sent["sampled"] == "test_json"
+    assert sent["function"] == "test_json_lines_carry_item_ids", "Caller of the sampler, not the sampler"
+    assert "ValueError: boom" in failed["exception"] and failed["item_id"] == "job1-0"
+    assert "item_id" not in filler_line and filler_line["message"] == "🧩 Filler clip"
+    print("   ✅ One JSON object per line with item_id, trace_id and exceptions")
+
+    try:
+        configure_logging("INFO", "xml")
+        raise AssertionError("Unknown format accepted")
+    except ValueError:
+        pass
+    finally:
+        _restore_logging()
+
+
+def test_enqueued_sink_does_not_block():
+    """Test that a slow sink doesn't hold up the code that logs."""
+    print("\n" + "="*60)
+    print("🧪 Testing Enqueued Sink")
+    print("="*60)
+
+    written = []
+
+    def slow_sink(message):
+        time.sleep(0.05)
+        written.append(message)
+
+    try:
+        configure_logging("INFO", "text", enqueue=True, sink=slow_sink)
+        started = time.perf_counter()
+        for i in range(10):
+            logger.info("🔊 Message {}", i)
+        elapsed = time.perf_counter() - started
+        logger.complete()
+    finally:
+        _restore_logging()
+
+    assert elapsed < 0.25, f"Logging blocked for {elapsed:.3f}s"
+    assert len(written) == 10 and "Message 9" in written[-1]
+    print(f"   ✅ 10 messages to a 50ms sink logged in {elapsed * 1000:.1f}ms, all written")
+
+
+if __name__ == "__main__":
+    try:
+        test_sampler_limits_hot_path_messages()
+        test_json_lines_carry_item_ids()
+        test_enqueued_sink_does_not_block()
+        print("\n✅ Logs test passed!")
+        sys.exit(0)
+    except Exception as e:
+        print(f"\n❌ Logs test failed: {e}")
+        import traceback
+        traceback.print_exc()
+        sys.exit(1)
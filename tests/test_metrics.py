@@ -0,0 +1,121 @@
+"""Test pipeline metrics and the /metrics endpoint."""
+import os
+import sys
+import asyncio
+from pathlib import Path
+from datetime import datetime
+
+# Add parent directory to path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from metrics import Counter, Gauge, Histogram, MetricsRegistry, metrics
+from state import GlobalState, AudioItem
+
+
+def test_metric_rendering():
+    """Test counters, gauges and histograms render in Prometheus format."""
+    print("\n" + "="*60)
+    print("🧪 Testing Metric Rendering")
+    print("="*60)
+
+    registry = MetricsRegistry()
+    counter = registry.register(Counter("test_events_total", "Events."))
+    gauge = registry.register(Gauge("test_inflight", "In flight.", labelnames=("upstream",)))
+    histogram = registry.register(Histogram("test_latency_seconds", "Latency.", buckets=(0.1, 1.0)))
+
+    counter.inc()
+    counter.inc(2)
+    with gauge.track_inprogress(upstream="tts"):
+        assert gauge.get(upstream="tts") == 1
+    assert gauge.get(upstream="tts") == 0
+    histogram.observe(0.05)
+    histogram.observe(0.5)
+    histogram.observe(5.0)
+
+    text = registry.render()
+    print(text)
+    assert "# TYPE test_events_total counter" in text
+    assert "test_events_total 3" in text
+    assert 'test_inflight{upstream="tts"} 0' in text
+    assert 'test_latency_seconds_bucket{le="0.1"} 1' in text
+    assert 'test_latency_seconds_bucket{le="1"} 2' in text
+    assert 'test_latency_seconds_bucket{le="+Inf"} 3' in text
+    assert "test_latency_seconds_count 3" in text
+    print("   ✅ Metrics render correctly")
+
+    try:
+        counter.inc(-1)
+        raise AssertionError("Counter accepted a negative increment")
+    except ValueError:
+        print("   ✅ Counters reject negative increments")
+
+
+def test_buffered_seconds_gauge():
+    """Test that GlobalState publishes buffered audio to the gauges."""
+    print("\n" + "="*60)
+    print("🧪 Testing Buffered Seconds Gauge")
+    print("="*60)
+
+    async def run():
+        state = GlobalState()
+        items = [
+            AudioItem(text=f"文本{i}", audio_data=b"data", visemes=[], duration_ms=1500, created_at=datetime.now())
+            for i in range(2)
+        ]
+        await state.add_batch_to_playlist(items)
+        assert await state.get_buffered_seconds() == 3.0
+        assert metrics.buffered_seconds.get() == 3.0
+        assert metrics.playlist_items.get() == 2
+
+        await state.pop_from_playlist()
+        assert metrics.buffered_seconds.get() == 1.5
+
+        await state.clear_playlist()
+        assert metrics.buffered_seconds.get() == 0
+        assert metrics.playlist_items.get() == 0
+
+    asyncio.run(run())
+    print("   ✅ Buffered seconds tracked through add/pop/clear")
+
+
+def test_metrics_endpoint():
+    """Test the /metrics endpoint."""
+    print("\n" + "="*60)
+    print("🧪 Testing /metrics Endpoint")
+    print("="*60)
+
+    from fastapi.testclient import TestClient
+    from main import app
+
+    client = TestClient(app)
+    resp = client.get("/metrics")
+    assert resp.status_code == 200, f"Expected 200, got {resp.status_code}"
+    assert resp.headers["content-type"].startswith("text/plain")
+    for name in (
+        "ai_streamer_llm_latency_seconds",
+        "ai_streamer_tts_latency_seconds",
+        "ai_streamer_item_end_to_end_seconds",
+        "ai_streamer_buffered_seconds",
+        "ai_streamer_connected_clients",
+        "ai_streamer_upstream_inflight",
+        "ai_streamer_underruns_total",
+        "ai_streamer_fallback_scripts_total",
+        "ai_streamer_tts_failures_skipped_total",
+        "ai_streamer_bytes_sent_total",
+    ):
+        assert f"# TYPE {name}" in resp.text, f"Missing metric {name}"
+    print("   ✅ All pipeline metrics exported")
+
+
+if __name__ == "__main__":
+    try:
+        test_metric_rendering()
+        test_buffered_seconds_gauge()
+        test_metrics_endpoint()
+        print("\n✅ Metrics test passed!")
+        sys.exit(0)
+    except Exception as e:
+        print(f"\n❌ Metrics test failed: {e}")
+        import traceback
+        traceback.print_exc()
+        sys.exit(1)
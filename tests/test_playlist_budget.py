@@ -0,0 +1,142 @@
+"""Test compact audio items and the playlist byte/duration budget."""
+import sys
+import asyncio
+import tracemalloc
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+
+# Add parent directory to path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from state import GlobalState, AudioItem
+from visemes import VisemeTrack
+from ai_service import ai_service
+
+
+def _item(text: str, duration_ms: int = 1000, epoch=None) -> AudioItem:
+    return AudioItem(
+        text=text, audio_data=b"\x00\x00" * (24 * duration_ms), visemes=[],
+        duration_ms=duration_ms, created_at=None, epoch=epoch,
+    )
+
+
+def test_compact_items():
+    """Test that visemes are packed losslessly and items carry no per-instance dict."""
+    print("\n" + "="*60)
+    print("🧪 Testing Compact Audio Items")
+    print("="*60)
+
+    visemes = ai_service._generate_visemes_placeholder("这款咖啡机一键萃取，三十秒就能享受香浓意式咖啡", 5000)
+    track = VisemeTrack.from_dicts(visemes)
+    assert track.to_dicts() == visemes, "Packing must not change any value"
+    assert len(track) == len(visemes) and track.frames.shape == (len(visemes), 53)
+
+    sliced = track.sliced(0.75)
+    assert sliced.to_dicts()[0] == {**visemes[1], "offset": 0.0}
+    assert abs(sliced.to_dicts()[1]["offset"] - (visemes[2]["offset"] - 0.75)) < 1e-9
+    assert track.to_dicts() == visemes, "Slicing must not modify the track"
+    print(f"   ✅ {len(track)} frames packed into {track.nbytes} bytes, round trip exact")
+
+    # Ten seconds of 30 fps frames with distinct coefficients, as a real lip-sync track would have
+    rng = np.random.default_rng(0)
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    as_dicts = [{"offset": i / 30, "coefficients": rng.random(52).tolist()} for i in range(300)]
+    dict_bytes = sum(stat.size_diff for stat in tracemalloc.take_snapshot().compare_to(before, "filename"))
+    tracemalloc.stop()
+    packed = VisemeTrack.from_dicts(as_dicts)
+    assert packed.nbytes * 4 < dict_bytes, (packed.nbytes, dict_bytes)
+    print(f"   ✅ {len(packed)} frames: {dict_bytes} bytes as dicts, {packed.nbytes} packed")
+
+    item = AudioItem(text="文本", audio_data=b"\x00" * 480, visemes=visemes, duration_ms=10, created_at=datetime(2024, 1, 1, 12, 0))
+    assert not hasattr(item, "__dict__"), "AudioItem should be slotted"
+    assert isinstance(item.visemes, VisemeTrack) and item.nbytes == 480 + track.nbytes
+    assert item.created_at_iso == "2024-01-01T12:00:00"
+    print("   ✅ Slotted item, visemes packed, timestamp stored as a float")
+
+
+def test_producers_wait_for_budget():
+    """Test that producers wait while the budget is used up and resume as items air."""
+    print("\n" + "="*60)
+    print("🧪 Testing Playlist Budget")
+    print("="*60)
+
+    async def run():
+        state = GlobalState(max_bytes=5 * 48000, max_seconds=3.0)
+        produced = []
+
+        async def producer():
+            for i in range(6):
+                await state.wait_for_room()
+                await state.add_to_playlist(_item(f"item{i}"))
+                produced.append(i)
+
+        task = asyncio.create_task(producer())
+        await asyncio.sleep(0.05)
+        blocked_at = (len(produced), state.buffered_ms, state.buffered_bytes)
+        await state.pop_from_playlist()
+        await asyncio.sleep(0.05)
+        after_pop = len(produced)
+        while not task.done():
+            await state.pop_from_playlist()
+            await asyncio.sleep(0.01)
+        await state.clear_playlist()
+
+        # A waiter for an old topic gives up when the topic changes
+        await state.switch_topic("咖啡机")
+        epoch = state.epoch
+        await state.add_batch_to_playlist([_item("big", 5000, epoch)])
+        waiter = asyncio.create_task(state.wait_for_room(epoch))
+        await asyncio.sleep(0.05)
+        waiting = not waiter.done()
+        await state.switch_topic("扫地机器人")
+        return blocked_at, after_pop, waiting, await waiter, state
+
+    blocked_at, after_pop, waiting, still_current, state = asyncio.run(run())
+    assert blocked_at == (3, 3000, 3 * 48000), "Seconds budget reached after three 1s items"
+    assert after_pop == 4, "One pop makes room for one more item"
+    print(f"   ✅ Producer held at {blocked_at[1]}ms / {blocked_at[2]} bytes, resumed after a pop")
+    assert waiting and still_current is False
+    assert state.buffered_ms == state.buffered_bytes == 0, "Old-topic item dropped and accounted"
+    print("   ✅ Waiting producer released on topic change, budget accounting reset")
+
+    async def empty():
+        return await asyncio.wait_for(GlobalState(max_bytes=1).wait_for_room(), timeout=1)
+
+    assert asyncio.run(empty()), "An empty playlist always has room"
+
+
+    async def streamed():
+        state = GlobalState(max_bytes=5 * 48000)
+        queued = _item("queued")
+        queued.audio_data, queued.duration_ms = b"", 0  # Enqueued while downloading
+        aired = _item("aired")
+        aired.audio_data, aired.duration_ms = b"", 0
+        await state.add_batch_to_playlist([aired, queued])
+        await state.pop_from_playlist()  # Airs before its download completes
+        await state.complete_item(aired, b"\x00" * 48000, VisemeTrack.from_dicts([]), 1000)
+        after_aired = state.buffered_bytes
+        await state.complete_item(queued, b"\x00" * 48000, VisemeTrack.from_dicts([]), 1000)
+        counted = (state.buffered_ms, state.buffered_bytes)
+        await state.pop_from_playlist()
+        return after_aired, counted, state.buffered_bytes
+
+    after_aired, counted, drained = asyncio.run(streamed())
+    assert after_aired == 0, "Completing an aired item leaves the totals alone"
+    assert counted == (1000, 48000) and drained == 0, "Completed while queued: counted in, then out exactly"
+    print("   ✅ Streamed items counted by the bytes they were enqueued with")
+
+
+if __name__ == "__main__":
+    try:
+        test_compact_items()
+        test_producers_wait_for_budget()
+        print("\n✅ Playlist budget test passed!")
+        sys.exit(0)
+    except Exception as e:
+        print(f"\n❌ Playlist budget test failed: {e}")
+        import traceback
+        traceback.print_exc()
+        sys.exit(1)
@@ -0,0 +1,180 @@
+"""Test the on-demand sampling profiler."""
+import os
+import sys
+import time
+import asyncio
+import threading
+from pathlib import Path
+
+# Add parent directory to path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from profiler import SamplingProfiler
+
+
+def _spin(seconds):
+    """Burn CPU so the sampler has something to see."""
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        sum(range(100))
+
+
+def test_thread_attribution():
+    """Test that executor-style threads are attributed by thread name."""
+    print("\n" + "="*60)
+    print("🧪 Testing Thread Attribution")
+    print("="*60)
+
+    worker = threading.Thread(target=_spin, args=(0.5,), name="ai_service_0")
+    worker.start()
+    result = SamplingProfiler().profile(0.3, interval=0.005)
+    worker.join()
+
+    collapsed = result.to_collapsed()
+    worker_lines = [line for line in collapsed.splitlines() if line.startswith("thread:ai_service_0;")]
+    assert worker_lines, collapsed
+    assert any("_spin (test_profiler.py" in line for line in worker_lines), worker_lines
+    print(f"   ✅ {result.sample_count} samples, worker thread attributed")
+
+
+def test_task_attribution():
+    """Test that event loop samples are attributed to the running task."""
+    print("\n" + "="*60)
+    print("🧪 Testing Task Attribution")
+    print("="*60)
+
+    profiler = SamplingProfiler()
+
+    async def busy():
+        for _ in range(40):
+            _spin(0.01)
+            await asyncio.sleep(0)
+
+    async def run():
+        loop = asyncio.get_running_loop()
+        profile = loop.run_in_executor(None, profiler.profile, 0.3, 0.005, loop, threading.get_ident())
+        await asyncio.create_task(busy(), name="auto_refill_playlist")
+        return await profile
+
+    result = asyncio.run(run())
+    groups = {stack[0] for stack in result.samples}
+    assert "task:auto_refill_playlist" in groups, groups
+    print(f"   ✅ Groups: {sorted(groups)}")
+
+    speedscope = result.to_speedscope()
+    names = [profile["name"] for profile in speedscope["profiles"]]
+    assert "task:auto_refill_playlist" in names
+    for profile in speedscope["profiles"]:
+        assert len(profile["samples"]) == len(profile["weights"])
+        assert all(i < len(speedscope["shared"]["frames"]) for stack in profile["samples"] for i in stack)
+    print("   ✅ Speedscope document is consistent")
+
+
+def test_tasks_named_by_route():
+    """Test that request tasks are named by route template, so one route is one profile group."""
+    print("\n" + "="*60)
+    print("🧪 Testing Route Task Names")
+    print("="*60)
+
+    from fastapi import FastAPI
+    from fastapi.testclient import TestClient
+    import main
+    from profiler import TaskNamingMiddleware, UNMATCHED_ROUTE, route_template
+
+    app = FastAPI()
+    app.add_middleware(TaskNamingMiddleware)
+    names = []
+
+    @app.get("/hls/segment_{sequence}.{ext}")
+    async def segment(sequence: int, ext: str):
+        names.append(asyncio.current_task().get_name())
+        return {}
+
+    with TestClient(app) as client:
+        client.get("/hls/segment_3.wav")
+        client.get("/hls/segment_4.wav")
+
+    assert names == ["GET /hls/segment_{sequence}.{ext}"] * 2, names
+    print(f"   ✅ Both segment requests named {names[0]!r}")
+
+    def template(method, path):
+        return route_template({"type": "http", "method": method, "path": path, "app": main.app, "root_path": ""})
+
+    assert template("GET", "/api/jobs/abc") == template("GET", "/api/jobs/def") == "/api/jobs/{job_id}"
+    assert template("DELETE", "/api/jobs/abc") == "/api/jobs/{job_id}", "Wrong method: still the route's group"
+    assert template("GET", "/wp-login.php") == UNMATCHED_ROUTE
+    print("   ✅ Job ids share one group, unknown paths share another")
+
+
+def test_single_run():
+    """Test that only one profiling run can be active at a time."""
+    print("\n" + "="*60)
+    print("🧪 Testing Single Profiling Run")
+    print("="*60)
+
+    profiler = SamplingProfiler()
+    background = threading.Thread(target=profiler.profile, args=(0.3, 0.01))
+    background.start()
+    time.sleep(0.05)
+    assert profiler.is_running
+    try:
+        profiler.profile(0.1)
+        raise AssertionError("Concurrent profiling run was allowed")
+    except RuntimeError:
+        print("   ✅ Concurrent run rejected")
+    background.join()
+    assert not profiler.is_running
+
+
+def test_profile_endpoint():
+    """Test the /admin/profile endpoint and its token check."""
+    print("\n" + "="*60)
+    print("🧪 Testing /admin/profile Endpoint")
+    print("="*60)
+
+    from fastapi.testclient import TestClient
+    from config import settings
+    from main import app
+
+    client = TestClient(app)
+    original_token = settings.admin_token
+    settings.admin_token = "secret"
+    try:
+        resp = client.get("/admin/profile", params={"seconds": 0.1})
+        assert resp.status_code == 403, f"Expected 403, got {resp.status_code}"
+        print("   ✅ Rejected without token")
+
+        headers = {"X-Admin-Token": "secret"}
+        resp = client.get("/admin/profile", params={"seconds": 0.1, "interval_ms": 5}, headers=headers)
+        assert resp.status_code == 200, f"Expected 200, got {resp.status_code}"
+        assert resp.text.strip(), "Empty collapsed profile"
+        print(f"   ✅ Collapsed profile: {len(resp.text.splitlines())} stacks")
+
+        resp = client.get("/admin/profile", params={"seconds": 0.1, "format": "speedscope"}, headers=headers)
+        assert resp.status_code == 200
+        assert resp.json()["$schema"].startswith("https://www.speedscope.app/")
+        print("   ✅ Speedscope profile returned")
+
+        started = time.perf_counter()
+        resp = client.get("/admin/profile", params={"seconds": 1e9}, headers=headers)
+        assert resp.status_code == 400 and time.perf_counter() - started < 1, resp.status_code
+        assert client.get("/admin/profile", params={"seconds": 0.05}, headers=headers).status_code == 200, "Profiler left free"
+        print(f"   ✅ Runs longer than {settings.profile_max_seconds:g}s rejected")
+    finally:
+        settings.admin_token = original_token
+
+
+if __name__ == "__main__":
+    try:
+        test_thread_attribution()
+        test_task_attribution()
+        test_tasks_named_by_route()
+        test_single_run()
+        test_profile_endpoint()
+        print("\n✅ Profiler test passed!")
+        sys.exit(0)
+    except Exception as e:
+        print(f"\n❌ Profiler test failed: {e}")
+        import traceback
+        traceback.print_exc()
+        sys.exit(1)
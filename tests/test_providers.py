@@ -0,0 +1,156 @@
+"""Test LLM/TTS providers and latency-aware routing."""
+import sys
+import asyncio
+from pathlib import Path
+
+# Add parent directory to path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from providers import (
+    Provider, ProviderRouter, SCRIPT_PROVIDERS, SPEECH_PROVIDERS,
+    LocalScriptProvider, build_providers, parse_provider_specs,
+)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class FakeProvider(Provider):
+    kind = "fake"
+
+    def __init__(self, model, clock, delay, cost=0.0):
+        super().__init__(model, cost)
+        self.clock = clock
+        self.delay = delay
+        self.failing = False
+        self.calls = 0
+
+    async def complete(self, prompt, max_tokens, temperature):
+        self.calls += 1
+        self.clock.now += self.delay
+        if self.failing:
+            raise ConnectionError(f"{self.model} down")
+        return self.model
+
+
+def test_provider_specs():
+    """Test parsing and building provider lists."""
+    print("\n" + "="*60)
+    print("🧪 Testing Provider Specs")
+    print("="*60)
+
+    assert parse_provider_specs(" dashscope:qwen-turbo, dashscope:qwen-plus=4 ,local=0,") == [
+        ("dashscope", "qwen-turbo", None), ("dashscope", "qwen-plus", 4.0), ("local", None, 0.0),
+    ]
+    providers = build_providers("dashscope:qwen-plus=4,local", SCRIPT_PROVIDERS)
+    assert [(p.name, p.cost) for p in providers] == [("dashscope:qwen-plus", 4.0), ("local:templates", 0.0)]
+    assert [p.name for p in build_providers("dashscope", SPEECH_PROVIDERS)] == ["dashscope:qwen3-tts-flash"]
+    for spec in ("openai", " , "):
+        try:
+            build_providers(spec, SCRIPT_PROVIDERS)
+        except ValueError:
+            continue
+        raise AssertionError(f"{spec!r} should be rejected")
+    print("   ✅ name[:model][=cost] lists parsed, unknown and empty lists rejected")
+
+
+def test_router_ranking_and_failover():
+    """Test routing by latency, error rate and cost, with instant fail-over and ejection."""
+    print("\n" + "="*60)
+    print("🧪 Testing Provider Routing")
+    print("="*60)
+
+    clock = FakeClock()
+    slow = FakeProvider("slow", clock, delay=2.0)
+    fast = FakeProvider("fast", clock, delay=0.2)
+    router = ProviderRouter(
+        "llm", [slow, fast], error_penalty_seconds=10.0, cost_weight_seconds=1.0,
+        eject_failures=3, eject_seconds=30.0, clock=clock,
+    )
+    request = lambda provider: provider.complete("prompt", 10, 0.8)
+
+    async def run(n):
+        return [await router.call(request) for _ in range(n)]
+
+    assert asyncio.run(run(1)) == ["slow"], "Unmeasured providers keep the configured order"
+    assert asyncio.run(run(5)) == ["fast"] * 5, "The faster provider takes over once measured"
+    print(f"   ✅ Routed by latency: {router.status()[0]['provider']} first ({router.status()[0]['latency_seconds']}s)")
+
+    fast.cost = 5.0
+    assert asyncio.run(run(1)) == ["slow"], "Cost outweighs the latency gap"
+    fast.cost = 0.0
+
+    fast.failing = True
+    router.error_penalty_seconds = 0.0  # Keep the failing provider first until it is ejected
+    slow_calls = slow.calls
+    assert asyncio.run(run(3)) == ["slow"] * 3, "A failing call falls over within the same request"
+    assert router.status()[-1]["provider"] == "fake:fast" and router.status()[-1]["ejected"]
+    fast_calls = fast.calls
+    assert asyncio.run(run(2)) == ["slow"] * 2 and fast.calls == fast_calls, "Ejected provider isn't tried first"
+    assert slow.calls == slow_calls + 5
+    print("   ✅ Failures fell over instantly; provider ejected after 3 in a row")
+
+    router.error_penalty_seconds = 10.0
+    fast.failing = False
+    clock.now += 31.0
+    assert asyncio.run(run(1)) == ["slow"], "Recent errors still count against it"
+    clock.now += 120.0
+    assert asyncio.run(run(1)) == ["fast"], "The error rate decays while unused"
+    print(f"   ✅ Recovered provider back in rotation (error rate {router.status()[0]['error_rate']})")
+
+    slow.failing = fast.failing = True
+    try:
+        asyncio.run(run(1))
+    except ConnectionError as e:
+        assert "down" in str(e)
+    else:
+        raise AssertionError("All providers failing must raise")
+
+
+def test_local_providers_offline():
+    """Test that the local providers run the whole pipeline deterministically without network."""
+    print("\n" + "="*60)
+    print("🧪 Testing Local Providers")
+    print("="*60)
+
+    from ai_service import ai_service, SCRIPT_SEGMENTS
+    from providers import build_router
+
+    original = ai_service.llm, ai_service.tts
+    ai_service.llm = build_router("llm", "local", SCRIPT_PROVIDERS)
+    ai_service.tts = build_router("tts", "local", SPEECH_PROVIDERS)
+    try:
+        batch = asyncio.run(ai_service.generate_script_batch("本地测试咖啡机", 10))
+        lines = asyncio.run(ai_service.generate_scripts("本地测试咖啡机", 3))
+        first = asyncio.run(ai_service.text_to_speech(batch[0]["text"]))
+        again = asyncio.run(ai_service.text_to_speech(batch[0]["text"]))
+    finally:
+        ai_service.llm, ai_service.tts = original
+
+    assert [script["segment"] for script in batch] == list(SCRIPT_SEGMENTS) * 2, batch
+    assert all("本地测试咖啡机" in script["text"] for script in batch) and len({s["text"] for s in batch}) == 10
+    assert len(lines) == 3 and lines[0] == batch[0]["text"]
+    print(f"   ✅ {len(batch)} segment-tagged scripts, e.g. {batch[0]['text']}")
+    assert first["audio_data"] == again["audio_data"] and first["duration_ms"] > 1000
+    print(f"   ✅ Deterministic speech: {first['duration_ms']}ms, {len(first['visemes'])} visemes")
+
+    assert asyncio.run(LocalScriptProvider().complete('为"扫地机器人"生成 2 条', 100, 0.8)).count("\n") == 1
+
+
+if __name__ == "__main__":
+    try:
+        test_provider_specs()
+        test_router_ranking_and_failover()
+        test_local_providers_offline()
+        print("\n✅ Providers test passed!")
+        sys.exit(0)
+    except Exception as e:
+        print(f"\n❌ Providers test failed: {e}")
+        import traceback
+        traceback.print_exc()
+        sys.exit(1)
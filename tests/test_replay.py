@@ -0,0 +1,165 @@
+"""Test upstream health tracking and the degraded-mode replay loop."""
+import sys
+import time
+import random
+import asyncio
+from pathlib import Path
+
+# Add parent directory to path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from replay import ReplayHistory
+from health import UpstreamHealth
+from state import AudioItem
+
+
+def _item(text: str, duration_ms: int = 100, is_filler: bool = False) -> AudioItem:
+    return AudioItem(
+        text=text, audio_data=b"\x00\x00" * (24 * duration_ms), visemes=[],
+        duration_ms=duration_ms, created_at=None, is_filler=is_filler,
+    )
+
+
+def test_history_bounds_and_shuffle():
+    """Test that the history is bounded and replays shuffle without close repeats."""
+    print("\n" + "="*60)
+    print("🧪 Testing Replay History")
+    print("="*60)
+
+    history = ReplayHistory(max_items=5, max_bytes=8 * 4800, no_repeat=3, rng=random.Random(0))
+    for i in range(7):
+        history.record("咖啡机", _item(f"咖啡{i}"))
+    history.record("咖啡机", _item("垫场", is_filler=True))
+    history.record("咖啡机", _item("咖啡6"))  # Aired again: kept once
+    assert history.size("咖啡机") == 5 and history.size(" 咖啡机 ") == 5
+    assert history.nbytes == 5 * 4800
+    print(f"   ✅ {history.size('咖啡机')} items kept per topic, fillers and repeats not duplicated")
+
+    aired = [history.next_item("咖啡机") for _ in range(60)]
+    texts = [item.text for item in aired]
+    assert set(texts) == {f"咖啡{i}" for i in range(2, 7)}, "Only the newest items are kept"
+    assert all(len(set(texts[i:i + 4])) == 4 for i in range(len(texts) - 3)), "No repeat within 3 replays"
+    assert texts[:5] != sorted(texts[:5]), "Replays are shuffled"
+    replay = aired[0]
+    assert replay.is_filler and not replay.frames and not replay.variants
+    assert any(replay.audio_data is entry.audio_data for entry in history._topics["咖啡机"].values()), "PCM is shared"
+    print(f"   ✅ Shuffled replays: {' '.join(texts[:8])} ...")
+
+    for i in range(6):
+        history.record("扫地机器人", _item(f"扫地{i}"))
+    assert history.nbytes == 8 * 4800
+    assert history.size("扫地机器人") == 5 and history.size("咖啡机") == 3, "Least recently aired topic gives way"
+    print(f"   ✅ Byte budget held at {history.nbytes} bytes across topics")
+
+    single = ReplayHistory(no_repeat=3)
+    single.record("话题", _item("唯一"))
+    assert [single.next_item("话题").text for _ in range(3)] == ["唯一"] * 3, "A single item loops"
+    assert single.next_item("别的话题") is None
+
+
+def test_upstream_health():
+    """Test degraded mode entry, rate-limited probes, recovery and no fallback scripts."""
+    print("\n" + "="*60)
+    print("🧪 Testing Upstream Health")
+    print("="*60)
+
+    health = UpstreamHealth(failure_threshold=3, probe_seconds=0.2)
+    for _ in range(2):
+        health.record("tts", False)
+    health.record("llm", False)
+    assert not health.degraded and health.probe_due()
+    health.record("tts", False)
+    assert health.degraded and health.status()["consecutive_failures"] == {"llm": 1, "tts": 3}
+    assert not health.probe_due(), "No upstream calls right after degrading"
+    time.sleep(0.25)
+    assert health.probe_due() and not health.probe_due(), "One probe per interval"
+    health.record("llm", True)
+    assert health.degraded, "The failing service must recover"
+    health.record("tts", True)
+    assert not health.degraded and health.probe_due()
+    print("   ✅ Degraded after 3 TTS failures, probed once per interval, recovered on success")
+
+    from reservoir import ScriptReservoir
+    import reservoir
+
+    async def failing_batch(topic, count):
+        raise Exception("upstream down")
+
+    degraded = UpstreamHealth(failure_threshold=1)
+    degraded.record("llm", False)
+    original = reservoir.upstream_health
+    reservoir.upstream_health = degraded
+    try:
+        scripts = asyncio.run(ScriptReservoir(failing_batch).take("咖啡机", 5))
+    finally:
+        reservoir.upstream_health = original
+    assert scripts == [], "No fallback line while degraded"
+    print("   ✅ Reservoir returns nothing instead of the fallback line while degraded")
+
+
+def test_degraded_playout_replays():
+    """Test that the playout loops aired items without calling upstream while degraded."""
+    print("\n" + "="*60)
+    print("🧪 Testing Degraded Playout")
+    print("="*60)
+
+    from fastapi.testclient import TestClient
+    import main
+    from health import upstream_health
+    from replay import replay_history
+    from state import global_state
+
+    calls = []
+    original_tts = main.ai_service.text_to_speech
+
+    async def count_tts(*args, **kwargs):
+        calls.append(args)
+        raise Exception("upstream down")
+
+    async def setup():
+        await global_state.clear_playlist()
+        await global_state.switch_topic("咖啡机")
+        await global_state.set_streaming(True)
+
+    main.ai_service.text_to_speech = count_tts
+    try:
+        asyncio.run(setup())
+        for i in range(4):
+            replay_history.record("咖啡机", _item(f"咖啡{i}"))
+        for _ in range(upstream_health.failure_threshold):
+            upstream_health.record("tts", False)
+        assert not main.trigger_refill(), "No refill until the next probe"
+
+        with TestClient(main.app) as client:
+            with client.websocket_connect("/ws/stream") as ws:
+                status = ws.receive_json()
+                chunks = [ws.receive_json() for _ in range(6)]
+            api_status = client.get("/api/status").json()
+    finally:
+        main.ai_service.text_to_speech = original_tts
+        upstream_health.record("tts", True)
+        replay_history.clear()
+        asyncio.run(global_state.set_streaming(False))
+
+    assert status["status"] == "degraded", status
+    texts = [chunk["text"] for chunk in chunks]
+    assert all(chunk["type"] == "audio_chunk" and chunk["is_filler"] for chunk in chunks)
+    assert set(texts) <= {f"咖啡{i}" for i in range(4)} and all(a != b for a, b in zip(texts, texts[1:]))
+    assert not calls, "No TTS calls while degraded"
+    assert api_status["upstream"]["degraded"] and api_status["replay_items"] == 4
+    print(f"   ✅ Replayed {' '.join(texts)} with no upstream calls")
+    assert not upstream_health.degraded
+
+
+if __name__ == "__main__":
+    try:
+        test_history_bounds_and_shuffle()
+        test_upstream_health()
+        test_degraded_playout_replays()
+        print("\n✅ Replay test passed!")
+        sys.exit(0)
+    except Exception as e:
+        print(f"\n❌ Replay test failed: {e}")
+        import traceback
+        traceback.print_exc()
+        sys.exit(1)
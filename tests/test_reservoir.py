@@ -0,0 +1,177 @@
+"""Test the batched script reservoir and structured script parsing."""
+import sys
+import json
+import asyncio
+from pathlib import Path
+from types import SimpleNamespace
+
+# Add parent directory to path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from ai_service import parse_script_batch, SCRIPT_SEGMENTS
+from reservoir import ScriptReservoir
+
+
+def _batch(per_segment: int, prefix: str = ""):
+    """Tagged scripts, grouped by segment like the model returns them."""
+    return [
+        {"segment": segment, "text": f"{prefix}{segment}-{i}"}
+        for segment in SCRIPT_SEGMENTS
+        for i in range(per_segment)
+    ]
+
+
+def test_parse_script_batch():
+    """Test that batches are validated once when parsed."""
+    print("\n" + "="*60)
+    print("🧪 Testing Script Batch Parsing")
+    print("="*60)
+
+    text = "```json\n" + json.dumps({"scripts": [
+        {"segment": "intro", "text": "大家好，欢迎来到直播间"},
+        {"segment": "Pain Point", "text": "早上没时间做咖啡？"},
+        {"segment": "cta", "text": "大家好，欢迎来到直播间"},  # Duplicate
+        {"segment": "weather", "text": "今天天气不错"},  # Unknown segment
+        {"segment": "price", "text": "超" * 100},  # Too long
+        {"segment": "price", "text": ""},
+        "not an object",
+    ]}, ensure_ascii=False) + "\n```"
+    scripts = parse_script_batch(text)
+    assert scripts == [
+        {"segment": "intro", "text": "大家好，欢迎来到直播间"},
+        {"segment": "pain_point", "text": "早上没时间做咖啡？"},
+    ], scripts
+    print(f"   ✅ Kept {len(scripts)} valid scripts out of 7 entries")
+
+    assert parse_script_batch('[{"segment": "cta", "text": "快下单"}]') == [{"segment": "cta", "text": "快下单"}]
+    for bad in ("1. 这不是 JSON", '{"lines": []}'):
+        try:
+            parse_script_batch(bad)
+            raise AssertionError(f"Accepted {bad!r}")
+        except ValueError:
+            pass
+    print("   ✅ Bare lists accepted, non-JSON rejected")
+
+
+def test_reservoir_draws_in_spec_order():
+    """Test that draws cycle through the segments and only the first waits for the LLM."""
+    print("\n" + "="*60)
+    print("🧪 Testing Spec Order and Background Top-Up")
+    print("="*60)
+
+    calls = []
+
+    async def generate(topic, count):
+        calls.append((topic, count))
+        await asyncio.sleep(0.05)
+        return _batch(2, prefix=f"{len(calls)}:")
+
+    async def run():
+        reservoir = ScriptReservoir(generate, batch_size=10, low_watermark=4)
+        first = await reservoir.take("咖啡机", 5)
+        second = await reservoir.take("咖啡机", 3)
+        assert reservoir.is_filling("咖啡机"), "Low stock should start the next batch"
+        started = asyncio.get_running_loop().time()
+        third = await reservoir.take("咖啡机", 2)
+        waited = asyncio.get_running_loop().time() - started
+        await asyncio.sleep(0.1)
+        return first, second, third, waited, reservoir.size("咖啡机")
+
+    first, second, third, waited, left = asyncio.run(run())
+    assert [s["segment"] for s in first] == list(SCRIPT_SEGMENTS), first
+    assert [s["segment"] for s in second] == ["intro", "pain_point", "solution"], second
+    assert [s["segment"] for s in third] == ["price", "cta"], third
+    assert [s["text"] for s in first + second + third] == [
+        f"1:{segment}-{i}" for i in range(2) for segment in SCRIPT_SEGMENTS
+    ]
+    assert waited < 0.01, f"Draws with stock left shouldn't wait for the LLM ({waited:.3f}s)"
+    assert len(calls) == 2 and left == 10, (calls, left)
+    print(f"   ✅ Order: {[s['segment'] for s in first]}, continued across draws")
+    print(f"   ✅ {len(calls)} LLM calls for 10 scripts drawn; next batch fetched in the background")
+
+
+def test_reservoir_skips_empty_segments_and_falls_back():
+    """Test uneven batches, untagged lines, failures and topic eviction."""
+    print("\n" + "="*60)
+    print("🧪 Testing Uneven Batches and Fallback")
+    print("="*60)
+
+    async def uneven(topic, count):
+        return [
+            {"segment": "price", "text": "限时五折"},
+            {"segment": "intro", "text": "欢迎"},
+            {"segment": None, "text": "纯文本一行"},
+        ]
+
+    async def failing(topic, count):
+        raise RuntimeError("LLM down")
+
+    async def run():
+        reservoir = ScriptReservoir(uneven, low_watermark=0, max_topics=1)
+        drawn = await reservoir.take("a", 5)
+        await reservoir.take("b", 1)
+        evicted = reservoir.size("a") == 0 and "a" not in reservoir._stock
+        fallback = await ScriptReservoir(failing).take("咖啡机", 2)
+        return drawn, evicted, fallback
+
+    drawn, evicted, fallback = asyncio.run(run())
+    assert [s["text"] for s in drawn] == ["欢迎", "限时五折", "纯文本一行"], drawn
+    assert evicted, "Least recently used topic should be dropped"
+    assert len(fallback) == 2 and "咖啡机" in fallback[0]["text"]
+    print("   ✅ Empty segments skipped, untagged lines served last")
+    print("   ✅ Old topics evicted, fallback scripts when the LLM fails")
+
+
+def test_generate_script_batch():
+    """Test the batched LLM call with JSON and plain-text replies."""
+    print("\n" + "="*60)
+    print("🧪 Testing generate_script_batch")
+    print("="*60)
+
+    import ai_service as ai_service_module
+    from ai_service import ai_service
+    from llm_cache import ResponseCache
+
+    replies = [
+        json.dumps({"scripts": _batch(1)}),
+        "这款咖啡机真的很棒\n一键出品超方便",
+    ]
+    prompts = []
+
+    def fake_call(**kwargs):
+        prompts.append(kwargs["prompt"])
+        return SimpleNamespace(status_code=200, output=SimpleNamespace(text=replies[len(prompts) - 1]))
+
+    original_call = ai_service_module.dashscope.Generation.call
+    original_cache = ai_service.script_cache
+    ai_service_module.dashscope.Generation.call = fake_call
+    ai_service.script_cache = ResponseCache(variants=2)
+    try:
+        tagged = asyncio.run(ai_service.generate_script_batch("咖啡机", 50))
+        untagged = asyncio.run(ai_service.generate_script_batch("咖啡机", 50))
+    finally:
+        ai_service_module.dashscope.Generation.call = original_call
+        ai_service.script_cache = original_cache
+
+    assert "各 10 条" in prompts[0] and "JSON" in prompts[0]
+    assert [s["segment"] for s in tagged] == list(SCRIPT_SEGMENTS)
+    assert untagged == [
+        {"segment": None, "text": "这款咖啡机真的很棒"},
+        {"segment": None, "text": "一键出品超方便"},
+    ]
+    print(f"   ✅ JSON reply -> {len(tagged)} tagged scripts, plain reply -> {len(untagged)} untagged")
+
+
+if __name__ == "__main__":
+    try:
+        test_parse_script_batch()
+        test_reservoir_draws_in_spec_order()
+        test_reservoir_skips_empty_segments_and_falls_back()
+        test_generate_script_batch()
+        print("\n✅ Reservoir test passed!")
+        sys.exit(0)
+    except Exception as e:
+        print(f"\n❌ Reservoir test failed: {e}")
+        import traceback
+        traceback.print_exc()
+        sys.exit(1)
@@ -0,0 +1,221 @@
+"""Test the topic calendar and lookahead pre-rendering."""
+import sys
+import time
+import asyncio
+from pathlib import Path
+
+# Add parent directory to path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from schedule import ShowScheduler, Slot
+from reservoir import ScriptReservoir
+from health import UpstreamHealth
+
+
+def _fake_tts(delay: float, calls: list):
+    async def synthesize(text):
+        await asyncio.sleep(delay)
+        calls.append((text, time.time()))
+        return {"audio_data": b"\x00\x00" * 2400, "visemes": [], "duration_ms": 100, "sample_rate": 24000}
+    return synthesize
+
+
+async def _generate_batch(topic, count):
+    await asyncio.sleep(0.05)
+    return [{"segment": None, "text": f"{topic}-{i}"} for i in range(count)]
+
+
+def test_lead_time_tracks_throughput():
+    """Test that the lead time follows measured render times and script availability."""
+    print("\n" + "="*60)
+    print("🧪 Testing Pre-render Lead Time")
+    print("="*60)
+
+    reservoir = ScriptReservoir(_generate_batch, batch_size=10)
+    scheduler = ShowScheduler(
+        _fake_tts(0, []), reservoir, preroll_items=3, lead_safety=2.0,
+        min_lead_seconds=1.0, item_seconds=2.0, script_seconds=4.0,
+    )
+    cold = Slot(time.time() + 60, "咖啡机")
+    packed = Slot(time.time() + 60, "咖啡机", scripts=["一", "二", "三"])
+    assert scheduler.lead_seconds(cold) == (3 * 2.0 + 4.0) * 2.0
+    assert scheduler.lead_seconds(packed) == 3 * 2.0 * 2.0, "A script pack skips the LLM wait"
+    for _ in range(20):
+        scheduler.observe_render(0.1)
+    assert abs(scheduler.lead_seconds(packed) - 1.0) < 0.05, "Fast renders shrink the lead to the minimum"
+    print(f"   ✅ Lead {scheduler.lead_seconds(cold):.1f}s cold, {scheduler.lead_seconds(packed):.1f}s with a script pack")
+
+    async def draw():
+        reservoir.add("咖啡机", ["备好的一句", "备好的二句"])
+        first = await reservoir.take("咖啡机", 1)
+        await asyncio.sleep(0.1)  # Low stock started a batch in the background
+        return first + await reservoir.take("咖啡机", 2)
+
+    drawn = [script["text"] for script in asyncio.run(draw())]
+    assert drawn == ["备好的一句", "备好的二句", "咖啡机-0"], drawn
+    print("   ✅ Script pack drawn before generated scripts")
+
+
+def test_switch_at_slot_start_with_items_ready():
+    """Test that a slot's items are rendered ahead and handed over at its start."""
+    print("\n" + "="*60)
+    print("🧪 Testing Scheduled Switch")
+    print("="*60)
+
+    calls = []
+    switches = []
+
+    async def switch(slot, items):
+        switches.append((slot.topic, [item.text for item in items], time.time()))
+
+    async def run():
+        reservoir = ScriptReservoir(_generate_batch, batch_size=10)
+        scheduler = ShowScheduler(
+            _fake_tts(0.05, calls), reservoir, preroll_items=2,
+            lead_safety=1.5, min_lead_seconds=0.4, item_seconds=0.05, script_seconds=0.05,
+        )
+        scheduler.start(switch)
+        start = time.time() + 0.8
+        scheduler.set_slots([
+            Slot(start + 0.5, "扫地机器人", scripts=["扫地一", "扫地二"]),
+            Slot(start, "咖啡机"),
+            Slot(time.time() - 100, "过期话题"),
+            Slot(time.time() - 10, "正在进行"),
+        ])
+        assert [slot.topic for slot in scheduler.slots] == ["正在进行", "咖啡机", "扫地机器人"]
+        await asyncio.sleep(0.7)  # The coffee slot renders from 0.4s on
+        midway = scheduler.status()
+        await asyncio.sleep(0.9)
+        scheduler.stop()
+        return start, midway
+
+    start, midway = asyncio.run(run())
+    topics = [topic for topic, _, _ in switches]
+    assert topics == ["正在进行", "咖啡机", "扫地机器人"], topics
+    assert midway["prerendered_items"] == 2 and midway["slots"][0]["topic"] == "咖啡机", midway
+    print(f"   ✅ Already-started slot switched at once, next slot pre-rendered {midway['prerendered_items']} items early")
+
+    _, coffee_items, coffee_at = switches[1]
+    coffee_rendered = [at for text, at in calls if text.startswith("咖啡机")]
+    assert coffee_items == ["咖啡机-0", "咖啡机-1"] and max(coffee_rendered) < start <= coffee_at < start + 0.1
+    assert switches[2][1] == ["扫地一", "扫地二"], "Script pack used for the opening items"
+    print(f"   ✅ Switched {(coffee_at - start) * 1000:.0f}ms after slot start with items rendered beforehand")
+
+
+def test_prerender_waits_out_degraded_upstream():
+    """Test that pre-rendering spends no upstream calls while upstream is degraded."""
+    print("\n" + "="*60)
+    print("🧪 Testing Pre-render During an Outage")
+    print("="*60)
+
+    calls = []
+    switches = []
+    health = UpstreamHealth(failure_threshold=1)
+    health.record("tts", ok=False)
+
+    async def switch(slot, items):
+        switches.append((slot.topic, [item.text for item in items]))
+
+    async def run():
+        reservoir = ScriptReservoir(_generate_batch, batch_size=10)
+        scheduler = ShowScheduler(
+            _fake_tts(0, calls), reservoir, preroll_items=2,
+            min_lead_seconds=0.2, item_seconds=0.01, script_seconds=0.01, health=health,
+        )
+        scheduler.start(switch)
+        scheduler.set_slots([Slot(time.time() + 0.3, "咖啡机", scripts=["一", "二"])])
+        await asyncio.sleep(0.5)
+
+        # Degraded midway: the scripts not rendered yet go back to the reservoir
+        health.record("tts", ok=True)
+        tts = _fake_tts(0, calls)
+
+        async def failing_after_first(text):
+            result = await tts(text)
+            health.record("tts", ok=False)
+            return result
+
+        scheduler.synthesize = failing_after_first
+        items = await scheduler.prerender(Slot(time.time(), "扫地机器人", scripts=["甲", "乙", "丙"]))
+        scheduler.stop()
+        return items, [script["text"] for script in await reservoir.take("扫地机器人", 2)]
+
+    items, left = asyncio.run(run())
+    assert switches == [("咖啡机", [])] and calls[0][0] == "甲", (switches, calls)
+    print("   ✅ Slot switched on time without pre-rendering while degraded")
+    assert [item.text for item in items] == ["甲"] and left == ["乙", "丙"], ([item.text for item in items], left)
+    print("   ✅ Pre-render stopped when upstream degraded, unrendered scripts kept")
+
+
+def test_scheduled_switch_has_no_gap():
+    """Test that pre-rendered items are queued right after a scheduled topic change."""
+    print("\n" + "="*60)
+    print("🧪 Testing Scheduled Switch in the Playlist")
+    print("="*60)
+
+    from fastapi.testclient import TestClient
+    import main
+    from state import global_state, AudioItem
+
+    original_job = main._start_stream_job
+
+    async def idle_job(job):
+        await global_state.add_to_playlist(item("生成", job.epoch))
+        await asyncio.sleep(0.05)
+
+    def item(text, epoch=None):
+        return AudioItem(text=text, audio_data=b"\x00\x00" * 2400, visemes=[], duration_ms=100, created_at=None, epoch=epoch)
+
+    async def run():
+        await global_state.clear_playlist()
+        await global_state.switch_topic("旧话题")
+        await global_state.add_batch_to_playlist([item("旧1", global_state.epoch), item("旧2", global_state.epoch)])
+        await main.start_scheduled_slot(Slot(time.time(), "新话题"), [item("新1"), item("新2")])
+        await asyncio.sleep(0.01)
+        first = [(queued.text, queued.epoch) for queued in global_state.playlist]
+        # Same topic: coalesces into the running job, whose item is already queued
+        await main.start_scheduled_slot(Slot(time.time(), "新话题 "), [item("再1")])
+        again = [queued.text for queued in global_state.playlist]
+        stale = await global_state.add_epoch_opening([item("过期")], global_state.epoch - 1)
+        return first, again, stale, global_state.epoch
+
+    main._start_stream_job = idle_job
+    try:
+        queued, again, stale, epoch = asyncio.run(run())
+        with TestClient(main.app) as client:
+            response = client.put("/api/schedule", json={"slots": [
+                {"start": "2099-01-01T20:00:00", "topic": "咖啡机", "scripts": ["第一句"]},
+            ]})
+            schedule = client.get("/api/schedule").json()
+            rejected = client.put("/api/schedule", json={"slots": [{"start": "2099-01-01T20:00:00", "topic": " "}]})
+            cleared = client.delete("/api/schedule").json()
+    finally:
+        main._start_stream_job = original_job
+        main.show_scheduler.set_slots([])
+        asyncio.run(global_state.set_streaming(False))
+        asyncio.run(global_state.clear_playlist())
+
+    assert queued == [("新1", epoch), ("新2", epoch), ("生成", epoch)], queued
+    assert again == ["再1", "新1", "新2", "生成"], again
+    assert stale is False
+    print("   ✅ Old topic dropped, pre-rendered items queued first under the new epoch")
+    assert response.status_code == 200 and schedule["slots"] == [
+        {"start": "2099-01-01T20:00:00", "topic": "咖啡机", "scripts": 1}
+    ], schedule
+    assert rejected.status_code == 422 and cleared["slots"] == []
+    print("   ✅ Calendar set, listed, validated and cleared over the API")
+
+
+if __name__ == "__main__":
+    try:
+        test_lead_time_tracks_throughput()
+        test_switch_at_slot_start_with_items_ready()
+        test_prerender_waits_out_degraded_upstream()
+        test_scheduled_switch_has_no_gap()
+        print("\n✅ Schedule test passed!")
+        sys.exit(0)
+    except Exception as e:
+        print(f"\n❌ Schedule test failed: {e}")
+        import traceback
+        traceback.print_exc()
+        sys.exit(1)
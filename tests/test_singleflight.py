@@ -0,0 +1,152 @@
+"""Test single-flight coalescing of generation and synthesis calls."""
+import sys
+import asyncio
+from pathlib import Path
+
+# Add parent directory to path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from singleflight import SingleFlight
+from jobs import JobManager
+from metrics import metrics
+
+
+def _counts(group: str):
+    return (
+        metrics.singleflight_calls.get(group=group, result="leader"),
+        metrics.singleflight_calls.get(group=group, result="coalesced"),
+    )
+
+
+def test_concurrent_callers_share_one_call():
+    """Test that concurrent callers with the same key share one call and its outcome."""
+    print("\n" + "="*60)
+    print("🧪 Testing Single-Flight Calls")
+    print("="*60)
+
+    calls = []
+
+    async def synthesize(text):
+        calls.append(text)
+        await asyncio.sleep(0.05)
+        if text == "坏":
+            raise ValueError("upstream down")
+        return {"text": text}
+
+    async def run():
+        flight = SingleFlight("test_calls")
+        results = await asyncio.gather(
+            *(flight.do(("咖啡机", 1, "一"), lambda: synthesize("一")) for _ in range(5)),
+            flight.do(("咖啡机", 2, "一"), lambda: synthesize("一")),
+        )
+        errors = await asyncio.gather(
+            *(flight.do("坏", lambda: synthesize("坏")) for _ in range(3)), return_exceptions=True,
+        )
+        again = await flight.do(("咖啡机", 1, "一"), lambda: synthesize("一"))
+        return results, errors, again
+
+    before = _counts("test_calls")
+    results, errors, again = asyncio.run(run())
+    leaders, coalesced = (int(after - start) for after, start in zip(_counts("test_calls"), before))
+    assert calls == ["一", "一", "坏", "一"], calls
+    assert all(result is results[0] for result in results[:5]) and results[5] is not results[0]
+    assert all(isinstance(error, ValueError) for error in errors), errors
+    assert (leaders, coalesced) == (4, 6), (leaders, coalesced)
+    print(f"   ✅ {leaders + coalesced} calls made {len(calls)} upstream calls ({coalesced} coalesced)")
+    print("   ✅ Errors shared with every waiter, finished calls not reused")
+
+
+def test_cancellation_of_waiters():
+    """Test that the shared call survives one caller leaving and stops when all leave."""
+    print("\n" + "="*60)
+    print("🧪 Testing Single-Flight Cancellation")
+    print("="*60)
+
+    async def slow():
+        await asyncio.sleep(0.1)
+        return "done"
+
+    async def run():
+        flight = SingleFlight("test_cancel")
+        first = asyncio.create_task(flight.do("key", slow))
+        second = asyncio.create_task(flight.do("key", slow))
+        await asyncio.sleep(0.01)
+        shared = flight.in_flight("key")
+        first.cancel()
+        result = await second
+
+        third = asyncio.create_task(flight.do("other", slow))
+        await asyncio.sleep(0.01)
+        orphan = flight.in_flight("other")
+        third.cancel()
+        await asyncio.gather(third, return_exceptions=True)
+        await asyncio.sleep(0)
+        return first.cancelled(), shared.done(), result, orphan.cancelled()
+
+    first_cancelled, shared_done, result, orphan_cancelled = asyncio.run(run())
+    assert first_cancelled and shared_done and result == "done"
+    assert orphan_cancelled, "The last waiter leaving cancels the call"
+    print("   ✅ Call kept for remaining waiters, cancelled when the last one left")
+
+
+def test_jobs_and_refills_coalesce():
+    """Test that repeated starts and auto-refills for a topic epoch share one job."""
+    print("\n" + "="*60)
+    print("🧪 Testing Coalesced Generation Jobs")
+    print("="*60)
+
+    async def runner(job):
+        await asyncio.sleep(0.05)
+        job.items_enqueued = 2
+
+    async def run_manager():
+        manager = JobManager()
+        first = manager.start("咖啡机", runner, epoch=1, flight_key=("咖啡机", 1))
+        repeated = manager.start("咖啡机", runner, epoch=1, flight_key=("咖啡机", 1))
+        new_epoch = manager.start("咖啡机", runner, epoch=2, flight_key=("咖啡机", 2))
+        await asyncio.gather(first.task, new_epoch.task)
+        after = manager.start("咖啡机", runner, epoch=1, flight_key=("咖啡机", 1))
+        await after.task
+        return first, repeated, new_epoch, after, len(manager.jobs)
+
+    first, repeated, new_epoch, after, job_count = asyncio.run(run_manager())
+    assert repeated is first and new_epoch is not first and after is not first
+    assert job_count == 3, job_count
+    print("   ✅ A repeated start joined the running job; a new epoch or a finished job started another")
+
+    import main
+    from state import global_state
+
+    original_job, original_pipeline = main._start_stream_job, main.run_generation_pipeline
+    main._start_stream_job = main.run_generation_pipeline = runner
+
+    async def run_api():
+        await global_state.switch_topic("旧话题")
+        started = [await main.start_stream("咖啡机") for _ in range(3)]
+        refills = await asyncio.gather(main.auto_refill_playlist(), main.auto_refill_playlist())
+        return started, refills
+
+    before = _counts("jobs")
+    try:
+        started, refills = asyncio.run(run_api())
+    finally:
+        main._start_stream_job, main.run_generation_pipeline = original_job, original_pipeline
+        asyncio.run(global_state.set_streaming(False))
+    leaders, coalesced = (int(after - start) for after, start in zip(_counts("jobs"), before))
+    assert len({response["job_id"] for response in started}) == 1, started
+    assert refills == [True, True] and (leaders, coalesced) == (1, 4), (refills, leaders, coalesced)
+    print(f"   ✅ 3 start_stream calls and 2 refills ran 1 job ({coalesced} coalesced)")
+
+
+if __name__ == "__main__":
+    try:
+        test_concurrent_callers_share_one_call()
+        test_cancellation_of_waiters()
+        test_jobs_and_refills_coalesce()
+        print("\n✅ Single-flight test passed!")
+        sys.exit(0)
+    except Exception as e:
+        print(f"\n❌ Single-flight test failed: {e}")
+        import traceback
+        traceback.print_exc()
+        sys.exit(1)
@@ -0,0 +1,147 @@
+"""Test per-item lifecycle tracing."""
+import os
+import sys
+import json
+import asyncio
+import tempfile
+from pathlib import Path
+from types import SimpleNamespace
+
+# Add parent directory to path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from tracing import Tracer, tracer
+
+
+def _read_spans(path):
+    """Flatten all spans from an OTLP/JSON lines file."""
+    spans = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            request = json.loads(line)
+            for resource_spans in request["resourceSpans"]:
+                for scope_spans in resource_spans["scopeSpans"]:
+                    spans.extend(scope_spans["spans"])
+    return spans
+
+
+def test_sampling():
+    """Test that sampling is deterministic per trace id and respects the rate."""
+    print("\n" + "="*60)
+    print("🧪 Testing Trace Sampling")
+    print("="*60)
+
+    trace_ids = [Tracer.new_trace_id() for _ in range(2000)]
+
+    disabled = Tracer(sample_rate=0.0)
+    assert not any(disabled.is_sampled(t) for t in trace_ids)
+    assert disabled.start_span("noop", trace_id=trace_ids[0]).is_recording is False
+
+    full = Tracer(sample_rate=1.0)
+    assert all(full.is_sampled(t) for t in trace_ids)
+
+    half = Tracer(sample_rate=0.5)
+    sampled = [t for t in trace_ids if half.is_sampled(t)]
+    assert 800 < len(sampled) < 1200, f"Expected ~1000 sampled, got {len(sampled)}"
+    assert all(half.is_sampled(t) for t in sampled), "Sampling must be deterministic"
+    print(f"   ✅ Sampled {len(sampled)}/2000 traces at rate 0.5")
+
+
+def test_span_export():
+    """Test nested spans are exported in the OTLP/JSON shape."""
+    print("\n" + "="*60)
+    print("🧪 Testing Span Export")
+    print("="*60)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "traces.jsonl")
+        local = Tracer(export_path=path, sample_rate=1.0)
+        trace_id = local.new_trace_id()
+
+        with local.trace(trace_id):
+            with local.span("outer", attributes={"topic": "咖啡机"}) as outer:
+                with local.span("inner") as inner:
+                    inner.set_attribute("count", 3)
+        local.record_span("event", trace_id, 1000)
+        local.shutdown()
+
+        spans = {span["name"]: span for span in _read_spans(path)}
+        assert set(spans) == {"outer", "inner", "event"}, spans.keys()
+        assert spans["inner"]["parentSpanId"] == outer.span_id
+        assert "parentSpanId" not in spans["outer"]
+        assert all(span["traceId"] == trace_id for span in spans.values())
+        assert {"key": "count", "value": {"intValue": "3"}} in spans["inner"]["attributes"]
+        assert {"key": "topic", "value": {"stringValue": "咖啡机"}} in spans["outer"]["attributes"]
+        assert spans["event"]["startTimeUnixNano"] == spans["event"]["endTimeUnixNano"] == "1000"
+    print("   ✅ Spans exported with parent links and attributes")
+
+
+def test_item_lifecycle_spans():
+    """Test TTS, enqueue and dequeue spans land on the item's trace."""
+    print("\n" + "="*60)
+    print("🧪 Testing Item Lifecycle Spans")
+    print("="*60)
+
+    import ai_service as ai_service_module
+    from ai_service import ai_service
+    from state import GlobalState, AudioItem
+
+    fake_response = SimpleNamespace(status_code=200, get_audio_data=lambda: b"\x00\x01" * 2400)
+    original_call = ai_service_module.dashscope.MultiModalConversation.call
+    original_path, original_rate = tracer.export_path, tracer.sample_rate
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "traces.jsonl")
+        ai_service_module.dashscope.MultiModalConversation.call = lambda **kwargs: fake_response
+        tracer.export_path = path
+        tracer.set_sample_rate(1.0)
+        try:
+            async def run():
+                state = GlobalState()
+                trace_id = tracer.new_trace_id()
+                with tracer.trace(trace_id):
+                    result = await ai_service.text_to_speech("测试文本")
+                item = AudioItem(
+                    text="测试文本",
+                    audio_data=result["audio_data"],
+                    visemes=result["visemes"],
+                    duration_ms=result["duration_ms"],
+                    created_at=None,
+                    trace_id=trace_id,
+                )
+                await state.add_to_playlist(item)
+                await state.pop_from_playlist()
+                return trace_id
+
+            trace_id = asyncio.run(run())
+            tracer.shutdown()
+        finally:
+            ai_service_module.dashscope.MultiModalConversation.call = original_call
+            tracer.export_path = original_path
+            tracer.set_sample_rate(original_rate)
+
+        spans = [span for span in _read_spans(path) if span["traceId"] == trace_id]
+        names = [span["name"] for span in spans]
+        for expected in ("text_to_speech", "tts.attempt", "playlist.enqueue", "playlist.dequeue"):
+            assert expected in names, f"Missing span {expected}: {names}"
+
+        tts_span = next(span for span in spans if span["name"] == "text_to_speech")
+        attempt = next(span for span in spans if span["name"] == "tts.attempt")
+        assert attempt["parentSpanId"] == tts_span["spanId"]
+        endpoint = {"key": "tts.endpoint", "value": {"stringValue": "sdk:MultiModalConversation"}}
+        assert endpoint in tts_span["attributes"], tts_span["attributes"]
+    print(f"   ✅ Recorded spans: {names}")
+
+
+if __name__ == "__main__":
+    try:
+        test_sampling()
+        test_span_export()
+        test_item_lifecycle_spans()
+        print("\n✅ Tracing test passed!")
+        sys.exit(0)
+    except Exception as e:
+        print(f"\n❌ Tracing test failed: {e}")
+        import traceback
+        traceback.print_exc()
+        sys.exit(1)
@@ -0,0 +1,356 @@
+"""Per-item lifecycle tracing exported as OpenTelemetry-compatible JSON lines.
+
+Each ``AudioItem`` carries a trace id. Spans recorded along the item's
+lifecycle (script generation, TTS attempts, enqueue, dequeue, send) are
+written by a background thread to a local file, one OTLP/JSON
+``ExportTraceServiceRequest`` per line, so the file can be loaded by the
+OpenTelemetry Collector ``otlpjsonfile`` receiver or inspected with ``jq``.
+
+Sampling is decided from the trace id itself (like OpenTelemetry's
+``TraceIdRatioBased`` sampler), so every component reaches the same
+decision for an item without sharing state. Unsampled spans are no-ops.
+"""
+from typing import Any, Dict, List, Optional
+from contextlib import contextmanager
+from contextvars import ContextVar
+from loguru import logger
+import json
+import os
+import queue
+import threading
+import time
+
+from config import settings
+
+
+# Span status codes (opentelemetry.proto.trace.v1.Status.StatusCode)
+STATUS_UNSET = 0
+STATUS_OK = 1
+STATUS_ERROR = 2
+
+# Span kinds (opentelemetry.proto.trace.v1.Span.SpanKind)
+KIND_INTERNAL = 1
+KIND_SERVER = 2
+KIND_CLIENT = 3
+KIND_PRODUCER = 4
+KIND_CONSUMER = 5
+
+
+def _attribute_value(value: Any) -> Dict:
+    """Encode a Python value as an OTLP/JSON AnyValue."""
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}  # int64 is a string in proto3 JSON
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def _encode_attributes(attributes: Dict[str, Any]) -> List[Dict]:
+    return [{"key": key, "value": _attribute_value(value)} for key, value in attributes.items()]
+
+
+class Span:
+    """A single timed operation within a trace."""
+
+    __slots__ = (
+        "tracer", "trace_id", "span_id", "parent_span_id", "name", "kind",
+        "start_ns", "end_ns", "attributes", "status_code", "status_message", "links",
+    )
+
+    def __init__(
+        self,
+        tracer: "Tracer",
+        name: str,
+        trace_id: str,
+        parent_span_id: Optional[str] = None,
+        kind: int = KIND_INTERNAL,
+        attributes: Optional[Dict[str, Any]] = None,
+        start_ns: Optional[int] = None,
+    ):
+        self.tracer = tracer
+        self.trace_id = trace_id
+        self.span_id = os.urandom(8).hex()
+        self.parent_span_id = parent_span_id
+        self.name = name
+        self.kind = kind
+        self.start_ns = start_ns if start_ns is not None else time.time_ns()
+        self.end_ns: Optional[int] = None
+        self.attributes: Dict[str, Any] = dict(attributes) if attributes else {}
+        self.status_code = STATUS_UNSET
+        self.status_message = ""
+        self.links: List[Dict[str, str]] = []
+
+    @property
+    def is_recording(self) -> bool:
+        return True
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        self.attributes[key] = value
+
+    def add_link(self, trace_id: str, span_id: str) -> None:
+        self.links.append({"traceId": trace_id, "spanId": span_id})
+
+    def set_status(self, code: int, message: str = "") -> None:
+        self.status_code = code
+        self.status_message = message
+
+    def end(self, end_ns: Optional[int] = None) -> None:
+        """Finish the span and hand it to the exporter."""
+        if self.end_ns is not None:
+            return
+        self.end_ns = end_ns if end_ns is not None else time.time_ns()
+        self.tracer._export(self)
+
+    def to_otlp(self) -> Dict:
+        span = {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": self.kind,
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns),
+            "attributes": _encode_attributes(self.attributes),
+            "status": {"code": self.status_code},
+        }
+        if self.parent_span_id:
+            span["parentSpanId"] = self.parent_span_id
+        if self.status_message:
+            span["status"]["message"] = self.status_message
+        if self.links:
+            span["links"] = self.links
+        return span
+
+
+class _NoopSpan:
+    """Span returned for unsampled traces; every operation is a no-op."""
+
+    __slots__ = ()
+
+    trace_id = None
+    span_id = None
+
+    @property
+    def is_recording(self) -> bool:
+        return False
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        pass
+
+    def add_link(self, trace_id: str, span_id: str) -> None:
+        pass
+
+    def set_status(self, code: int, message: str = "") -> None:
+        pass
+
+    def end(self, end_ns: Optional[int] = None) -> None:
+        pass
+
+
+NOOP_SPAN = _NoopSpan()
+
+# Active (trace_id, span_id) for spans started without an explicit parent
+_current_context: ContextVar[Optional[tuple]] = ContextVar("trace_context", default=None)
+
+
+class Tracer:
+    """Creates spans and exports sampled ones to a JSON-lines file.
+
+    Args:
+        service_name: Reported as the ``service.name`` resource attribute
+        export_path: File that receives one OTLP/JSON request per line
+        sample_rate: Fraction of traces to record (0 disables tracing)
+        max_queue: Spans buffered for the exporter before new ones are dropped
+    """
+
+    def __init__(
+        self,
+        service_name: str = "ai-streamer",
+        export_path: str = "traces.jsonl",
+        sample_rate: float = 0.0,
+        max_queue: int = 10000,
+        batch_size: int = 256,
+    ):
+        self.service_name = service_name
+        self.export_path = export_path
+        self.max_queue = max_queue
+        self.batch_size = batch_size
+        self.dropped_spans = 0
+        self.set_sample_rate(sample_rate)
+        self._queue: "queue.Queue[Optional[Span]]" = queue.Queue(maxsize=max_queue)
+        self._worker: Optional[threading.Thread] = None
+        self._worker_lock = threading.Lock()
+
+    # ------------------------------------------------------------------
+    # Sampling
+    # ------------------------------------------------------------------
+
+    def set_sample_rate(self, sample_rate: float) -> None:
+        """Change the fraction of traces recorded (0.0 - 1.0)."""
+        self.sample_rate = min(max(sample_rate, 0.0), 1.0)
+        self._threshold = int(self.sample_rate * (1 << 64))
+
+    @staticmethod
+    def new_trace_id() -> str:
+        return os.urandom(16).hex()
+
+    def is_sampled(self, trace_id: Optional[str]) -> bool:
+        """Decide from the low 64 bits of the trace id whether to record it."""
+        if not trace_id or self._threshold == 0:
+            return False
+        return int(trace_id[16:], 16) < self._threshold
+
+    # ------------------------------------------------------------------
+    # Span creation
+    # ------------------------------------------------------------------
+
+    def start_span(
+        self,
+        name: str,
+        trace_id: Optional[str] = None,
+        parent: Optional[Any] = None,
+        kind: int = KIND_INTERNAL,
+        attributes: Optional[Dict[str, Any]] = None,
+        start_ns: Optional[int] = None,
+    ):
+        """Start a span; the caller must call ``end()``.
+
+        The trace is taken from ``parent``, then ``trace_id``, then the
+        active context set by ``span()`` or ``trace()``. Without any of them
+        the span is not recorded.
+        """
+        parent_span_id = None
+        if parent is not None:
+            if not parent.is_recording:
+                return NOOP_SPAN
+            trace_id, parent_span_id = parent.trace_id, parent.span_id
+        elif trace_id is None:
+            context = _current_context.get()
+            if context is None:
+                return NOOP_SPAN
+            trace_id, parent_span_id = context
+
+        if not self.is_sampled(trace_id):
+            return NOOP_SPAN
+        return Span(self, name, trace_id, parent_span_id, kind, attributes, start_ns)
+
+    @contextmanager
+    def span(
+        self,
+        name: str,
+        trace_id: Optional[str] = None,
+        parent: Optional[Any] = None,
+        kind: int = KIND_INTERNAL,
+        attributes: Optional[Dict[str, Any]] = None,
+    ):
+        """Record the block as a span and make it the active parent."""
+        span = self.start_span(name, trace_id, parent, kind, attributes)
+        token = _current_context.set((span.trace_id, span.span_id)) if span.is_recording else None
+        try:
+            yield span
+        except BaseException as e:
+            span.set_status(STATUS_ERROR, str(e))
+            raise
+        finally:
+            if token is not None:
+                _current_context.reset(token)
+            span.end()
+
+    @contextmanager
+    def trace(self, trace_id: Optional[str]):
+        """Make spans started in the block root spans of ``trace_id``."""
+        token = _current_context.set((trace_id, None) if trace_id else None)
+        try:
+            yield
+        finally:
+            _current_context.reset(token)
+
+    def record_span(
+        self,
+        name: str,
+        trace_id: Optional[str],
+        start_ns: int,
+        end_ns: Optional[int] = None,
+        kind: int = KIND_INTERNAL,
+        attributes: Optional[Dict[str, Any]] = None,
+    ) -> None:
+        """Record an already-finished span (or an instant event if no end)."""
+        if not self.is_sampled(trace_id):
+            return
+        span = Span(self, name, trace_id, None, kind, attributes, start_ns)
+        span.end(end_ns if end_ns is not None else start_ns)
+
+    # ------------------------------------------------------------------
+    # Export
+    # ------------------------------------------------------------------
+
+    def _export(self, span: Span) -> None:
+        self._ensure_worker()
+        try:
+            self._queue.put_nowait(span)
+        except queue.Full:
+            # Never block the caller; bounded memory matters more than completeness
+            self.dropped_spans += 1
+
+    def _ensure_worker(self) -> None:
+        if self._worker is not None:
+            return
+        with self._worker_lock:
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._run_worker, name="trace-exporter", daemon=True)
+                self._worker.start()
+
+    def _run_worker(self) -> None:
+        while True:
+            span = self._queue.get()
+            if span is None:
+                return
+            batch = [span]
+            stop = False
+            while len(batch) < self.batch_size:
+                try:
+                    span = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if span is None:
+                    stop = True
+                    break
+                batch.append(span)
+            self._write_batch(batch)
+            if stop:
+                return
+
+    def _write_batch(self, batch: List[Span]) -> None:
+        request = {
+            "resourceSpans": [{
+                "resource": {"attributes": _encode_attributes({"service.name": self.service_name})},
+                "scopeSpans": [{
+                    "scope": {"name": "ai_streamer.tracing"},
+                    "spans": [span.to_otlp() for span in batch],
+                }],
+            }]
+        }
+        try:
+            with open(self.export_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(request, ensure_ascii=False, separators=(",", ":")) + "\n")
+        except OSError as e:
+            logger.warning(f"⚠️ Failed to export {len(batch)} spans: {e}")
+
+    def shutdown(self, timeout: float = 5.0) -> None:
+        """Flush buffered spans and stop the exporter thread."""
+        worker = self._worker
+        if worker is None:
+            return
+        self._queue.put(None)
+        worker.join(timeout)
+        self._worker = None
+
+
+# Global tracer instance
+tracer = Tracer(
+    service_name="ai-streamer",
+    export_path=settings.trace_export_path,
+    sample_rate=settings.trace_sample_rate,
+    max_queue=settings.trace_max_queue,
+)
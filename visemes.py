@@ -0,0 +1,71 @@
+"""Compact viseme tracks for lip-sync.
+
+TTS produces visemes as a list of ``{"offset": seconds, "coefficients":
+[...]}`` dicts. Held like that, every frame costs a dict, a list and one
+boxed float per blendshape coefficient (about 2 KB for 52 coefficients).
+A ``VisemeTrack`` packs the frames into one preallocated float64 array of
+shape (frames, 1 + coefficients): column 0 is the offset in seconds, the
+rest are the coefficients (about 0.4 KB per frame, values kept exactly).
+
+Tracks convert back to the dict form only where it is sent to clients.
+"""
+from typing import Dict, Iterable, Iterator, List, Optional, Union
+
+import numpy as np
+
+
+class VisemeTrack:
+    """Viseme frames of one audio item, packed in a single array.
+
+    Args:
+        frames: Array of shape (frames, 1 + coefficients), offsets in column 0
+    """
+
+    __slots__ = ("frames",)
+
+    def __init__(self, frames: Optional[np.ndarray] = None):
+        self.frames = frames if frames is not None else np.empty((0, 1), dtype=np.float64)
+
+    @classmethod
+    def from_dicts(cls, visemes: Iterable[Dict]) -> "VisemeTrack":
+        """Pack ``{"offset", "coefficients"}`` dicts; shorter coefficient lists are zero-padded."""
+        visemes = list(visemes)
+        width = max((len(viseme["coefficients"]) for viseme in visemes), default=0)
+        frames = np.zeros((len(visemes), 1 + width), dtype=np.float64)
+        for row, viseme in zip(frames, visemes):
+            coefficients = viseme["coefficients"]
+            row[0] = viseme["offset"]
+            row[1:1 + len(coefficients)] = coefficients
+        return cls(frames)
+
+    @classmethod
+    def coerce(cls, visemes: Union["VisemeTrack", Iterable[Dict], None]) -> "VisemeTrack":
+        """A track as-is, or one packed from viseme dicts."""
+        if isinstance(visemes, cls):
+            return visemes
+        return cls.from_dicts(visemes or ())
+
+    def __len__(self) -> int:
+        return len(self.frames)
+
+    def __iter__(self) -> Iterator[Dict]:
+        return iter(self.to_dicts())
+
+    @property
+    def nbytes(self) -> int:
+        return self.frames.nbytes
+
+    def to_dicts(self) -> List[Dict]:
+        """The frames as ``{"offset", "coefficients"}`` dicts (the wire format)."""
+        return [{"offset": row[0], "coefficients": row[1:]} for row in self.frames.tolist()]
+
+    def sliced(self, offset: float) -> "VisemeTrack":
+        """Frames from ``offset`` seconds on, re-timed to start at 0.
+
+        The frame active at ``offset`` is kept (moved to 0) so the mouth
+        shape is right from the first sample.
+        """
+        start = int(np.searchsorted(self.frames[:, 0], offset, side="right"))
+        frames = self.frames[max(start - 1, 0):].copy()
+        frames[:, 0] = np.maximum(frames[:, 0] - offset, 0.0)
+        return VisemeTrack(frames)